@@ -29,15 +29,22 @@ class BlackboardClient:
 
         self.depi_session_id = response.sessionId
 
+    def blackboard_listing(self):
+        resources = []
+        links = []
+        for resp in self.stub.GetBlackboardResourcesAsStream(
+                depi_pb2.GetBlackboardResourcesRequest(
+                    sessionId=self.depi_session_id)):
+            if not resp.ok:
+                raise Exception(resp.msg)
+            resources.extend(resp.resources)
+            links.extend(resp.links)
+        return resources, links
+
     def do_res(self, args):
-        resp = self.stub.GetBlackboardResources(
-            depi_pb2.GetBlackboardResourcesRequest(
-                sessionId=self.depi_session_id))
-        
-        rrs = resp.resources
+        rrs, _ = self.blackboard_listing()
         allRes = False
         if args == "-a":
-            rrs = resp.depiResources
             allRes = True
         else:
             self.currResources = []
@@ -68,15 +75,10 @@ class BlackboardClient:
                         item.name, item.id, item.URL))
             
     def do_links(self, args):
-        resp = self.stub.GetBlackboardResources(
-            depi_pb2.GetBlackboardResourcesRequest(
-                sessionId=self.depi_session_id))
-        
+        _, rls = self.blackboard_listing()
         allLinks = False
-        rls = resp.links
         if args == "-a":
             allLinks = True
-            rls = resp.depiLinks
         else:
             self.currLinks = []
 
@@ -0,0 +1,110 @@
+import depi_pb2
+
+# Decodes the compact form of the Depi listing responses, see CompactListing in depi.proto.
+# CompactDepiStub wraps a DepiStub, asks for the compact form on the listing calls and hands
+# back the same responses the plain stub would, so code written against DepiStub can use it
+# unchanged.
+
+# method -> (resource field, link field) of its responses
+UNARY_LISTINGS = {
+    "GetResources": ("resources", None),
+    "GetLinks": (None, "resourceLinks"),
+    "GetDirtyLinks": ("resources", "links"),
+    "GetDependencyGraph": (None, "links"),
+    "GetBlackboardResources": ("resources", "links"),
+}
+
+# streams whose messages each carry a chunk of the listing
+CHUNKED_STREAM_LISTINGS = {
+    "GetBlackboardResourcesAsStream": ("resources", "links"),
+}
+
+STREAM_LISTINGS = {
+    "GetResourcesAsStream": ("resource", None),
+    "GetLinksAsStream": (None, "resourceLink"),
+    "GetAllLinksAsStream": (None, "resourceLink"),
+    "GetDirtyLinksAsStream": ("resource", "link"),
+}
+
+
+def expand_listing(listing: depi_pb2.CompactListing) -> tuple[list[depi_pb2.Resource], list[depi_pb2.ResourceLink]]:
+    resources = []
+    for res in listing.resources:
+        group = listing.groups[res.group]
+        resources.append(depi_pb2.Resource(toolId=group.toolId, resourceGroupName=group.name,
+                                           resourceGroupURL=group.URL, resourceGroupVersion=group.version,
+                                           name=res.name, URL=res.URL, id=res.id, deleted=res.deleted))
+
+    links = [depi_pb2.ResourceLink(fromRes=resources[link.fromRes], toRes=resources[link.toRes],
+                                   deleted=link.deleted, dirty=link.dirty, lastCleanVersion=link.lastCleanVersion,
+                                   inferredDirtiness=[depi_pb2.InferredDirtiness(
+                                       resource=resources[inf.resource], lastCleanVersion=inf.lastCleanVersion)
+                                       for inf in link.inferredDirtiness])
+             for link in listing.links]
+    return [resources[i] for i in listing.resourceList], links
+
+
+def expand_response(response, resourceField=None, linkField=None):
+    if not response.HasField("compact"):
+        return response
+    resources, links = expand_listing(response.compact)
+    response.ClearField("compact")
+    if resourceField is not None:
+        getattr(response, resourceField).extend(resources)
+    if linkField is not None:
+        getattr(response, linkField).extend(links)
+    return response
+
+
+def expand_stream(responses, resourceField=None, linkField=None):
+    for response in responses:
+        if not response.HasField("compact"):
+            yield response
+            continue
+        resources, links = expand_listing(response.compact)
+        count = max(len(resources), len(links))
+        for i in range(count):
+            item = type(response)(ok=True, msg="")
+            if resourceField is not None:
+                getattr(item, resourceField).CopyFrom(resources[i])
+            if linkField is not None:
+                getattr(item, linkField).CopyFrom(links[i])
+            yield item
+
+
+class CompactDepiStub:
+    def __init__(self, stub, compress=False):
+        self.stub = stub
+        self.compress = compress
+
+    def compactRequest(self, request):
+        compactRequest = type(request)()
+        compactRequest.CopyFrom(request)
+        compactRequest.compact = True
+        compactRequest.compress = self.compress
+        return compactRequest
+
+    def __getattr__(self, name):
+        method = getattr(self.stub, name)
+        if name in UNARY_LISTINGS:
+            resourceField, linkField = UNARY_LISTINGS[name]
+
+            def call(request, *args, **kwargs):
+                return expand_response(method(self.compactRequest(request), *args, **kwargs),
+                                       resourceField, linkField)
+            return call
+        if name in CHUNKED_STREAM_LISTINGS:
+            resourceField, linkField = CHUNKED_STREAM_LISTINGS[name]
+
+            def call(request, *args, **kwargs):
+                return (expand_response(response, resourceField, linkField)
+                        for response in method(self.compactRequest(request), *args, **kwargs))
+            return call
+        if name in STREAM_LISTINGS:
+            resourceField, linkField = STREAM_LISTINGS[name]
+
+            def call(request, *args, **kwargs):
+                return expand_stream(method(self.compactRequest(request), *args, **kwargs),
+                                     resourceField, linkField)
+            return call
+        return method
@@ -12,6 +12,8 @@ import grpc
 import depi_pb2
 import depi_pb2_grpc
 
+from depi_client.compact_stub import CompactDepiStub
+
 
 def cmdloop(self, intro=None):
     """Repeatedly issue a prompt, accept input, parse an initial prefix
@@ -557,13 +559,25 @@ class DepiCli(cmd.Cmd):
                                         toRes=depi_pb2.ResourceRef(toolId=link.toRes.toolId,
                                                                    resourceGroupURL=link.toRes.resourceGroupURL,
                                                                    URL=link.toRes.URL))
+    def blackboard_links(self, args):
+        # only the links of the resource group the arguments name, when they name one
+        toolId = args[0] if len(args) > 0 else ""
+        resourceGroupURL = args[1] if len(args) > 1 else ""
+        links = []
+        for response in self.stub.GetBlackboardResourcesAsStream(depi_pb2.GetBlackboardResourcesRequest(
+                sessionId=self.session, toolId=toolId, resourceGroupURL=resourceGroupURL)):
+            if not response.ok:
+                print("Unable to fetch links: {}".format(response.msg))
+                return None
+            links.extend(response.links)
+        return links
+
     def do_clean(self, arg):
         'Marks a link as clean: clean (propagate | no-propagate) from-toolId from-rgURL from-resURL to-toolId to-rgURL to-resURL'
         args = arg.split()
 
-        response = self.stub.GetBlackboardResources(depi_pb2.GetBlackboardResourcesRequest(sessionId=self.session))
-        if not response.ok:
-            print("Unable to fetch links: {}".format(response.msg))
+        bbLinks = self.blackboard_links(args[1:])
+        if bbLinks is None:
             return
 
         propagate = args[0] == "propagate"
@@ -571,31 +585,31 @@ class DepiCli(cmd.Cmd):
         args = args[1:]
         links = []
         if len(args) < 1:
-            for link in response.depiLinks:
+            for link in bbLinks:
                 links.append(self.makeLinkRef(link))
         elif len(args) < 2:
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0]:
                     links.append(self.makeLinkRef(link))
         elif len(args) < 3:
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1]:
                     links.append(self.makeLinkRef(link))
         elif len(args) < 4:
             pattern = re.compile(self.escape_re(args[2]))
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                         pattern.fullmatch(link.fromRes.URL) is not None:
                     links.append(self.makeLinkRef(link))
         elif len(args) < 5:
             pattern = re.compile(self.escape_re(args[2]))
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                         pattern.fullmatch(link.fromRes.URL) is not None and link.toRes.toolId == args[3]:
                     links.append(self.makeLinkRef(link))
         elif len(args) < 6:
             pattern = re.compile(self.escape_re(args[2]))
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                         pattern.fullmatch(link.fromRes.URL) is not None and link.toRes.toolId == args[3] and \
                         link.toRes.resourceGroupURL == args[4]:
@@ -603,7 +617,7 @@ class DepiCli(cmd.Cmd):
         else:
             pattern = re.compile(self.escape_re(args[2]))
             pattern2 = re.compile(self.escape_re(args[5]))
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                         pattern.fullmatch(link.fromRes.URL) is not None and link.toRes.toolId == args[3] and \
                         link.toRes.resourceGroupURL == args[4] and pattern2.fullmatch(link.toRes.URL) is not None:
@@ -985,20 +999,19 @@ class DepiCli(cmd.Cmd):
             return []
 
     def link_completion(self, args, complete):
-        response = self.stub.GetBlackboardResources(depi_pb2.GetBlackboardResourcesRequest(sessionId=self.session))
-        if not response.ok:
-            print("Unable to fetch links: {}".format(response.msg))
+        bbLinks = self.blackboard_links(args)
+        if bbLinks is None:
             return
 
         if len(args) == 0:
             completions = set()
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId.startswith(complete):
                     completions.add(link.fromRes.toolId)
             return list(completions)
         elif len(args) == 1:
             completions = set()
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL.startswith(complete):
                     completions.add(link.fromRes.resourceGroupURL)
             return list(completions)
@@ -1006,7 +1019,7 @@ class DepiCli(cmd.Cmd):
             completions = set()
             if len(complete) == 0:
                 completions.add(".*")
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                    link.fromRes.URL.startswith(complete):
                     completions.add(link.fromRes.URL)
@@ -1014,7 +1027,7 @@ class DepiCli(cmd.Cmd):
         elif len(args) == 3:
             completions = set()
             pattern = re.compile(args[2])
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                    pattern.fullmatch(link.fromRes.URL) is not None and link.toRes.toolId.startswith(complete):
                     completions.add(link.toRes.toolId)
@@ -1022,7 +1035,7 @@ class DepiCli(cmd.Cmd):
         elif len(args) == 4:
             completions = set()
             pattern = re.compile(args[2])
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                         pattern.fullmatch(link.fromRes.URL) is not None and link.toRes.toolId == args[3] and \
                         link.toRes.resourceGroupURL.startswith(complete):
@@ -1033,7 +1046,7 @@ class DepiCli(cmd.Cmd):
             if len(complete) == 0:
                 completions.add(".*")
             pattern = re.compile(args[2])
-            for link in response.depiLinks:
+            for link in bbLinks:
                 if link.fromRes.toolId == args[0] and link.fromRes.resourceGroupURL == args[1] and \
                         pattern.fullmatch(link.fromRes.URL) is not None and link.toRes.toolId == args[3] and \
                         link.toRes.resourceGroupURL == args[4] and link.toRes.URL.startswith(complete):
@@ -1051,88 +1064,62 @@ class DepiCli(cmd.Cmd):
             print("No tools field found in json file")
             return
 
-        resp = self.stub.ClearBlackboard(depi_pb2.ClearBlackboardRequest(sessionId=self.session))
-        if not resp.ok:
-            print("Error clearing the blackboard: {}".format(resp.msg))
-            return
-
-        tools = depi_json["tools"]
-        resources_to_add = []
-        for tool_id in tools:
-            tool = tools[tool_id]
-            for rg_url in tool:
-                rg = tool[rg_url]
-
-                for res in rg["resources"]:
-                    if res["deleted"]:
-                        continue
-                    resources_to_add.append(depi_pb2.Resource(toolId=tool_id,
-                                      resourceGroupURL=rg_url,
-                                      resourceGroupVersion=rg["version"],
-                                      resourceGroupName=rg["name"],
-                                      URL=res["URL"],
-                                      name=res["name"],
-                                      id=res["id"]))
-
-                    if len(resources_to_add) > 100:
-                        req = depi_pb2.AddResourcesToBlackboardRequest(sessionId=self.session,
-                                                    resources = resources_to_add)
-                        resp = self.stub.AddResourcesToBlackboard(req)
-                        if not resp.ok:
-                            print("Error adding resource group: {}".format(resp.msg))
-                            return
-                        resources_to_add = []
-        if len(resources_to_add) > 0:
-            req = depi_pb2.AddResourcesToBlackboardRequest(sessionId=self.session,
-                                                           resources=resources_to_add)
-            resp = self.stub.AddResourcesToBlackboard(req)
-            if not resp.ok:
-                print("Error adding resource group: {}".format(resp.msg))
-                return
-
-        if not "links" in depi_json:
-            print("No links field found in json file")
-            return
-
-        links = depi_json["links"]
-
-        links_to_add = []
-        for link in links:
-            if link["deleted"]:
-                continue
-            fromRes = link["fromRes"]
-            toRes = link["toRes"]
-            links_to_add.append(depi_pb2.ResourceLinkRef(
-                                    fromRes=depi_pb2.ResourceRef(toolId=fromRes["toolId"],
-                                                                 resourceGroupURL=fromRes["resourceGroupURL"],
-                                                                 URL=fromRes["URL"]),
-                                    toRes=depi_pb2.ResourceRef(toolId=toRes["toolId"],
-                                                               resourceGroupURL=toRes["resourceGroupURL"],
-                                                               URL=toRes["URL"])))
-
-            if len(links_to_add) > 100:
-                req = depi_pb2.LinkBlackboardResourcesRequest(sessionId=self.session,
-                                                      links=links_to_add)
-                resp = self.stub.LinkBlackboardResources(req)
-                if not resp.ok:
-                    print("Error linking resources: {}".format(resp.msg))
-                    return
-                links_to_add = []
+        def import_requests():
+            # BulkImport takes any number of records, they are only split to keep each message small
+            resources_to_add = []
+            tools = depi_json["tools"]
+            for tool_id in tools:
+                tool = tools[tool_id]
+                for rg_url in tool:
+                    rg = tool[rg_url]
+
+                    for res in rg["resources"]:
+                        if res["deleted"]:
+                            continue
+                        resources_to_add.append(depi_pb2.Resource(toolId=tool_id,
+                                                                  resourceGroupURL=rg_url,
+                                                                  resourceGroupVersion=rg["version"],
+                                                                  resourceGroupName=rg["name"],
+                                                                  URL=res["URL"],
+                                                                  name=res["name"],
+                                                                  id=res["id"]))
+                        if len(resources_to_add) >= 1000:
+                            yield depi_pb2.BulkImportRequest(sessionId=self.session, resources=resources_to_add)
+                            resources_to_add = []
+            if len(resources_to_add) > 0:
+                yield depi_pb2.BulkImportRequest(sessionId=self.session, resources=resources_to_add)
+
+            links_to_add = []
+            for link in depi_json.get("links", []):
+                if link["deleted"]:
+                    continue
+                fromRes = link["fromRes"]
+                toRes = link["toRes"]
+                links_to_add.append(depi_pb2.ResourceLinkRef(
+                                        fromRes=depi_pb2.ResourceRef(toolId=fromRes["toolId"],
+                                                                     resourceGroupURL=fromRes["resourceGroupURL"],
+                                                                     URL=fromRes["URL"]),
+                                        toRes=depi_pb2.ResourceRef(toolId=toRes["toolId"],
+                                                                   resourceGroupURL=toRes["resourceGroupURL"],
+                                                                   URL=toRes["URL"])))
+                if len(links_to_add) >= 1000:
+                    yield depi_pb2.BulkImportRequest(sessionId=self.session, links=links_to_add)
+                    links_to_add = []
+            if len(links_to_add) > 0:
+                yield depi_pb2.BulkImportRequest(sessionId=self.session, links=links_to_add)
 
-        if len(links_to_add) > 0:
-            req = depi_pb2.LinkBlackboardResourcesRequest(sessionId=self.session,
-                                                          links=links_to_add)
-            resp = self.stub.LinkBlackboardResources(req)
-            if not resp.ok:
-                print("Error linking resources: {}".format(resp.msg))
+        for progress in self.stub.BulkImport(import_requests()):
+            if not progress.ok:
+                print("Error importing {}: {}".format(filename, progress.msg))
                 return
-        links_to_add = []
-
-        resp = self.stub.SaveBlackboard(depi_pb2.SaveBlackboardRequest(sessionId=self.session))
-        if not resp.ok:
-            print("Error saving blackboard: {}".format(resp.msg))
-            return
-
+            if progress.done:
+                print("Imported {} resources and {} links".format(progress.resourcesApplied, progress.linksApplied))
+            elif progress.resourcesApplied > 0 or progress.linksApplied > 0:
+                print("Applied {} of {} resources and {} of {} links".format(
+                    progress.resourcesApplied, progress.resourcesReceived,
+                    progress.linksApplied, progress.linksReceived))
+            else:
+                print("Sent {} resources and {} links".format(progress.resourcesReceived, progress.linksReceived))
 
 def get_config_item(config, field, default):
     if field in config:
@@ -1184,6 +1171,12 @@ def run():
                         default=get_config_item(config, "ssl_target_name", ""))
     parser.add_argument("-script", "--script", dest="script", default="")
     parser.add_argument("-json", "--json", dest="json", default="")
+    parser.add_argument("--compact", dest="compact", action="store_true",
+                        default=get_config_item(config, "compact", False),
+                        help="Fetch listings in the compact encoding")
+    parser.add_argument("--compress", dest="compress", action="store_true",
+                        default=get_config_item(config, "compress", False),
+                        help="Ask the server to gzip compact listings")
 
     args = parser.parse_args()
 
@@ -1204,6 +1197,8 @@ def run():
 
     with open_channel(host, port, use_ssl, cert, options) as channel:
         stub = depi_pb2_grpc.DepiStub(channel)
+        if args.compact:
+            stub = CompactDepiStub(stub, args.compress)
         if len(token) > 0:
             response = stub.LoginWithToken(depi_pb2.LoginWithTokenRequest(loginToken=token))
         else:
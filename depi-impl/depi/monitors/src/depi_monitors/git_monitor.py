@@ -226,14 +226,18 @@ class GitMonitor:
         else:
             raise NotImplemented(f'Unsupported repository type {self.tool_id}')
 
-        for resource_group_update, branch in resource_group_updates:
-            resp = depi_client.stub.UpdateResourceGroup(depi_pb2.UpdateResourceGroupRequest(
-                sessionId=depi_client.session_id,
-                resourceGroup=resource_group_update,
-                updateBranch=branch))
-            if not resp.ok:
-                raise Exception(resp.msg)
+        if len(resource_group_updates) == 0:
+            return
+
+        # one call for all the groups, the server locks and saves each branch once
+        resp = depi_client.stub.UpdateResourceGroups(depi_pb2.UpdateResourceGroupsRequest(
+            sessionId=depi_client.session_id,
+            changes=[depi_pb2.BranchResourceGroupChange(resourceGroup=resource_group_update, updateBranch=branch)
+                     for resource_group_update, branch in resource_group_updates]))
+        if not resp.ok:
+            raise Exception(resp.msg)
 
+        for resource_group_update, branch in resource_group_updates:
             print(f"Updated {resource_group_update.URL}")
 
     def run(self):
@@ -261,14 +265,19 @@ class GitMonitor:
             return grpc.insecure_channel(self.depi_url)
 
     def _run_poller(self):
+        resource_groups = []
+        version = ""
         while True:
             with grpc.insecure_channel(self.depi_url) as channel:
                 depi_client = DepiClient(channel)
                 depi_client.login(self.user, self.password, self.project, self.tool_id)
                 response = depi_client.stub.GetResourceGroups(
-                    depi_pb2.GetResourceGroupsRequest(sessionId=depi_client.session_id))
+                    depi_pb2.GetResourceGroupsRequest(sessionId=depi_client.session_id, ifNoneMatch=version))
+                if not response.notModified:
+                    resource_groups = response.resourceGroups
+                    version = response.version
 
-                for resource_group in response.resourceGroups:
+                for resource_group in resource_groups:
                     if resource_group.toolId != self.tool_id:
                         continue
 
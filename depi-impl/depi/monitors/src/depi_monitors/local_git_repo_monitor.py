@@ -139,11 +139,16 @@ class GitToolAdaptor:
 
             self.depi_session_id = response.sessionId
 
+            resource_groups = []
+            version = ""
             while True:
                 response = self.stub.GetResourceGroups(
-                    depi_pb2.GetResourceGroupsRequest(sessionId=self.depi_session_id))
+                    depi_pb2.GetResourceGroupsRequest(sessionId=self.depi_session_id, ifNoneMatch=version))
+                if not response.notModified:
+                    resource_groups = response.resourceGroups
+                    version = response.version
 
-                for rg in response.resourceGroups:
+                for rg in resource_groups:
                     if rg.toolId != self.toolId:
                         continue
 
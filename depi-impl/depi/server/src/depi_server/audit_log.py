@@ -0,0 +1,221 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+# The audit log is written by its own thread. Callers put their entries on a bounded queue and
+# return, the writer takes whatever is queued, writes it in one go and flushes the file at most
+# flushInterval seconds after an entry was queued, which is how much a crash can lose. When the
+# queue is full the callers wait for the writer, entries are never dropped.
+#
+# There is one file per day, named YYYYMMDD. With maxFileSize, a file that grows past it is
+# renamed to YYYYMMDD.1, YYYYMMDD.2, ... and a new one is started. With compress, the files that
+# are no longer written to are gzipped. A late entry for a day that was already compressed moves
+# the compressed file to the next number as well, the entry goes to a new file with its own index.
+#
+# In the jsonl format the files are named YYYYMMDD.jsonl and hold one JSON object per entry, with
+# the "k=v;k=v" data of the entry also split into fields. Next to each file, <file>.idx gets one
+# line per written batch with the byte offsets of its entries by user, operation and resource
+# group ("toolId:URL"), which audit_query.py uses to read only the entries a query asks for.
+
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_FLUSH_INTERVAL = 1.0
+AUDIT_FORMATS = ["text", "jsonl"]
+
+# (tool id, resource group URL, resource URL) fields of the entry data
+RESOURCE_FIELDS = [("toolId", "rgURL", "URL"), ("fromToolId", "fromRgURL", "fromURL"),
+                   ("toToolId", "toRgURL", "toURL"), ("sourceToolId", "sourceRgURL", "sourceURL")]
+
+
+def format_entry(timestamp: datetime.datetime, user, operation, data) -> str:
+    return "{:02d}:{:02d}:{:02d}.{:03d}|{}|{}|{}\n".format(timestamp.hour, timestamp.minute, timestamp.second,
+                                                         int(timestamp.microsecond / 1000.0), user, operation, data)
+
+
+def parse_fields(data) -> dict:
+    fields = {}
+    last = None
+    for part in str(data).split(";"):
+        key, sep, value = part.partition("=")
+        if sep == "" and last is not None:
+            # a ; in a value
+            fields[last] += ";" + part
+            continue
+        fields[key] = value
+        last = key
+    return fields
+
+
+def group_key(toolId: str, URL: str) -> str:
+    return "{}:{}".format(toolId, URL)
+
+
+def entry_groups(fields: dict) -> list[str]:
+    groups = [group_key(fields[toolField], fields[rgField]) for toolField, rgField, _ in RESOURCE_FIELDS
+              if toolField in fields and rgField in fields]
+    if len(groups) == 0 and "toolId" in fields and "URL" in fields:
+        # the resource group entries have the group's URL
+        groups.append(group_key(fields["toolId"], fields["URL"]))
+    if "newToolId" in fields and "newURL" in fields:
+        groups.append(group_key(fields["newToolId"], fields["newURL"]))
+    return sorted(set(groups))
+
+
+def format_json_entry(timestamp: datetime.datetime, user, operation, data) -> tuple[str, dict]:
+    fields = parse_fields(data)
+    record = {"time": timestamp.isoformat(timespec="milliseconds"), "user": user, "op": operation,
+              "data": data, "fields": fields}
+    # ASCII only, so the offsets in the index count characters and bytes alike
+    return json.dumps(record) + "\n", fields
+
+
+def compress_file(filename: str):
+    with open(filename, "rb") as in_file, gzip.open(filename + ".gz", "wb") as out_file:
+        shutil.copyfileobj(in_file, out_file)
+    os.remove(filename)
+
+
+class AuditLog:
+    def __init__(self, directory: str, queueSize: int = AUDIT_QUEUE_SIZE, flushInterval: float = AUDIT_FLUSH_INTERVAL,
+                 maxFileSize: int = 0, compress: bool = False, format: str = "text"):
+        if format not in AUDIT_FORMATS:
+            raise ValueError("Unknown audit log format {}".format(format))
+        self.directory = directory
+        self.format = format
+        # user, operation and resource group offsets of the entries written since the last batch
+        self.postings = None
+        self.flushInterval = flushInterval
+        self.maxFileSize = maxFileSize
+        self.compress = compress
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.file = None
+        self.fileDate = None
+        self.written = 0
+        self.closed = False
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="depi-audit", daemon=True)
+        self.thread.start()
+
+    def write(self, user, operation, data):
+        if self.closed:
+            logging.warning("Audit log is closed, dropping {} {} {}".format(user, operation, data))
+            return
+        self.queue.put((datetime.datetime.now(), user, operation, data))
+
+    def run(self):
+        done = False
+        while not done:
+            entries = [self.queue.get()]
+            # whatever else arrives within the flush interval goes out with the same flush
+            deadline = time.monotonic() + self.flushInterval
+            while entries[-1] is not None and len(entries) < self.queue.maxsize:
+                remaining = deadline - time.monotonic()
+                try:
+                    entries.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if entries[-1] is None:
+                entries.pop()
+                done = True
+            try:
+                self.writeEntries(entries)
+            except Exception:
+                logging.exception("Unable to write {} audit log entries".format(len(entries)))
+        self.closeFile()
+
+    def writeEntries(self, entries):
+        for timestamp, user, operation, data in entries:
+            file = self.fileFor(timestamp.date())
+            if self.format == "jsonl":
+                line, fields = format_json_entry(timestamp, user, operation, data)
+                self.addPostings(self.written, user, operation, entry_groups(fields))
+            else:
+                line = format_entry(timestamp, user, operation, data)
+            file.write(line)
+            self.written += len(line)
+        if self.file is not None:
+            self.file.flush()
+            self.writePostings()
+
+    def addPostings(self, offset: int, user, operation, groups: list[str]):
+        if self.postings is None:
+            self.postings = {"user": {}, "op": {}, "rg": {}}
+        self.postings["user"].setdefault(str(user), []).append(offset)
+        self.postings["op"].setdefault(str(operation), []).append(offset)
+        for group in groups:
+            self.postings["rg"].setdefault(group, []).append(offset)
+
+    def writePostings(self):
+        # the entries are flushed before their index line is written
+        if self.postings is None:
+            return
+        with open(self.filename(self.fileDate) + ".idx", "a") as index_file:
+            index_file.write(json.dumps(self.postings) + "\n")
+        self.postings = None
+
+    def fileFor(self, date: datetime.date):
+        if self.file is not None and date == self.fileDate and \
+                (self.maxFileSize <= 0 or self.written < self.maxFileSize):
+            return self.file
+        if self.file is not None and date == self.fileDate:
+            self.rotate()
+        else:
+            self.closeFile()
+        self.fileDate = date
+        filename = self.filename(date)
+        if os.path.exists(filename + ".gz"):
+            self.renumber(filename + ".gz", filename)
+        self.file = open(filename, "a", newline="")
+        self.written = os.path.getsize(filename)
+        return self.file
+
+    def filename(self, date: datetime.date) -> str:
+        filename = os.path.join(self.directory, "{:4d}{:02d}{:02d}".format(date.year, date.month, date.day))
+        if self.format == "jsonl":
+            filename += ".jsonl"
+        return filename
+
+    def rotate(self):
+        # the full file of the day gets the next free number
+        self.file.flush()
+        self.writePostings()
+        self.file.close()
+        self.file = None
+        filename = self.filename(self.fileDate)
+        rotated = self.renumber(filename, filename)
+        if self.compress:
+            compress_file(rotated)
+
+    def renumber(self, path: str, filename: str) -> str:
+        # moves path, the day's file or its compressed form, and the index to the next free number
+        number = 1
+        while os.path.exists("{}.{}".format(filename, number)) or os.path.exists("{}.{}.gz".format(filename, number)):
+            number += 1
+        numbered = "{}.{}".format(filename, number)
+        os.rename(path, numbered + path[len(filename):])
+        if os.path.exists(filename + ".idx"):
+            os.rename(filename + ".idx", numbered + ".idx")
+        return numbered
+
+    def closeFile(self):
+        if self.file is None:
+            return
+        self.file.flush()
+        self.writePostings()
+        self.file.close()
+        self.file = None
+        if self.compress and self.fileDate != datetime.date.today():
+            compress_file(self.filename(self.fileDate))
+
+    def close(self, timeout: float | None = None):
+        # writes out what is queued before returning
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout)
@@ -0,0 +1,173 @@
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import sys
+
+from depi_server.audit_log import parse_fields, group_key, RESOURCE_FIELDS
+
+# Queries the audit log written by audit_log.AuditLog. Only the files of the days in the time
+# range are opened, and for the jsonl files with an index only the entries the index lists for
+# the user, operation and resource group asked for are read. Text files and jsonl files without an
+# index are read from start to end. The index has no entry per resource, so a resource is looked
+# up within its resource group.
+
+AUDIT_FILE = re.compile(r"(\d{8})(\.jsonl)?(?:\.(\d+))?(\.gz)?")
+
+
+def audit_files(directory: str, startDate: datetime.date | None = None,
+                endDate: datetime.date | None = None) -> list[str]:
+    # the files of each day in the order they were written, the numbered ones first
+    files = []
+    for filename in os.listdir(directory):
+        m = AUDIT_FILE.fullmatch(filename)
+        if m is None:
+            continue
+        date = datetime.datetime.strptime(m.group(1), "%Y%m%d").date()
+        if (startDate is not None and date < startDate) or (endDate is not None and date > endDate):
+            continue
+        number = int(m.group(3)) if m.group(3) is not None else sys.maxsize
+        files.append(((date, number), os.path.join(directory, filename)))
+    return [path for _, path in sorted(files)]
+
+
+def load_index(path: str) -> dict | None:
+    index_path = path[:-3] if path.endswith(".gz") else path
+    index_path += ".idx"
+    if not os.path.exists(index_path):
+        return None
+    index = {"user": {}, "op": {}, "rg": {}}
+    with open(index_path, "r") as index_file:
+        for line in index_file:
+            batch = json.loads(line)
+            for kind, postings in batch.items():
+                for key, offsets in postings.items():
+                    index[kind].setdefault(key, []).extend(offsets)
+    return index
+
+
+def open_audit_file(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def parse_text_entry(date: datetime.date, line: str) -> dict | None:
+    parts = line.rstrip("\n").split("|", 3)
+    if len(parts) != 4:
+        return None
+    clock = datetime.datetime.strptime(parts[0], "%H:%M:%S.%f").time()
+    return {"time": datetime.datetime.combine(date, clock).isoformat(timespec="milliseconds"),
+            "user": parts[1], "op": parts[2], "data": parts[3], "fields": parse_fields(parts[3])}
+
+
+def read_entries(path: str, offsets: list[int] | None = None):
+    date = datetime.datetime.strptime(os.path.basename(path)[:8], "%Y%m%d").date()
+    jsonl = ".jsonl" in os.path.basename(path)
+    with open_audit_file(path) as in_file:
+        if offsets is None:
+            lines = (line.decode("utf-8") for line in in_file)
+        else:
+            def seek_lines():
+                for offset in sorted(offsets):
+                    in_file.seek(offset)
+                    yield in_file.readline().decode("utf-8")
+            lines = seek_lines()
+        for line in lines:
+            if len(line.strip()) == 0:
+                continue
+            if jsonl:
+                yield json.loads(line)
+            else:
+                entry = parse_text_entry(date, line)
+                if entry is not None:
+                    yield entry
+
+
+def candidate_offsets(index: dict, user=None, operation=None, group=None) -> list[int] | None:
+    # None when the index doesn't narrow the query down
+    selected = None
+    for kind, key in [("user", user), ("op", operation), ("rg", group)]:
+        if key is None:
+            continue
+        offsets = set(index[kind].get(key, []))
+        selected = offsets if selected is None else selected & offsets
+    return None if selected is None else sorted(selected)
+
+
+def entry_matches(entry: dict, user=None, operation=None, group=None, resource=None,
+                  start: datetime.datetime | None = None, end: datetime.datetime | None = None) -> bool:
+    if user is not None and entry["user"] != user:
+        return False
+    if operation is not None and entry["op"] != operation:
+        return False
+    time = datetime.datetime.fromisoformat(entry["time"])
+    if (start is not None and time < start) or (end is not None and time > end):
+        return False
+    fields = entry["fields"]
+    if group is not None or resource is not None:
+        refs = [(fields.get(toolField), fields.get(rgField), fields.get(urlField))
+                for toolField, rgField, urlField in RESOURCE_FIELDS if urlField in fields]
+        if "rgURL" not in fields and "toolId" in fields and "URL" in fields:
+            refs.append((fields["toolId"], fields["URL"], None))
+        if not any([(group is None or group_key(toolId, rgURL) == group) and (resource is None or URL == resource)
+                    for toolId, rgURL, URL in refs]):
+            return False
+    return True
+
+
+def query(directory: str, user=None, operation=None, group=None, resource=None,
+          start: datetime.datetime | None = None, end: datetime.datetime | None = None):
+    if resource is not None and group is None:
+        raise ValueError("A resource is queried within its resource group")
+    for path in audit_files(directory, start.date() if start is not None else None,
+                            end.date() if end is not None else None):
+        offsets = None
+        index = load_index(path)
+        if index is not None:
+            offsets = candidate_offsets(index, user, operation, group)
+            if offsets is not None and len(offsets) == 0:
+                continue
+        for entry in read_entries(path, offsets):
+            if entry_matches(entry, user, operation, group, resource, start, end):
+                yield entry
+
+
+def parse_time(value: str, endOfDay: bool = False) -> datetime.datetime:
+    time = datetime.datetime.fromisoformat(value)
+    if endOfDay and len(value) == 10:
+        time = time + datetime.timedelta(days=1) - datetime.timedelta(microseconds=1)
+    return time
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        prog="depi_audit",
+        description="Query the Depi audit log")
+    parser.add_argument("-dir", "--dir", dest="directory", default="audit_logs")
+    parser.add_argument("-user", "--user", dest="user")
+    parser.add_argument("-op", "--op", dest="operation")
+    parser.add_argument("-rg", "--rg", dest="group", help="resource group as toolId:URL")
+    parser.add_argument("-resource", "--resource", dest="resource", help="resource URL")
+    parser.add_argument("-from", "--from", dest="start", help="YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS")
+    parser.add_argument("-to", "--to", dest="end", help="YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS")
+    parser.add_argument("-text", "--text", dest="text", action="store_true",
+                        help="print the entries as time|user|op|data instead of JSON lines")
+
+    args = parser.parse_args()
+    if args.resource is not None and args.group is None:
+        parser.error("-resource needs the resource group given with -rg")
+
+    start = parse_time(args.start) if args.start is not None else None
+    end = parse_time(args.end, True) if args.end is not None else None
+    for entry in query(args.directory, args.user, args.operation, args.group, args.resource, start, end):
+        if args.text:
+            print("{}|{}|{}|{}".format(entry["time"], entry["user"], entry["op"], entry["data"]))
+        else:
+            print(json.dumps(entry))
+
+
+if __name__ == "__main__":
+    run()
@@ -104,8 +104,46 @@ class CapBranchTag(Capability):
     def __init__(self):
         super().__init__([])
 
+# Decisions are cached per capability class on the tool id and resource group URL arguments. A
+# decision is either final, or the capabilities that match those arguments compiled into one regex
+# over the remaining (resource URL) arguments, which are joined with FIELD_SEPARATOR.
+
+FIELD_SEPARATOR = "\0"
+DECISION_CACHE_SIZE = 10000
+
+# What a user's capabilities of one class allow, worked out once from the rules: nothing, anything,
+# anything within some tools or resource groups, or it depends on the resource URLs as well.
+SCOPE_NONE = "none"
+SCOPE_UNRESTRICTED = "unrestricted"
+SCOPE_GROUPS = "groups"
+SCOPE_PATTERNS = "patterns"
+
+
+def group_fields(arity: int) -> tuple:
+    # the positions of the tool id and resource group URL arguments of a capability
+    if arity == 6:
+        return 0, 1, 3, 4
+    if arity == 3:
+        return 0, 1
+    return tuple(range(arity))
+
+
+def compile_alternatives(patterns: list[list[str]]):
+    # one regex that matches the joined arguments when any of the pattern lists matches them
+    alternatives = [FIELD_SEPARATOR.join(["(?:{})".format(p) for p in fields]) for fields in patterns]
+    return re.compile("|".join(["(?:{})".format(a) for a in alternatives]))
+
+
 class Authorization:
-    def __init__(self, rules=None, capabilities=None):
+    def __init__(self, rules=None, capabilities=None, cacheSize: int = DECISION_CACHE_SIZE):
+        self.cacheSize = cacheSize
+        # (capability class name, tool id and resource group URL arguments) -> True, False or a regex
+        self.decisions = {}
+        # (capability class name, indexes of the matching capabilities) -> regex
+        self.matchers = {}
+        # (capability class name, arguments with None for the unknown ones) -> bool
+        self.possible = {}
+        self.scopes = {}
         self.caps = {}
         for rule in rules:
             for cap in rule:
@@ -123,6 +161,77 @@ class Authorization:
                 self.caps[cap_name].append(cap)
 
     def is_authorized(self, cls, *args):
+        caps = self.caps.get(cls.__name__)
+        if caps is None:
+            return False
+        if len(args) != len(caps[0].patterns) or any([FIELD_SEPARATOR in arg for arg in args]):
+            return self.verify_all(cls, *args)
+
+        fields = group_fields(len(args))
+        key = (cls.__name__,) + tuple([args[i] for i in fields])
+        decision = self.decisions.get(key)
+        if decision is None:
+            decision = self.decide(cls.__name__, caps, args, fields)
+            if len(self.decisions) >= self.cacheSize:
+                self.decisions.clear()
+                self.matchers.clear()
+            self.decisions[key] = decision
+        if decision is True or decision is False:
+            return decision
+        return decision.fullmatch(FIELD_SEPARATOR.join([args[i] for i in range(len(args)) if i not in fields])) \
+            is not None
+
+    def decide(self, capName, caps, args, fields):
+        matching = [i for i, cap in enumerate(caps)
+                    if all([cap.regexes[f].fullmatch(args[f]) is not None for f in fields])]
+        if len(matching) == 0:
+            return False
+        rest = [i for i in range(len(args)) if i not in fields]
+        if len(rest) == 0 or any([all([caps[i].patterns[f] == "*" for f in rest]) for i in matching]):
+            return True
+        key = (capName, tuple(matching))
+        matcher = self.matchers.get(key)
+        if matcher is None:
+            matcher = compile_alternatives([[caps[i].regexes[f].pattern for f in rest] for i in matching])
+            self.matchers[key] = matcher
+        return matcher
+
+    def classify(self, cls) -> str:
+        scope = self.scopes.get(cls.__name__)
+        if scope is None:
+            caps = self.caps.get(cls.__name__, [])
+            if len(caps) == 0:
+                scope = SCOPE_NONE
+            elif any([all([p == "*" for p in cap.patterns]) for cap in caps]):
+                scope = SCOPE_UNRESTRICTED
+            else:
+                fields = group_fields(len(caps[0].patterns))
+                rest = [i for i in range(len(caps[0].patterns)) if i not in fields]
+                if all([all([cap.patterns[i] == "*" for i in rest]) for cap in caps]):
+                    scope = SCOPE_GROUPS
+                else:
+                    scope = SCOPE_PATTERNS
+            self.scopes[cls.__name__] = scope
+        return scope
+
+    def may_authorize(self, cls, *args):
+        # False when no capability can match the arguments that are not None, whatever the others
+        # are. Queries use it to leave out the tools and resource groups a user can't see.
+        caps = self.caps.get(cls.__name__)
+        if caps is None:
+            return False
+        key = (cls.__name__,) + args
+        possible = self.possible.get(key)
+        if possible is None:
+            possible = any([all([arg is None or cap.regexes[i].fullmatch(arg) is not None
+                                 for i, arg in enumerate(args)]) for cap in caps])
+            if len(self.possible) >= self.cacheSize:
+                self.possible.clear()
+            self.possible[key] = possible
+        return possible
+
+    def verify_all(self, cls, *args):
+        # checks each capability in turn, without the decision cache
         if cls.__name__ not in self.caps:
             return False
 
@@ -0,0 +1,103 @@
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+
+from depi_server.auth.depi_authorization import Authorization, CapLinkRead
+from depi_server.bench.graph_gen import generate, GRAPH_SHAPES
+from depi_server.bench.storage_bench import summarize, git_commit
+
+# Times the link read authorization check of every link of a synthetic graph, once checking each
+# capability in turn (verify_all, what every check did before the decision cache) and once
+# through is_authorized. The output has the storage benchmark format, so compare.py can diff it.
+
+OPERATIONS = ["verify_all", "is_authorized"]
+
+
+def make_authorization(rules: int) -> Authorization:
+    caps = []
+    for i in range(rules):
+        caps.append(CapLinkRead("git", "/bench/*/rg{}".format(i), "*", "git", "*", "/d{}/*".format(i % 10)))
+        caps.append(CapLinkRead("webgme", "/project{}/*".format(i), "*", "git", "*", "*"))
+    return Authorization([], caps)
+
+
+def link_args(link) -> tuple:
+    return (link.fromResourceGroup.toolId, link.fromResourceGroup.URL, link.fromRes.URL,
+            link.toResourceGroup.toolId, link.toResourceGroup.URL, link.toRes.URL)
+
+
+def time_checks(check, links: list[tuple]) -> tuple[float, int]:
+    start = time.perf_counter()
+    allowed = 0
+    for args in links:
+        if check(CapLinkRead, *args):
+            allowed += 1
+    return time.perf_counter() - start, allowed
+
+
+def run_benchmarks(shapes: list[str], sizes: list[int], rules: int, repeat: int, seed: int, log=None) -> dict:
+    results = []
+    for shape in shapes:
+        for size in sizes:
+            graph = generate(shape, size, seed)
+            links = [link_args(link) for link in graph.links]
+            opTimes: dict[str, list[float]] = {}
+            for _ in range(repeat):
+                # a new Authorization every time, so the cached checks pay for filling the cache
+                auth = make_authorization(rules)
+                verifyTime, verifyAllowed = time_checks(auth.verify_all, links)
+                cachedTime, cachedAllowed = time_checks(auth.is_authorized, links)
+                if verifyAllowed != cachedAllowed:
+                    raise Exception("is_authorized allowed {} links, verify_all {}".format(
+                        cachedAllowed, verifyAllowed))
+                opTimes.setdefault("verify_all", []).append(verifyTime)
+                opTimes.setdefault("is_authorized", []).append(cachedTime)
+                if log is not None:
+                    print("{} {}: verify_all={:.4f}s, is_authorized={:.4f}s, {} of {} links allowed".format(
+                        shape, size, verifyTime, cachedTime, cachedAllowed, len(links)), file=log)
+            for op, times in opTimes.items():
+                result = {"backend": "authorization", "graph": shape, "size": size, "operation": op,
+                          "items": len(links), "graphInfo": graph.describe()}
+                result.update(summarize(times))
+                result["perItem"] = result["median"] / max(len(links), 1)
+                results.append(result)
+
+    return {"meta": {"timestamp": datetime.datetime.now().isoformat(),
+                     "commit": git_commit(),
+                     "python": sys.version.split()[0],
+                     "platform": platform.platform(),
+                     "repeat": repeat,
+                     "seed": seed,
+                     "rules": rules},
+            "results": results}
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        prog="depi_auth_bench",
+        description="Benchmark the per link cost of the Depi authorization checks")
+    parser.add_argument("-graph", "--graph", dest="graphs", action="append", choices=GRAPH_SHAPES)
+    parser.add_argument("-size", "--size", dest="sizes", action="append", type=int)
+    parser.add_argument("-rules", "--rules", dest="rules", type=int, default=20,
+                        help="number of capability pairs the user has")
+    parser.add_argument("-repeat", "--repeat", dest="repeat", type=int, default=3)
+    parser.add_argument("-seed", "--seed", dest="seed", type=int, default=1)
+    parser.add_argument("-o", "--output", dest="output", required=False)
+
+    args = parser.parse_args()
+
+    result = run_benchmarks(args.graphs or GRAPH_SHAPES, args.sizes or [10000, 100000], args.rules,
+                            args.repeat, args.seed, log=sys.stderr)
+
+    if args.output is not None:
+        with open(args.output, "w") as out_file:
+            json.dump(result, out_file, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    run()
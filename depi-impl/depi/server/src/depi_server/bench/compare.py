@@ -0,0 +1,79 @@
+import argparse
+import json
+import sys
+
+# Compares two result files written by storage_bench.py (or any of the other depi benchmarks
+# that use the same result layout) and reports the change in median time per operation.
+
+
+def result_key(result: dict) -> tuple:
+    return result["backend"], result["graph"], result["size"], result["operation"]
+
+
+def load_results(filename: str) -> tuple[dict, dict]:
+    with open(filename, "r") as in_file:
+        data = json.load(in_file)
+    return data.get("meta", {}), {result_key(r): r for r in data["results"]}
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> tuple[list[dict], list[dict]]:
+    rows = []
+    regressions = []
+    for key in sorted(set(baseline.keys()) | set(current.keys()), key=lambda k: tuple(str(p) for p in k)):
+        old = baseline.get(key)
+        new = current.get(key)
+        row = {"key": key,
+               "baseline": old["median"] if old is not None else None,
+               "current": new["median"] if new is not None else None,
+               "ratio": None}
+        if old is not None and new is not None and old["median"] > 0:
+            row["ratio"] = new["median"] / old["median"]
+            if row["ratio"] > 1.0 + threshold:
+                regressions.append(row)
+        rows.append(row)
+    return rows, regressions
+
+
+def format_time(value) -> str:
+    if value is None:
+        return "-"
+    return "{:.4f}s".format(value)
+
+
+def print_rows(rows: list[dict], out_file):
+    print("{:<10} {:<8} {:>9} {:<22} {:>11} {:>11} {:>8}".format(
+        "backend", "graph", "size", "operation", "baseline", "current", "ratio"), file=out_file)
+    for row in rows:
+        backend, graph, size, operation = row["key"]
+        ratio = "-" if row["ratio"] is None else "{:.2f}x".format(row["ratio"])
+        print("{:<10} {:<8} {:>9} {:<22} {:>11} {:>11} {:>8}".format(
+            backend, graph, size, operation, format_time(row["baseline"]), format_time(row["current"]), ratio),
+            file=out_file)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        prog="depi_bench_compare",
+        description="Compare two Depi benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("-threshold", "--threshold", dest="threshold", type=float, default=0.1,
+                        help="relative slowdown of the median that is reported as a regression")
+    args = parser.parse_args()
+
+    baseline_meta, baseline = load_results(args.baseline)
+    current_meta, current = load_results(args.current)
+
+    print("baseline: {} {}".format(baseline_meta.get("commit", ""), baseline_meta.get("timestamp", "")))
+    print("current:  {} {}".format(current_meta.get("commit", ""), current_meta.get("timestamp", "")))
+    rows, regressions = compare_results(baseline, current, args.threshold)
+    print_rows(rows, sys.stdout)
+
+    if len(regressions) > 0:
+        print("{} operations are more than {:.0f}% slower than the baseline".format(
+            len(regressions), args.threshold * 100))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,181 @@
+import random
+
+from depi_server.model.depi_model import Resource, ResourceGroup, LinkWithResources, ResourceRef, \
+    ResourceRefPattern, ResourceLinkPattern, ResourceChange, ResourceGroupChange, ChangeType
+
+# Synthetic link graphs used by the storage benchmarks. Every generator is deterministic for a
+# given (size, seed) so that results produced on different commits can be compared.
+
+GRAPH_SHAPES = ["chain", "fanout", "dag", "dirs"]
+
+
+class SyntheticGraph:
+    def __init__(self, shape: str, size: int, toolId: str):
+        self.shape = shape
+        self.size = size
+        self.toolId = toolId
+        self.resourceGroups: dict[str, ResourceGroup] = {}
+        self.resources: list[tuple[ResourceGroup, Resource]] = []
+        self.links: list[LinkWithResources] = []
+        # resources whose dependency graph is queried
+        self.roots: list[tuple[ResourceGroup, Resource]] = []
+        # resources that are modified by the updateResourceGroup benchmark
+        self.changed: list[tuple[ResourceGroup, Resource]] = []
+
+    def getResourceGroup(self, index: int) -> ResourceGroup:
+        url = "/bench/{}/rg{}".format(self.shape, index)
+        rg = self.resourceGroups.get(url)
+        if rg is None:
+            rg = ResourceGroup(name="rg{}".format(index), toolId=self.toolId, URL=url, version="000000")
+            self.resourceGroups[url] = rg
+        return rg
+
+    def addResource(self, rg: ResourceGroup, url: str) -> tuple[ResourceGroup, Resource]:
+        res = Resource(name=url.rstrip("/").split("/")[-1] or url, id=url, URL=url)
+        pair = (rg, res)
+        self.resources.append(pair)
+        return pair
+
+    def addLink(self, fromPair: tuple[ResourceGroup, Resource], toPair: tuple[ResourceGroup, Resource]):
+        self.links.append(LinkWithResources(fromPair[0], fromPair[1], toPair[0], toPair[1]))
+
+    def getResourceGroupChanges(self, newVersion: str) -> list[ResourceGroupChange]:
+        changes: dict[str, ResourceGroupChange] = {}
+        for (rg, res) in self.changed:
+            change = changes.get(rg.URL)
+            if change is None:
+                change = ResourceGroupChange(name=rg.name, toolId=rg.toolId, URL=rg.URL, version=newVersion)
+                changes[rg.URL] = change
+            change.resources[res.URL] = ResourceChange(name=res.name, id=res.id, URL=res.URL,
+                                                       newName=res.name, newId=res.id, newURL=res.URL,
+                                                       changeType=ChangeType.Modified)
+        return list(changes.values())
+
+    def getLinkPatterns(self) -> list[ResourceLinkPattern]:
+        patterns = []
+        groups = list(self.resourceGroups.values())
+        for fromRg in groups[:4]:
+            for toRg in groups[:4]:
+                patterns.append(ResourceLinkPattern(ResourceRefPattern(fromRg.toolId, fromRg.URL, ".*"),
+                                                    ResourceRefPattern(toRg.toolId, toRg.URL, "/d1/.*")))
+        return patterns
+
+    def getRootRefs(self) -> list[ResourceRef]:
+        return [ResourceRef.fromResourceGroupAndRes(rg, res) for (rg, res) in self.roots]
+
+    def describe(self) -> dict:
+        return {"shape": self.shape, "size": self.size,
+                "resourceGroups": len(self.resourceGroups),
+                "resources": len(self.resources),
+                "links": len(self.links)}
+
+
+def _dirPath(index: int, width: int, depth: int) -> str:
+    parts = []
+    for _ in range(depth):
+        parts.append("d{}".format(index % width))
+        index //= width
+    return "/" + "/".join(parts) + "/"
+
+
+def generate_chain(size: int, seed: int, groupSize: int = 1000, toolId: str = "git") -> SyntheticGraph:
+    graph = SyntheticGraph("chain", size, toolId)
+    prev = None
+    for i in range(size + 1):
+        rg = graph.getResourceGroup(i // groupSize)
+        curr = graph.addResource(rg, _dirPath(i, 10, 2) + "res{}".format(i))
+        if prev is not None:
+            graph.addLink(prev, curr)
+        prev = curr
+    graph.roots = [graph.resources[0], graph.resources[len(graph.resources) // 2]]
+    rnd = random.Random(seed)
+    graph.changed = rnd.sample(graph.resources, min(10, len(graph.resources)))
+    return graph
+
+
+def generate_fanout(size: int, seed: int, branching: int = 8, groupSize: int = 1000,
+                    toolId: str = "git") -> SyntheticGraph:
+    graph = SyntheticGraph("fanout", size, toolId)
+    nodes = []
+    for i in range(size + 1):
+        rg = graph.getResourceGroup(i // groupSize)
+        nodes.append(graph.addResource(rg, _dirPath(i, 10, 2) + "node{}".format(i)))
+    for i in range(1, size + 1):
+        graph.addLink(nodes[(i - 1) // branching], nodes[i])
+    graph.roots = nodes[:min(3, len(nodes))]
+    graph.changed = nodes[:min(10, len(nodes))]
+    return graph
+
+
+def generate_dag(size: int, seed: int, layers: int = 10, fanIn: int = 3, groupSize: int = 1000,
+                 toolId: str = "git") -> SyntheticGraph:
+    graph = SyntheticGraph("dag", size, toolId)
+    rnd = random.Random(seed)
+    layerWidth = max(fanIn, -(-size // ((layers - 1) * fanIn)))
+    layerNodes = []
+    index = 0
+    for layer in range(layers):
+        nodes = []
+        for _ in range(layerWidth):
+            rg = graph.getResourceGroup(index // groupSize)
+            nodes.append(graph.addResource(rg, "/d{}/layer{}/node{}".format(layer % 10, layer, index)))
+            index += 1
+        layerNodes.append(nodes)
+
+    # every child gets several parents from the previous layer, which gives resources
+    # shared ancestors several layers up
+    for layer in range(1, layers):
+        for child in layerNodes[layer]:
+            for parent in rnd.sample(layerNodes[layer - 1], fanIn):
+                if len(graph.links) >= size:
+                    break
+                graph.addLink(parent, child)
+
+    graph.roots = layerNodes[0][:3] + layerNodes[-1][:3]
+    graph.changed = rnd.sample(layerNodes[0], min(10, layerWidth))
+    return graph
+
+
+def generate_dirs(size: int, seed: int, width: int = 10, groupSize: int = 1000,
+                  toolId: str = "git") -> SyntheticGraph:
+    # Links from directory resources (URLs ending in the path separator) into files of other
+    # resource groups, so that updates exercise the prefix matching used for folders.
+    graph = SyntheticGraph("dirs", size, toolId)
+    rnd = random.Random(seed)
+    numDirs = max(1, size // 10)
+    depth = 1
+    while width ** depth < numDirs:
+        depth += 1
+    dirs = []
+    for i in range(numDirs):
+        rg = graph.getResourceGroup(0)
+        dirs.append(graph.addResource(rg, _dirPath(i, width, depth)))
+
+    for i in range(size):
+        rg = graph.getResourceGroup(1 + i // groupSize)
+        dirPair = dirs[i % numDirs]
+        filePair = graph.addResource(rg, dirPair[1].URL + "file{}".format(i))
+        graph.addLink(dirPair, filePair)
+
+    graph.roots = dirs[:min(3, numDirs)]
+    graph.changed = []
+    rgDirs = graph.getResourceGroup(0)
+    for d in rnd.sample(dirs, min(10, numDirs)):
+        # a change to a file inside a linked directory marks the directory link dirty
+        res = Resource(name="changed", id=d[1].URL + "changed", URL=d[1].URL + "changed")
+        graph.changed.append((rgDirs, res))
+    return graph
+
+
+GENERATORS = {
+    "chain": generate_chain,
+    "fanout": generate_fanout,
+    "dag": generate_dag,
+    "dirs": generate_dirs,
+}
+
+
+def generate(shape: str, size: int, seed: int = 1) -> SyntheticGraph:
+    if shape not in GENERATORS:
+        raise ValueError("Unknown graph shape {}, expected one of {}".format(shape, ", ".join(GRAPH_SHAPES)))
+    return GENERATORS[shape](size, seed)
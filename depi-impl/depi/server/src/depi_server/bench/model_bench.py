@@ -0,0 +1,127 @@
+import argparse
+import contextlib
+import copy
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from depi_server.bench.graph_gen import generate, GRAPH_SHAPES
+from depi_server.bench.storage_bench import MemJsonBackend, DEFAULT_CONFIG, summarize, git_commit
+from depi_server.model import depi_model
+
+# Measures what the model classes cost when a large memjson snapshot is loaded and all of its links
+# are streamed: the time of each, and the memory the loaded branch holds, in total and for the
+# model objects alone (the rest is mostly their strings and the dicts and sets holding them).
+# The output has the storage benchmark format, so compare.py can diff it.
+
+OPERATIONS = ["loadSnapshot", "streamAllLinks"]
+
+
+def load_snapshot(config):
+    from depi_server.db.depi_db_mem_json import MemJsonDB
+    return MemJsonDB(config)
+
+
+def stream_all_links(db) -> int:
+    count = 0
+    for _ in db.getBranch("main").getAllLinksAsStream():
+        count += 1
+    return count
+
+
+def measure_memory(config) -> tuple[int, int]:
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        db = load_snapshot(config)
+        size = tracemalloc.get_traced_memory()[0] - before
+        modelSize = sum([stat.size for stat in tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, depi_model.__file__)]).statistics("filename")])
+    finally:
+        tracemalloc.stop()
+    del db
+    return size, modelSize
+
+
+def run_benchmarks(config, shapes: list[str], sizes: list[int], repeat: int, seed: int, log=None) -> dict:
+    results = []
+    backend = MemJsonBackend(config)
+    try:
+        for shape in shapes:
+            for size in sizes:
+                graph = generate(shape, size, seed)
+                branch = backend.newBranch()
+                branch.addLinks(graph.links)
+                branch.saveBranchState()
+
+                opTimes: dict[str, list[float]] = {}
+                streamed = 0
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    db = load_snapshot(config)
+                    opTimes.setdefault("loadSnapshot", []).append(time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    streamed = stream_all_links(db)
+                    opTimes.setdefault("streamAllLinks", []).append(time.perf_counter() - start)
+                    del db
+                memory, modelMemory = measure_memory(config)
+                if log is not None:
+                    print("{} {}: {}, {} links, {} bytes loaded, {} in model objects".format(
+                        shape, size, ", ".join(["{}={:.4f}s".format(op, times[-1]) for op, times in opTimes.items()]),
+                        streamed, memory, modelMemory), file=log)
+
+                for op, times in opTimes.items():
+                    result = {"backend": "model", "graph": shape, "size": size, "operation": op,
+                              "items": streamed, "graphInfo": graph.describe()}
+                    result.update(summarize(times))
+                    result["perItem"] = result["median"] / max(streamed, 1)
+                    if op == "loadSnapshot":
+                        result["bytes"] = memory
+                        result["modelBytes"] = modelMemory
+                        result["modelBytesPerLink"] = modelMemory / max(streamed, 1)
+                    results.append(result)
+    finally:
+        backend.close()
+
+    return {"meta": {"timestamp": datetime.datetime.now().isoformat(),
+                     "commit": git_commit(),
+                     "python": sys.version.split()[0],
+                     "platform": platform.platform(),
+                     "repeat": repeat,
+                     "seed": seed},
+            "results": results}
+
+
+def run():
+    from depi_server.depi_server import Config
+
+    parser = argparse.ArgumentParser(
+        prog="depi_model_bench",
+        description="Benchmark loading a memjson snapshot and streaming its links")
+    parser.add_argument("-graph", "--graph", dest="graphs", action="append", choices=GRAPH_SHAPES)
+    parser.add_argument("-size", "--size", dest="sizes", action="append", type=int)
+    parser.add_argument("-repeat", "--repeat", dest="repeat", type=int, default=3)
+    parser.add_argument("-seed", "--seed", dest="seed", type=int, default=1)
+    parser.add_argument("-o", "--output", dest="output", required=False)
+
+    args = parser.parse_args()
+
+    config = Config(copy.deepcopy(DEFAULT_CONFIG))
+    # the backend prints diagnostics to stdout, keep them out of the JSON output
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run_benchmarks(config, args.graphs or GRAPH_SHAPES, args.sizes or [10000, 100000],
+                                args.repeat, args.seed, log=sys.stderr)
+
+    if args.output is not None:
+        with open(args.output, "w") as out_file:
+            json.dump(result, out_file, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    run()
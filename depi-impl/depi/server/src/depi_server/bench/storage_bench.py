@@ -0,0 +1,264 @@
+import argparse
+import contextlib
+import copy
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from depi_server.bench.graph_gen import generate, GRAPH_SHAPES, SyntheticGraph
+from depi_server.db.depi_db import DepiBranch
+from depi_server.model.depi_model import ResourceGroup
+
+# Runs the DepiBranch operations directly against a storage backend (no gRPC, no server)
+# over synthetic link graphs and writes the timings as JSON that compare.py can diff.
+
+OPERATIONS = ["addLinks", "saveBranchState", "getLinks", "getAllLinks", "getDependencyGraph",
+              "updateResourceGroup", "getDirtyLinks", "getDirtyLinksInferred", "markLinksClean"]
+
+DEFAULT_CONFIG = {
+    "tools": {
+        "git": {"pathSeparator": "/"},
+        "webgme": {"pathSeparator": "/"},
+        "git-gsn": {"pathSeparator": "/"}
+    },
+    "db": {
+        "type": "memjson"
+    }
+}
+
+
+class Backend:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+
+    def newBranch(self) -> DepiBranch:
+        pass
+
+    def close(self):
+        pass
+
+
+class MemJsonBackend(Backend):
+    def __init__(self, config):
+        super().__init__("memjson", config)
+        self.stateDir = None
+        self.db = None
+
+    def newBranch(self) -> DepiBranch:
+        from depi_server.db.depi_db_mem_json import MemJsonDB
+
+        self.close()
+        self.stateDir = tempfile.mkdtemp(prefix="depi_bench_")
+        self.config.dbConfig["stateDir"] = self.stateDir
+        self.db = MemJsonDB(self.config)
+        return self.db.getBranch("main")
+
+    def close(self):
+        if self.stateDir is not None:
+            shutil.rmtree(self.stateDir, ignore_errors=True)
+            self.stateDir = None
+
+
+class DoltBackend(Backend):
+    # Each run gets its own branch created from main, so main should be empty for the
+    # numbers to be comparable.
+    def __init__(self, config):
+        super().__init__("dolt", config)
+        from depi_server.db.depi_db_dolt import DoltDB
+        self.db = DoltDB(config)
+
+    def newBranch(self) -> DepiBranch:
+        name = "bench_" + uuid.uuid4().hex[:12]
+        self.db.createBranch(name, "main")
+        return self.db.getBranch(name)
+
+    def close(self):
+        self.db.shutdown()
+
+
+BACKENDS = {
+    "memjson": MemJsonBackend,
+    "dolt": DoltBackend,
+}
+
+
+class Timer:
+    def __init__(self):
+        self.times: dict[str, float] = {}
+        self.items: dict[str, int] = {}
+
+    def run(self, operation, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        if hasattr(result, "__next__"):
+            result = list(result)
+        self.times[operation] = time.perf_counter() - start
+        if isinstance(result, list):
+            self.items[operation] = len(result)
+        return result
+
+
+def run_operations(branch: DepiBranch, graph: SyntheticGraph, operations: list[str]) -> Timer:
+    timer = Timer()
+
+    timer.run("addLinks", branch.addLinks, graph.links)
+    timer.items["addLinks"] = len(graph.links)
+
+    if "saveBranchState" in operations:
+        timer.run("saveBranchState", branch.saveBranchState)
+
+    if "getLinks" in operations:
+        timer.run("getLinks", branch.getLinks, graph.getLinkPatterns())
+
+    if "getAllLinks" in operations:
+        timer.run("getAllLinks", branch.getAllLinks)
+
+    if "getDependencyGraph" in operations:
+        def dependencyGraphs():
+            total = []
+            for rr in graph.getRootRefs():
+                total.extend(branch.getDependencyGraph(rr, False, 0))
+                total.extend(branch.getDependencyGraph(rr, True, 0))
+            return total
+        timer.run("getDependencyGraph", dependencyGraphs)
+
+    changes = graph.getResourceGroupChanges("111111")
+    if "updateResourceGroup" in operations:
+        def updateResourceGroups():
+            dirtied = []
+            for change in changes:
+                dirtied.extend(branch.updateResourceGroup(change))
+            return dirtied
+        timer.run("updateResourceGroup", updateResourceGroups)
+
+    dirtyLinks = []
+    if "getDirtyLinks" in operations or "getDirtyLinksInferred" in operations or \
+            "markLinksClean" in operations:
+        def getDirtyLinks(withInferred):
+            found = []
+            for rg in graph.resourceGroups.values():
+                found.extend(branch.getDirtyLinks(ResourceGroup(name="", toolId=rg.toolId, URL=rg.URL,
+                                                                version=""), withInferred))
+            return found
+        dirtyLinks = timer.run("getDirtyLinks", getDirtyLinks, False)
+        if "getDirtyLinksInferred" in operations:
+            timer.run("getDirtyLinksInferred", getDirtyLinks, True)
+
+    if "markLinksClean" in operations:
+        toClean = [lk.toLink() for lk in dirtyLinks if lk.dirty]
+        timer.run("markLinksClean", branch.markLinksClean, toClean, True)
+        timer.items["markLinksClean"] = len(toClean)
+
+    return timer
+
+
+def summarize(times: list[float]) -> dict:
+    return {"min": min(times),
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+            "max": max(times),
+            "times": times}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except Exception:
+        return ""
+
+
+def run_benchmarks(config, backendNames: list[str], shapes: list[str], sizes: list[int],
+                   operations: list[str], repeat: int, seed: int, log=None) -> dict:
+    results = []
+    for backendName in backendNames:
+        backend = BACKENDS[backendName](config)
+        try:
+            for shape in shapes:
+                for size in sizes:
+                    opTimes: dict[str, list[float]] = {}
+                    opItems: dict[str, int] = {}
+                    description = None
+                    for _ in range(repeat):
+                        # graphs are regenerated for every repetition because the backends keep
+                        # references to the model objects they are given
+                        graph = generate(shape, size, seed)
+                        description = graph.describe()
+                        branch = backend.newBranch()
+                        timer = run_operations(branch, graph, operations)
+                        for op, t in timer.times.items():
+                            opTimes.setdefault(op, []).append(t)
+                        opItems.update(timer.items)
+                        if log is not None:
+                            print("{} {} {}: {}".format(backendName, shape, size,
+                                                        ", ".join(["{}={:.4f}s".format(op, t)
+                                                                   for op, t in timer.times.items()])),
+                                  file=log)
+                    for op, times in opTimes.items():
+                        result = {"backend": backendName, "graph": shape, "size": size,
+                                  "operation": op, "items": opItems.get(op, 0),
+                                  "graphInfo": description}
+                        result.update(summarize(times))
+                        results.append(result)
+        finally:
+            backend.close()
+
+    return {"meta": {"timestamp": datetime.datetime.now().isoformat(),
+                     "commit": git_commit(),
+                     "python": sys.version.split()[0],
+                     "platform": platform.platform(),
+                     "repeat": repeat,
+                     "seed": seed},
+            "results": results}
+
+
+def run():
+    from depi_server.depi_server import Config
+
+    parser = argparse.ArgumentParser(
+        prog="depi_bench",
+        description="Benchmark the Depi storage backends on synthetic link graphs")
+    parser.add_argument("-config", "--config", dest="config_file", required=False,
+                        help="Depi config file, its db section is used for the non-memory backends")
+    parser.add_argument("-backend", "--backend", dest="backends", action="append",
+                        choices=list(BACKENDS.keys()))
+    parser.add_argument("-graph", "--graph", dest="graphs", action="append", choices=GRAPH_SHAPES)
+    parser.add_argument("-size", "--size", dest="sizes", action="append", type=int)
+    parser.add_argument("-op", "--op", dest="operations", action="append", choices=OPERATIONS)
+    parser.add_argument("-repeat", "--repeat", dest="repeat", type=int, default=3)
+    parser.add_argument("-seed", "--seed", dest="seed", type=int, default=1)
+    parser.add_argument("-o", "--output", dest="output", required=False)
+
+    args = parser.parse_args()
+
+    configJson = copy.deepcopy(DEFAULT_CONFIG)
+    if args.config_file is not None:
+        with open(args.config_file, "r") as config_file:
+            configJson = json.load(config_file)
+    config = Config(configJson)
+
+    operations = args.operations or OPERATIONS
+    # the backends print diagnostics to stdout, keep them out of the JSON output
+    with contextlib.redirect_stdout(sys.stderr):
+        result = run_benchmarks(config, args.backends or ["memjson"], args.graphs or GRAPH_SHAPES,
+                                args.sizes or [1000, 10000], operations, args.repeat, args.seed,
+                                log=sys.stderr)
+
+    if args.output is not None:
+        with open(args.output, "w") as out_file:
+            json.dump(result, out_file, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    run()
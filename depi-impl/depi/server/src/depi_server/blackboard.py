@@ -0,0 +1,557 @@
+import contextlib
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import depi_pb2
+
+from depi_server.model.depi_model import Resource, ResourceRef, ResourceGroup, LinkWithResources, \
+    ResourceGroupChange
+
+# A user's blackboard: the resources and links they are putting together before saving them to
+# the Depi. changedLinks are the links added on the blackboard, deletedLinks the ones removed from
+# it again, a link is in at most one of them. adjacency holds the links of both sets by the
+# (toolId, resource group URL, URL) of their two ends, so the links of a resource are found without
+# going through all of them. The BlackboardIndex shared by the server's blackboards tells which
+# blackboards hold resources of a resource group.
+#
+# The BlackboardStore holds the blackboards by user. A blackboard whose estimated size is over the
+# per user quota, the least recently used ones while all of them are over the total quota, and the
+# ones not used for the idle timeout are written to the spill directory and dropped from memory.
+# They are read back when they are used again, and then kept in memory for at least the spill
+# grace period. The sizes are estimates from the number of resources and links, not measured
+# memory, taken when a request is done with the blackboard.
+
+BLACKBOARD_RESOURCE_SIZE = 512
+BLACKBOARD_LINK_SIZE = 256
+BLACKBOARD_SPILL_GRACE = 60.0
+
+
+def resource_key(rg: ResourceGroup, res: Resource) -> tuple[str, str, str]:
+    return rg.toolId, rg.URL, res.URL
+
+
+def link_keys(link: LinkWithResources) -> set[tuple[str, str, str]]:
+    return {resource_key(link.fromResourceGroup, link.fromRes), resource_key(link.toResourceGroup, link.toRes)}
+
+
+class BlackboardIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (toolId, resource group URL) -> users
+        self.groups: dict[tuple[str, str], set[str]] = {}
+
+    def add(self, key: tuple[str, str], user: str):
+        with self.lock:
+            self.groups.setdefault(key, set()).add(user)
+
+    def remove(self, key: tuple[str, str], user: str):
+        with self.lock:
+            users = self.groups.get(key)
+            if users is not None:
+                users.discard(user)
+                if len(users) == 0:
+                    del self.groups[key]
+
+    def usersOf(self, key: tuple[str, str]) -> list[str]:
+        with self.lock:
+            return sorted(self.groups.get(key, ()))
+
+
+class Blackboard:
+    def __init__(self, user: str | None = None, index: BlackboardIndex | None = None):
+        self.user = user
+        self.index = index
+        self.changedLinks: set[LinkWithResources] = set()
+        self.resources: dict[str, dict[str, ResourceGroup]] = {}
+        self.deletedLinks: set[LinkWithResources] = set()
+        self.adjacency: dict[tuple[str, str, str], set[LinkWithResources]] = {}
+        # the same links by the (toolId, resource group URL) of their ends
+        self.groupLinks: dict[tuple[str, str], set[LinkWithResources]] = {}
+        # counts the changes, so a save can tell whether the blackboard changed while it ran
+        self.revision = 0
+
+    def getResources(self) -> list[tuple[ResourceGroup, Resource]]:
+        resList = []
+        for tool in self.resources.values():
+            for rg in tool.values():
+                for res in rg.resources.values():
+                    resList.append((rg, res))
+        return resList
+
+    def addResource(self, resourceGroup: ResourceGroup, resource: Resource) -> bool:
+        toolResources = self.resources.get(resourceGroup.toolId)
+        if toolResources is None:
+            toolResources = {}
+            self.resources[resourceGroup.toolId] = toolResources
+
+        toolGroup = toolResources.get(resourceGroup.URL)
+        if toolGroup is None:
+            toolGroup = ResourceGroup(resourceGroup.name,
+                                      resourceGroup.toolId,
+                                      resourceGroup.URL,
+                                      resourceGroup.version)
+            toolResources[resourceGroup.URL] = toolGroup
+            if self.index is not None:
+                self.index.add((toolGroup.toolId, toolGroup.URL), self.user)
+
+        newRes = Resource(resource.name, resource.id, resource.URL)
+        self.revision += 1
+        return toolGroup.addResource(newRes)
+
+    def removeResource(self, ref: ResourceRef) -> bool:
+        toolResources = self.resources.get(ref.toolId)
+        if toolResources is None:
+            return False
+
+        toolGroup = toolResources.get(ref.resourceGroupURL)
+        if toolGroup is None:
+            return False
+
+        self.revision += 1
+        return toolGroup.removeResource(ref.URL)
+
+    def expandResource(self, toolId, resourceGroupURL, resourceURL) -> tuple[ResourceGroup, Resource] | None:
+        if toolId in self.resources:
+            if resourceGroupURL in self.resources[toolId]:
+                group = self.resources[toolId][resourceGroupURL]
+                if resourceURL in group.resources:
+                    return group, group.resources[resourceURL]
+        return None
+
+    def indexLink(self, link: LinkWithResources):
+        for key in link_keys(link):
+            self.adjacency.setdefault(key, set()).add(link)
+            self.groupLinks.setdefault(key[:2], set()).add(link)
+
+    def unindexLink(self, link: LinkWithResources):
+        for key in link_keys(link):
+            for index, indexKey in [(self.adjacency, key), (self.groupLinks, key[:2])]:
+                links = index.get(indexKey)
+                if links is not None:
+                    links.discard(link)
+                    if len(links) == 0:
+                        del index[indexKey]
+
+    def linksOf(self, toolId: str, resourceGroupURL: str, URL: str) -> list[LinkWithResources]:
+        return list(self.adjacency.get((toolId, resourceGroupURL, URL), ()))
+
+    def getSlice(self, toolId: str = "", resourceGroupURL: str = "") -> \
+            tuple[list[tuple[ResourceGroup, Resource]], list[LinkWithResources]]:
+        # the resources and the links of a tool's resource groups, or of one of them, or of the
+        # whole blackboard when toolId is empty
+        if toolId == "":
+            return self.getResources(), list(self.changedLinks)
+        groups = [rg for rg in self.resources.get(toolId, {}).values()
+                  if resourceGroupURL == "" or rg.URL == resourceGroupURL]
+        resources = [(rg, res) for rg in groups for res in rg.resources.values()]
+        links = set()
+        for key, groupLinks in self.groupLinks.items():
+            if key[0] == toolId and (resourceGroupURL == "" or key[1] == resourceGroupURL):
+                links.update([link for link in groupLinks if link in self.changedLinks])
+        return resources, list(links)
+
+    def linkResources(self, links: list[LinkWithResources]):
+        self.revision += 1
+        updates = []
+        for lk in links:
+            if lk in self.changedLinks:
+                continue
+            if lk in self.deletedLinks:
+                self.deletedLinks.remove(lk)
+                self.unindexLink(lk)
+            self.changedLinks.add(lk)
+            self.indexLink(lk)
+            updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.AddLink, link=lk.toGrpc()))
+        return updates
+
+    def unlinkResources(self, links):
+        self.revision += 1
+        updates = []
+        for lk in links:
+            if lk not in self.changedLinks:
+                continue
+            self.changedLinks.remove(lk)
+            self.deletedLinks.add(lk)
+            updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveLink, link=lk.toGrpc()))
+        return updates
+
+    def applyResourceGroupChange(self, resourceGroupChange: ResourceGroupChange) -> list[depi_pb2.Update]:
+        # brings the blackboard in line with a change of the resource group made on main
+        rg = self.resources.get(resourceGroupChange.toolId, {}).get(resourceGroupChange.URL)
+        if rg is None or rg.version == resourceGroupChange.version:
+            return []
+
+        updates = [depi_pb2.Update(
+            updateType=depi_pb2.UpdateType.ResourceGroupVersionChanged,
+            versionChange=depi_pb2.ResourceGroupVersionChange(
+                name=resourceGroupChange.name,
+                URL=resourceGroupChange.URL,
+                toolId=resourceGroupChange.toolId,
+                version=rg.version,
+                new_version=resourceGroupChange.version))]
+        rg.version = resourceGroupChange.version
+        self.revision += 1
+
+        for resourceChange in resourceGroupChange.resources.values():
+            if resourceChange.URL not in rg.resources:
+                continue
+            if resourceChange.changeType == int(depi_pb2.ChangeType.Removed):
+                updates.extend(self.removeChangedResource(rg, resourceChange.URL))
+            elif resourceChange.changeType == int(depi_pb2.ChangeType.Renamed) or \
+                    (resourceChange.changeType == int(depi_pb2.ChangeType.Modified) and
+                     (resourceChange.URL != resourceChange.newURL)):
+                updates.extend(self.renameChangedResource(rg, resourceChange))
+                updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RenameResource,
+                                               rename=resourceChange.toGrpc()))
+        return updates
+
+    def removeChangedResource(self, rg: ResourceGroup, URL: str) -> list[depi_pb2.Update]:
+        updates = [depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveResource,
+                                   resource=rg.resources[URL].toGrpc(rg))]
+        rg.resources.pop(URL)
+        for link in self.linksOf(rg.toolId, rg.URL, URL):
+            if link in self.changedLinks:
+                updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveLink, link=link.toGrpc()))
+                self.changedLinks.remove(link)
+                self.deletedLinks.add(link)
+        return updates
+
+    def renameChangedResource(self, rg: ResourceGroup, resourceChange) -> list[depi_pb2.Update]:
+        key = (rg.toolId, rg.URL, resourceChange.URL)
+        res = rg.resources.pop(resourceChange.URL)
+        links = self.linksOf(*key)
+        updates = []
+        for link in links:
+            if link not in self.changedLinks:
+                continue
+            fromRes = link.fromRes.toGrpc(link.fromResourceGroup)
+            toRes = link.toRes.toGrpc(link.toResourceGroup)
+            fromResNew = link.fromRes.toGrpc(link.fromResourceGroup)
+            toResNew = link.toRes.toGrpc(link.toResourceGroup)
+            for end, grpcRes in [(resource_key(link.fromResourceGroup, link.fromRes), fromResNew),
+                                 (resource_key(link.toResourceGroup, link.toRes), toResNew)]:
+                if end == key:
+                    grpcRes.URL = resourceChange.newURL
+                    grpcRes.name = resourceChange.newName
+                    grpcRes.id = resourceChange.newId
+            updates.append(depi_pb2.Update(
+                updateType=depi_pb2.UpdateType.RenameLink,
+                renameLink=depi_pb2.ResourceLinkRename(fromRes=fromRes, fromResNew=fromResNew,
+                                                       toRes=toRes, toResNew=toResNew)))
+
+        # the links hash on the resource URL, they are taken out of the sets while it changes
+        changed = [link in self.changedLinks for link in links]
+        for link in links:
+            self.unindexLink(link)
+            self.changedLinks.discard(link)
+            self.deletedLinks.discard(link)
+            if resource_key(link.fromResourceGroup, link.fromRes) == key:
+                link.fromRes = res
+            if resource_key(link.toResourceGroup, link.toRes) == key:
+                link.toRes = res
+        res.rekey(resourceChange.newName, resourceChange.newId, resourceChange.newURL)
+        rg.resources[res.URL] = res
+        for link, isChanged in zip(links, changed):
+            link.rekey()
+            (self.changedLinks if isChanged else self.deletedLinks).add(link)
+            self.indexLink(link)
+        return updates
+
+    def removeSaved(self, resources: list[tuple[ResourceGroup, Resource]],
+                    links: list[LinkWithResources]) -> list[depi_pb2.Update]:
+        # takes what a save wrote to the Depi off the blackboard and keeps what was added since
+        self.revision += 1
+        updates = []
+        saved = set([resource_key(rg, res) for rg, res in resources])
+        for tool in self.resources.values():
+            for rg in tool.values():
+                for URL, res in list(rg.resources.items()):
+                    if resource_key(rg, res) in saved:
+                        del rg.resources[URL]
+                        updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveResource,
+                                                       resource=res.toGrpc(rg)))
+        for link in links:
+            if link in self.changedLinks:
+                self.changedLinks.remove(link)
+                self.unindexLink(link)
+                updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveLink, link=link.toGrpc()))
+        return updates
+
+    def estimatedSize(self) -> int:
+        resources = sum([len(rg.resources) for tool in self.resources.values() for rg in tool.values()])
+        return resources * BLACKBOARD_RESOURCE_SIZE + \
+            (len(self.changedLinks) + len(self.deletedLinks)) * BLACKBOARD_LINK_SIZE
+
+    def isEmpty(self) -> bool:
+        return len(self.resources) == 0 and len(self.changedLinks) == 0 and len(self.deletedLinks) == 0
+
+    def toJson(self) -> dict:
+        # the groups are listed once and the link ends refer to them by position, a group that is
+        # only on links and not on the blackboard has None for its resources
+        groups = []
+        groupIds = {}
+
+        def groupId(rg: ResourceGroup) -> int:
+            key = (rg.toolId, rg.URL)
+            if key not in groupIds:
+                groupIds[key] = len(groups)
+                groups.append([rg.name, rg.toolId, rg.URL, rg.version, None])
+            return groupIds[key]
+
+        for tool in self.resources.values():
+            for rg in tool.values():
+                groups[groupId(rg)][4] = [[res.name, res.id, res.URL] for res in rg.resources.values()]
+
+        def linkJson(link: LinkWithResources) -> list:
+            return [groupId(link.fromResourceGroup), link.fromRes.name, link.fromRes.id, link.fromRes.URL,
+                    groupId(link.toResourceGroup), link.toRes.name, link.toRes.id, link.toRes.URL]
+
+        changedLinks = [linkJson(link) for link in self.changedLinks]
+        deletedLinks = [linkJson(link) for link in self.deletedLinks]
+        return {"groups": groups, "changedLinks": changedLinks, "deletedLinks": deletedLinks,
+                "revision": self.revision}
+
+    @staticmethod
+    def fromJson(data: dict, user: str | None = None, index: BlackboardIndex | None = None):
+        blackboard = Blackboard(user, index)
+        groups = []
+        for name, toolId, URL, version, resources in data["groups"]:
+            rg = ResourceGroup(name, toolId, URL, version)
+            groups.append(rg)
+            if resources is None:
+                continue
+            blackboard.resources.setdefault(toolId, {})[URL] = rg
+            if index is not None:
+                index.add((toolId, URL), user)
+            for resName, resId, resURL in resources:
+                rg.addResource(Resource(resName, resId, resURL))
+
+        def end(rgId: int, name: str, id: str, URL: str) -> tuple[ResourceGroup, Resource]:
+            rg = groups[rgId]
+            res = rg.resources.get(URL)
+            if res is None:
+                res = Resource(name, id, URL)
+            return rg, res
+
+        for links, linkSet in [(data["changedLinks"], blackboard.changedLinks),
+                               (data["deletedLinks"], blackboard.deletedLinks)]:
+            for values in links:
+                fromRg, fromRes = end(*values[:4])
+                toRg, toRes = end(*values[4:])
+                link = LinkWithResources(fromRg, fromRes, toRg, toRes)
+                linkSet.add(link)
+                blackboard.indexLink(link)
+        blackboard.revision = data.get("revision", 0)
+        return blackboard
+
+    def detach(self):
+        # called when the blackboard is replaced, its resource groups leave the index
+        if self.index is None:
+            return
+        for tool in self.resources.values():
+            for rg in tool.values():
+                self.index.remove((rg.toolId, rg.URL), self.user)
+
+
+class BlackboardStore:
+    def __init__(self, index: BlackboardIndex, spillDir: str = "blackboard_spill", userQuota: int = 0,
+                 totalQuota: int = 0, idleTimeout: float = 0, spillGrace: float = BLACKBOARD_SPILL_GRACE):
+        self.index = index
+        self.spillDir = spillDir
+        self.userQuota = userQuota
+        self.totalQuota = totalQuota
+        self.idleTimeout = idleTimeout
+        self.spillGrace = spillGrace
+        # guards the tables below, it is never held while a blackboard is read, written or measured
+        self.lock = threading.Lock()
+        self.blackboards: dict[str, Blackboard] = {}
+        # user -> estimated size of the blackboard in memory, taken when a request releases it
+        self.sizes: dict[str, int] = {}
+        # user -> spill file
+        self.spilled: dict[str, str] = {}
+        self.lastUsed: dict[str, float] = {}
+        self.reloadedAt: dict[str, float] = {}
+        self.inUse: dict[str, int] = {}
+        # one lock per user, held while a request works on the user's blackboard and while it is
+        # spilled or reloaded
+        self.userLocks: dict[str, threading.RLock] = {}
+        self.spills = 0
+        self.reloads = 0
+
+    def __contains__(self, user: str) -> bool:
+        with self.lock:
+            return user in self.blackboards or user in self.spilled
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(set(self.blackboards) | set(self.spilled))
+
+    def __iter__(self):
+        with self.lock:
+            return iter(sorted(set(self.blackboards) | set(self.spilled)))
+
+    def __getitem__(self, user: str) -> Blackboard:
+        with self.userLock(user):
+            return self.load(user)
+
+    def __setitem__(self, user: str, blackboard: Blackboard):
+        size = blackboard.estimatedSize()
+        with self.lock:
+            filename = self.spilled.pop(user, None)
+            self.blackboards[user] = blackboard
+            self.sizes[user] = size
+            self.lastUsed[user] = time.monotonic()
+        if filename is not None and os.path.exists(filename):
+            os.remove(filename)
+
+    def userLock(self, user: str) -> threading.RLock:
+        with self.lock:
+            return self.userLocks.setdefault(user, threading.RLock())
+
+    @contextlib.contextmanager
+    def use(self, user: str):
+        # Holds the user's lock, so the changes of a request are applied to the blackboard as a
+        # whole. The blackboard is not spilled while it is used, the quotas are checked when it is
+        # released.
+        with self.lock:
+            userLock = self.userLocks.setdefault(user, threading.RLock())
+            self.inUse[user] = self.inUse.get(user, 0) + 1
+        try:
+            with userLock:
+                blackboard = self.load(user)
+                try:
+                    yield blackboard
+                finally:
+                    size = blackboard.estimatedSize()
+                    with self.lock:
+                        if self.blackboards.get(user) is blackboard:
+                            self.sizes[user] = size
+        finally:
+            with self.lock:
+                self.inUse[user] -= 1
+                if self.inUse[user] == 0:
+                    del self.inUse[user]
+                self.lastUsed[user] = time.monotonic()
+                candidates = self.spillCandidatesLocked()
+            for candidate in candidates:
+                self.spill(candidate)
+
+    def load(self, user: str) -> Blackboard:
+        # called with the user's lock held, the spill file is read without holding the store's lock
+        with self.lock:
+            self.lastUsed[user] = time.monotonic()
+            blackboard = self.blackboards.get(user)
+            if blackboard is not None:
+                return blackboard
+            filename = self.spilled.get(user)
+            if filename is None:
+                # empty blackboards are dropped instead of spilled
+                blackboard = Blackboard(user, self.index)
+                self.blackboards[user] = blackboard
+                self.sizes[user] = 0
+                return blackboard
+
+        with gzip.open(filename, "rt", encoding="utf-8") as spill_file:
+            blackboard = Blackboard.fromJson(json.load(spill_file), user, self.index)
+        size = blackboard.estimatedSize()
+        with self.lock:
+            self.spilled.pop(user, None)
+            self.blackboards[user] = blackboard
+            self.sizes[user] = size
+            self.reloadedAt[user] = time.monotonic()
+            self.reloads += 1
+        os.remove(filename)
+        return blackboard
+
+    def spillFile(self, user: str) -> str:
+        return os.path.join(self.spillDir, hashlib.sha256(user.encode("utf-8")).hexdigest() + ".json.gz")
+
+    def spill(self, user: str):
+        # Spills the user's blackboard unless a request is using it or waiting for it. The user's
+        # lock keeps requests off the blackboard while it is written, the store's lock is only
+        # taken to look at and change the tables.
+        userLock = self.userLock(user)
+        if not userLock.acquire(blocking=False):
+            return
+        try:
+            with self.lock:
+                blackboard = self.blackboards.get(user)
+                if blackboard is None or user in self.inUse:
+                    return
+
+            filename = None
+            if not blackboard.isEmpty():
+                os.makedirs(self.spillDir, exist_ok=True)
+                filename = self.spillFile(user)
+                with gzip.open(filename + ".tmp", "wt", encoding="utf-8") as spill_file:
+                    json.dump(blackboard.toJson(), spill_file, separators=(",", ":"))
+                os.replace(filename + ".tmp", filename)
+
+            with self.lock:
+                # a request that came in meanwhile is waiting for the user's lock, it keeps the
+                # blackboard in memory
+                if user in self.inUse:
+                    spilled = False
+                else:
+                    spilled = True
+                    del self.blackboards[user]
+                    size = self.sizes.pop(user, 0)
+                    self.reloadedAt.pop(user, None)
+                    if filename is not None:
+                        self.spilled[user] = filename
+                        self.spills += 1
+            if not spilled:
+                if filename is not None:
+                    os.remove(filename)
+            elif filename is not None:
+                logging.info("Spilled the blackboard of {} ({} bytes estimated)".format(user, size))
+        finally:
+            userLock.release()
+
+    def spillCandidatesLocked(self, idle: bool = False) -> list[str]:
+        # A blackboard that was reloaded stays in memory for spillGrace seconds, so one that is
+        # over a quota isn't written and read back for every request that uses it.
+        now = time.monotonic()
+
+        def spillable(user):
+            return user not in self.inUse and now - self.reloadedAt.get(user, now - self.spillGrace) >= self.spillGrace
+
+        candidates = []
+        if idle and self.idleTimeout > 0:
+            candidates = [user for user in self.blackboards
+                          if user not in self.inUse and now - self.lastUsed.get(user, now) > self.idleTimeout]
+        if self.userQuota > 0:
+            candidates.extend([user for user, size in self.sizes.items()
+                               if size > self.userQuota and user not in candidates and spillable(user)])
+        if self.totalQuota > 0:
+            total = sum([size for user, size in self.sizes.items() if user not in candidates])
+            for user in sorted(self.blackboards, key=lambda u: self.lastUsed.get(u, 0)):
+                if total <= self.totalQuota:
+                    break
+                if user not in candidates and spillable(user):
+                    total -= self.sizes.get(user, 0)
+                    candidates.append(user)
+        return candidates
+
+    def enforceQuotas(self):
+        with self.lock:
+            candidates = self.spillCandidatesLocked()
+        for user in candidates:
+            self.spill(user)
+
+    def spillIdle(self):
+        # run by the session check, it also spills the blackboards whose grace period ran out
+        with self.lock:
+            candidates = self.spillCandidatesLocked(idle=True)
+        for user in candidates:
+            self.spill(user)
+
+    def getStats(self) -> dict:
+        with self.lock:
+            return {"sizes": dict(self.sizes),
+                    "spilled": len(self.spilled), "spills": self.spills, "reloads": self.reloads}
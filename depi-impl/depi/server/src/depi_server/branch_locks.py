@@ -0,0 +1,166 @@
+import threading
+import time
+
+# One reader/writer lock per branch. Read RPCs share a branch, write RPCs are exclusive on the
+# branch they change, and operations on different branches do not wait on each other.
+# Operations that need several branches take them through acquire() which locks them in
+# sorted name order, so two such operations can never deadlock each other.
+#
+# Every release of a write lock also changes the branch version, which read RPCs hand out as a
+# token so that a client can ask whether anything changed since its last call. The token starts
+# with the time the server was started so tokens from an earlier run never match.
+
+
+class RWLock:
+    def __init__(self, name: str):
+        self.name = name
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.waitingWriters = 0
+        self.version = 0
+
+        self.readAcquires = 0
+        self.writeAcquires = 0
+        self.readContended = 0
+        self.writeContended = 0
+        self.readWaitTime = 0.0
+        self.writeWaitTime = 0.0
+        self.maxWaitTime = 0.0
+
+    def acquireRead(self):
+        with self.cond:
+            # waiting writers go first so a steady stream of readers can't starve them
+            if self.writer or self.waitingWriters > 0:
+                start = time.perf_counter()
+                while self.writer or self.waitingWriters > 0:
+                    self.cond.wait()
+                waited = time.perf_counter() - start
+                self.readContended += 1
+                self.readWaitTime += waited
+                self.maxWaitTime = max(self.maxWaitTime, waited)
+            self.readers += 1
+            self.readAcquires += 1
+
+    def releaseRead(self):
+        with self.cond:
+            self.readers -= 1
+            if self.readers == 0:
+                self.cond.notify_all()
+
+    def acquireWrite(self):
+        with self.cond:
+            if self.writer or self.readers > 0:
+                start = time.perf_counter()
+                self.waitingWriters += 1
+                try:
+                    while self.writer or self.readers > 0:
+                        self.cond.wait()
+                finally:
+                    self.waitingWriters -= 1
+                waited = time.perf_counter() - start
+                self.writeContended += 1
+                self.writeWaitTime += waited
+                self.maxWaitTime = max(self.maxWaitTime, waited)
+            self.writer = True
+            self.writeAcquires += 1
+
+    def releaseWrite(self):
+        with self.cond:
+            self.writer = False
+            self.version += 1
+            self.cond.notify_all()
+
+    def getStats(self) -> dict:
+        with self.cond:
+            return {"readers": self.readers,
+                    "writer": self.writer,
+                    "waitingWriters": self.waitingWriters,
+                    "readAcquires": self.readAcquires,
+                    "writeAcquires": self.writeAcquires,
+                    "readContended": self.readContended,
+                    "writeContended": self.writeContended,
+                    "readWaitTime": self.readWaitTime,
+                    "writeWaitTime": self.writeWaitTime,
+                    "maxWaitTime": self.maxWaitTime}
+
+
+class BranchLocks:
+    def __init__(self, reads: list[tuple[str, RWLock]], writes: set[str]):
+        self.locks = reads
+        self.writes = writes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def release(self):
+        for name, lock in reversed(self.locks):
+            if name in self.writes:
+                lock.releaseWrite()
+            else:
+                lock.releaseRead()
+        self.locks = []
+
+
+class BranchLockManager:
+    def __init__(self):
+        self.locks: dict[str, RWLock] = {}
+        self.locksLock = threading.Lock()
+        self.epoch = "{:x}".format(time.time_ns() // 1000)
+
+    def getLock(self, branchName: str) -> RWLock:
+        with self.locksLock:
+            lock = self.locks.get(branchName)
+            if lock is None:
+                lock = RWLock(branchName)
+                self.locks[branchName] = lock
+            return lock
+
+    def acquireRead(self, branchName: str):
+        self.getLock(branchName).acquireRead()
+
+    def releaseRead(self, branchName: str):
+        self.getLock(branchName).releaseRead()
+
+    def acquireWrite(self, branchName: str):
+        self.getLock(branchName).acquireWrite()
+
+    def releaseWrite(self, branchName: str):
+        self.getLock(branchName).releaseWrite()
+
+    def versionToken(self, branchName: str) -> str:
+        lock = self.getLock(branchName)
+        with lock.cond:
+            return "{}-{}".format(self.epoch, lock.version)
+
+    def acquire(self, reads=(), writes=()) -> BranchLocks:
+        # A branch that is both read and written is only write locked
+        writes = set(writes)
+        names = sorted(set(reads) | writes)
+        acquired = BranchLocks([], writes)
+        try:
+            for name in names:
+                lock = self.getLock(name)
+                if name in writes:
+                    lock.acquireWrite()
+                else:
+                    lock.acquireRead()
+                acquired.locks.append((name, lock))
+        except BaseException:
+            acquired.release()
+            raise
+        return acquired
+
+    def read(self, branchName: str) -> BranchLocks:
+        return self.acquire(reads=[branchName])
+
+    def write(self, *branchNames: str) -> BranchLocks:
+        return self.acquire(writes=branchNames)
+
+    def getStats(self) -> dict[str, dict]:
+        with self.locksLock:
+            locks = list(self.locks.values())
+        return {lock.name: lock.getStats() for lock in locks}
@@ -0,0 +1,51 @@
+import struct
+import tempfile
+
+import depi_pb2
+
+# The records of a BulkImport are spooled to a temporary file while the client sends them, in
+# chunks of at most chunkSize records, so the server holds one chunk of an import in memory
+# however large the import is. The chunks are read back one at a time when they are applied.
+
+BULK_IMPORT_CHUNK_SIZE = 1000
+
+
+class ImportSpool:
+    def __init__(self, field: str, chunkSize: int = BULK_IMPORT_CHUNK_SIZE):
+        # field is the repeated field of BulkImportRequest that this spool holds
+        self.field = field
+        self.chunkSize = chunkSize
+        self.file = tempfile.TemporaryFile()
+        self.pending = depi_pb2.BulkImportRequest()
+        self.count = 0
+        self.chunks = 0
+
+    def add(self, record):
+        getattr(self.pending, self.field).append(record)
+        self.count += 1
+        if len(getattr(self.pending, self.field)) >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        if len(getattr(self.pending, self.field)) == 0:
+            return
+        data = self.pending.SerializeToString()
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(data)
+        self.pending = depi_pb2.BulkImportRequest()
+        self.chunks += 1
+
+    def readChunks(self):
+        self.flush()
+        self.file.seek(0)
+        while True:
+            header = self.file.read(4)
+            if len(header) < 4:
+                return
+            (size,) = struct.unpack(">I", header)
+            chunk = depi_pb2.BulkImportRequest()
+            chunk.ParseFromString(self.file.read(size))
+            yield getattr(chunk, self.field)
+
+    def close(self):
+        self.file.close()
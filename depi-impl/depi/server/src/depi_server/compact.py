@@ -0,0 +1,98 @@
+import depi_pb2
+import grpc
+
+# The compact form of the listing responses. Resource groups and resources are sent once in the
+# tables of a CompactListing and the links refer to them by index, which saves repeating the
+# group name, URL and version for every resource and the resources for every link that uses
+# them. resourceList holds the indexes of the resources the response lists on their own, in
+# order. The tables belong to one response, or to one chunk of a stream.
+
+COMPACT_CHUNK_SIZE = 500
+
+
+def negotiate_compression(request, context):
+    # gzip is optional per call, it costs server CPU that a client on a fast link may not want
+    # to pay for
+    if request.compress and context is not None:
+        context.set_compression(grpc.Compression.Gzip)
+
+
+class ListingEncoder:
+    def __init__(self):
+        self.listing = depi_pb2.CompactListing()
+        self.groups = {}
+        self.resources = {}
+
+    def groupIndex(self, res: depi_pb2.Resource) -> int:
+        key = (res.toolId, res.resourceGroupName, res.resourceGroupURL, res.resourceGroupVersion)
+        index = self.groups.get(key)
+        if index is None:
+            index = len(self.listing.groups)
+            self.groups[key] = index
+            self.listing.groups.append(depi_pb2.CompactResourceGroup(
+                toolId=res.toolId, name=res.resourceGroupName, URL=res.resourceGroupURL,
+                version=res.resourceGroupVersion))
+        return index
+
+    def resourceIndex(self, res: depi_pb2.Resource) -> int:
+        key = (res.toolId, res.resourceGroupName, res.resourceGroupURL, res.resourceGroupVersion,
+               res.name, res.URL, res.id, res.deleted)
+        index = self.resources.get(key)
+        if index is None:
+            index = len(self.listing.resources)
+            self.resources[key] = index
+            self.listing.resources.append(depi_pb2.CompactResource(
+                group=self.groupIndex(res), name=res.name, URL=res.URL, id=res.id, deleted=res.deleted))
+        return index
+
+    def addResource(self, res: depi_pb2.Resource):
+        self.listing.resourceList.append(self.resourceIndex(res))
+
+    def addLink(self, link: depi_pb2.ResourceLink):
+        self.listing.links.append(depi_pb2.CompactLink(
+            fromRes=self.resourceIndex(link.fromRes), toRes=self.resourceIndex(link.toRes),
+            deleted=link.deleted, dirty=link.dirty, lastCleanVersion=link.lastCleanVersion,
+            inferredDirtiness=[depi_pb2.CompactInferredDirtiness(resource=self.resourceIndex(inf.resource),
+                                                                 lastCleanVersion=inf.lastCleanVersion)
+                               for inf in link.inferredDirtiness]))
+
+
+def compact_response(response, resourceField=None, linkField=None):
+    # moves the listed resources and links of a unary response into its compact field
+    if not response.ok:
+        return response
+    # the response may be shared through the response cache, the compact one is a copy
+    compacted = type(response)()
+    compacted.CopyFrom(response)
+    encoder = ListingEncoder()
+    if resourceField is not None:
+        for res in getattr(compacted, resourceField):
+            encoder.addResource(res)
+        compacted.ClearField(resourceField)
+    if linkField is not None:
+        for link in getattr(compacted, linkField):
+            encoder.addLink(link)
+        compacted.ClearField(linkField)
+    compacted.compact.CopyFrom(encoder.listing)
+    return compacted
+
+
+def compact_stream(responseType, responses, resourceField=None, linkField=None, chunkSize=COMPACT_CHUNK_SIZE):
+    # packs the one item per message responses of a stream into chunks of chunkSize items
+    encoder = ListingEncoder()
+    count = 0
+    for response in responses:
+        if not response.ok:
+            yield response
+            continue
+        if resourceField is not None:
+            encoder.addResource(getattr(response, resourceField))
+        if linkField is not None:
+            encoder.addLink(getattr(response, linkField))
+        count += 1
+        if count >= chunkSize:
+            yield responseType(ok=True, msg="", compact=encoder.listing)
+            encoder = ListingEncoder()
+            count = 0
+    if count > 0:
+        yield responseType(ok=True, msg="", compact=encoder.listing)
@@ -34,6 +34,30 @@ class DepiDB:
     def getTagList(self):
         return []
 
+class BranchChanges:
+    # The net changes on a branch since an earlier version: the current state of everything that
+    # was added or changed, and the keys of what was removed.
+    def __init__(self, version: str):
+        self.version = version
+        self.resourceGroups: list[ResourceGroup] = []
+        self.removedResourceGroups: list[tuple[str, str]] = []
+        self.resources: list[tuple[ResourceGroup, Resource]] = []
+        self.removedResources: list[ResourceRef] = []
+        self.links: list[LinkWithResources] = []
+        self.removedLinks: list[Link] = []
+
+
+def link_dirty_count(dirty: bool, inferredDirty: bool, deleted: bool) -> tuple[int, int, int]:
+    # what one link adds to the dirty summary of the resource group it points into
+    if deleted:
+        return 0, 0, 1
+    return int(dirty), int(inferredDirty), 0
+
+
+def add_counts(counts: tuple[int, int, int], other: tuple[int, int, int], sign: int = 1) -> tuple[int, int, int]:
+    return counts[0] + sign * other[0], counts[1] + sign * other[1], counts[2] + sign * other[2]
+
+
 class DepiBranch:
     def __init__(self, name):
         self.name = name
@@ -138,3 +162,26 @@ class DepiBranch:
     def saveBranchState(self):
         pass
 
+    def getVersion(self) -> str:
+        return ""
+
+    def getChangesSince(self, version: str) -> BranchChanges | None:
+        # None when the changes since version are not known, the caller has to read everything
+        return None
+
+    def getDirtySummary(self) -> dict[tuple[str, str], tuple[int, int, int]]:
+        # (toolId, resource group URL) -> the number of links into the group that are dirty, that
+        # have inferred dirtiness and that are deleted. Groups with no such links are left out.
+        counts = {}
+        for link in self.getAllLinks():
+            key = (link.toResourceGroup.toolId, link.toResourceGroup.URL)
+            count = link_dirty_count(link.dirty, len(link.inferredDirtiness) > 0, link.deleted)
+            if count != (0, 0, 0):
+                counts[key] = add_counts(counts.get(key, (0, 0, 0)), count)
+        return counts
+
+    def restoreVersion(self, version: str):
+        # Drops everything written to the branch since getVersion() returned version, so that a
+        # write made of several steps can be undone when a later step fails. The caller holds the
+        # branch's write lock from getVersion() on.
+        raise NotImplementedError("Branch {} can't be restored to an earlier version".format(self.name))
@@ -1,10 +1,12 @@
 from depi_server.model.depi_model import Resource, ResourceRef, ResourceGroup, Link, LinkWithResources, ResourceGroupChange, ChangeType, \
     ResourceRefPattern, ResourceLinkPattern
-from depi_server.db.depi_db import DepiDB, DepiBranch
+from depi_server.db.depi_db import DepiDB, DepiBranch, BranchChanges
+from depi_server.metrics.depi_metrics import timed_db_operation, DB_CONNECTION_WAIT, DB_CONNECTIONS_CREATED
 import MySQLdb
 import MySQLdb.cursors
 import re
 import logging
+import time
 from threading import Lock
 
 global config
@@ -36,9 +38,11 @@ class DoltDB(DepiDB):
                                cursorclass=MySQLdb.cursors.DictCursor)
 
     def getDBConnection(self):
+        start = time.perf_counter()
         self.pool_lock.acquire()
         try:
             if len(self.connections) == 0:
+                DB_CONNECTIONS_CREATED.inc()
                 return self._createDBConnection()
             conn = self.connections.pop()
             try:
@@ -48,10 +52,12 @@ class DoltDB(DepiDB):
                 cursor.close()
                 return conn
             except Exception:
+                DB_CONNECTIONS_CREATED.inc()
                 return self._createDBConnection()
 
         finally:
             self.pool_lock.release()
+            DB_CONNECTION_WAIT.observe(time.perf_counter() - start)
 
     def releaseDBConnection(self, conn: MySQLdb.Connection):
         self.pool_lock.acquire()
@@ -253,9 +259,133 @@ class DoltBranch(DepiBranch):
             self.parent.releaseDBConnection(self.db)
             self.db = None
 
+    @timed_db_operation("dolt", "saveBranchState")
     def saveBranchState(self):
         self.commit()
 
+    def getVersion(self) -> str:
+        conn = self.get_read_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("select hashof('HEAD') as version")
+            return cursor.fetchall()[0]["version"]
+        finally:
+            cursor.close()
+            self.parent.releaseDBConnection(conn)
+
+    @timed_db_operation("dolt", "getDirtySummary")
+    def getDirtySummary(self) -> dict[tuple[str, str], tuple[int, int, int]]:
+        # one aggregate query, the server caches the result per branch version
+        conn = self.get_read_connection()
+        cursor = conn.cursor()
+        counts = {}
+        try:
+            cursor.execute("select l.to_tool_id as tool_id, l.to_rg_url as rg_url, "+
+                           " sum(case when l.deleted=false and l.dirty=true then 1 else 0 end) as dirty, "+
+                           " sum(case when l.deleted=false and "+
+                           "  exists(select infd.from_tool_id from inferred_dirtiness infd where "+
+                           "  infd.from_tool_id=l.from_tool_id and infd.from_rg_url=l.from_rg_url and "+
+                           "  infd.from_url=l.from_url and infd.to_tool_id=l.to_tool_id and "+
+                           "  infd.to_rg_url=l.to_rg_url and infd.to_url=l.to_url) "+
+                           "  then 1 else 0 end) as inferred_dirty, "+
+                           " sum(case when l.deleted=true then 1 else 0 end) as deleted "+
+                           " from link l group by l.to_tool_id, l.to_rg_url")
+            for row in cursor.fetchall():
+                count = (int(row["dirty"]), int(row["inferred_dirty"]), int(row["deleted"]))
+                if count != (0, 0, 0):
+                    counts[(row["tool_id"], row["rg_url"])] = count
+        finally:
+            cursor.close()
+            self.parent.releaseDBConnection(conn)
+        return counts
+
+    def restoreVersion(self, version: str):
+        # the operations commit as they go, the branch head is moved back to the version's commit
+        self.commit()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("CALL DOLT_RESET('--hard', %s)", (version, ))
+            cursor.fetchall()
+        finally:
+            cursor.close()
+            self.parent.releaseDBConnection(conn)
+            self.db = None
+
+    @timed_db_operation("dolt", "getChangesSince")
+    def getChangesSince(self, version: str) -> BranchChanges | None:
+        # the keys that changed come from the Dolt commit history, only those are read again
+        if re.fullmatch("[0-9a-v]{32}", version) is None:
+            return None
+        conn = self.get_read_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("select hashof('HEAD') as version")
+            current = cursor.fetchall()[0]["version"]
+            changes = BranchChanges(current)
+            if current == version:
+                return changes
+
+            # only a commit this branch was built on can be diffed against
+            cursor.execute("select count(*) as n from dolt_log where commit_hash=%s", (version,))
+            if cursor.fetchall()[0]["n"] == 0:
+                return None
+
+            rgKeys = set()
+            cursor.execute("select from_tool_id, from_url, to_tool_id, to_url "+
+                           "  from dolt_diff(%s, %s, 'resource_group')", (version, current))
+            for row in cursor.fetchall():
+                for side in ["from_", "to_"]:
+                    if row[side+"tool_id"] is not None:
+                        rgKeys.add((row[side+"tool_id"], row[side+"url"]))
+
+            resKeys = set()
+            cursor.execute("select from_tool_id, from_rg_url, from_url, to_tool_id, to_rg_url, to_url "+
+                           "  from dolt_diff(%s, %s, 'resource')", (version, current))
+            for row in cursor.fetchall():
+                for side in ["from_", "to_"]:
+                    if row[side+"tool_id"] is not None:
+                        resKeys.add((row[side+"tool_id"], row[side+"rg_url"], row[side+"url"]))
+
+            linkKeys = set()
+            for table in ["link", "inferred_dirtiness"]:
+                cursor.execute("select from_from_tool_id, from_from_rg_url, from_from_url, "+
+                               "  from_to_tool_id, from_to_rg_url, from_to_url, "+
+                               "  to_from_tool_id, to_from_rg_url, to_from_url, "+
+                               "  to_to_tool_id, to_to_rg_url, to_to_url "+
+                               "  from dolt_diff(%s, %s, %s)", (version, current, table))
+                for row in cursor.fetchall():
+                    for side in ["from_", "to_"]:
+                        if row[side+"from_tool_id"] is not None:
+                            linkKeys.add(((row[side+"from_tool_id"], row[side+"from_rg_url"], row[side+"from_url"]),
+                                          (row[side+"to_tool_id"], row[side+"to_rg_url"], row[side+"to_url"])))
+        finally:
+            cursor.close()
+            self.parent.releaseDBConnection(conn)
+
+        for (toolId, URL) in rgKeys:
+            rg = self.getResourceGroup(toolId, URL)
+            if rg is not None:
+                changes.resourceGroups.append(rg)
+            else:
+                changes.removedResourceGroups.append((toolId, URL))
+        for (toolId, rgURL, URL) in resKeys:
+            rr = ResourceRef(toolId, rgURL, URL)
+            found = self.getResource(rr)
+            if found is not None:
+                changes.resources.append(found)
+            else:
+                changes.removedResources.append(rr)
+        if len(linkKeys) > 0:
+            links = [Link(ResourceRef(*fromKey), ResourceRef(*toKey)) for (fromKey, toKey) in linkKeys]
+            changes.links = self.expandLinks(links)
+            found = set([(lk.fromResourceGroup.toolId, lk.fromResourceGroup.URL, lk.fromRes.URL,
+                          lk.toResourceGroup.toolId, lk.toResourceGroup.URL, lk.toRes.URL) for lk in changes.links])
+            changes.removedLinks = [lk for lk in links
+                                    if (lk.fromRes.toolId, lk.fromRes.resourceGroupURL, lk.fromRes.URL,
+                                        lk.toRes.toolId, lk.toRes.resourceGroupURL, lk.toRes.URL) not in found]
+        return changes
+
     def markResourcesClean(self, resourceRefs: list[ResourceRef]):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -271,6 +401,7 @@ class DoltBranch(DepiBranch):
             raise exc
 
 
+    @timed_db_operation("dolt", "markLinksClean")
     def markLinksClean(self, links: list[Link], propagateCleanliness: bool):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -291,6 +422,7 @@ class DoltBranch(DepiBranch):
             self.abort()
             raise exc
 
+    @timed_db_operation("dolt", "markInferredDirtinessClean")
     def markInferredDirtinessClean(self, link: Link, dirtinessSource: ResourceRef, propagateCleanliness: bool,
                                    cursor=None) -> list[(Link,ResourceRef)]:
         closeCursor = False
@@ -418,6 +550,7 @@ class DoltBranch(DepiBranch):
             self.abort()
             raise e
 
+    @timed_db_operation("dolt", "addResources")
     def addResources(self, resources: list[tuple[ResourceGroup, Resource|None]]):
         self._addResourcesExt(resources, None)
 
@@ -437,6 +570,7 @@ class DoltBranch(DepiBranch):
             self.abort()
             raise e
 
+    @timed_db_operation("dolt", "addLinks")
     def addLinks(self, newLinks: list[LinkWithResources]) -> bool:
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -640,6 +774,7 @@ class DoltBranch(DepiBranch):
         rr.deleted = res.deleted
         return rr
 
+    @timed_db_operation("dolt", "getResources")
     def getResources(self, resPatterns: list[ResourceRefPattern], includeDeleted: bool) -> list[(ResourceGroup, Resource)]:
         tools = {}
         patterns = []
@@ -777,6 +912,7 @@ class DoltBranch(DepiBranch):
             cursor.close()
             self.parent.releaseDBConnection(conn)
 
+    @timed_db_operation("dolt", "getLinks")
     def getLinks(self, linkPatterns: list[ResourceLinkPattern]) -> list[LinkWithResources]:
         conn = self.get_read_connection()
         cursor = conn.cursor()
@@ -893,6 +1029,7 @@ class DoltBranch(DepiBranch):
             cursor.close()
             self.parent.releaseDBConnection(conn)
 
+    @timed_db_operation("dolt", "getDirtyLinks")
     def getDirtyLinks(self, resourceGroup: ResourceGroup, withInferred: bool) -> list[LinkWithResources]:
         conn = self.get_read_connection()
         cursor = conn.cursor()
@@ -1134,6 +1271,7 @@ class DoltBranch(DepiBranch):
             self.parent.releaseDBConnection(conn)
         return links
 
+    @timed_db_operation("dolt", "expandLinks")
     def expandLinks(self, linksToExpand: list[Link]) -> list[LinkWithResources]:
         links = []
 
@@ -1185,6 +1323,7 @@ class DoltBranch(DepiBranch):
             self.parent.releaseDBConnection(conn)
         return links
 
+    @timed_db_operation("dolt", "getAllLinks")
     def getAllLinks(self, includeDeleted=False) -> list[LinkWithResources]:
         links = []
         conn = self.get_read_connection()
@@ -1361,6 +1500,7 @@ class DoltBranch(DepiBranch):
             finally:
                 cursor2.close()
 
+    @timed_db_operation("dolt", "updateResourceGroup")
     def updateResourceGroup(self, resourceGroupChange: ResourceGroupChange) -> list[Link]:
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -1571,6 +1711,7 @@ class DoltBranch(DepiBranch):
         """, resources_to_delete)
 
 
+    @timed_db_operation("dolt", "getDependencyGraph")
     def getDependencyGraph(self, rr: ResourceRef, upstream: bool, maxDepth: int) -> list[LinkWithResources]:
         processedLinks = set()
 
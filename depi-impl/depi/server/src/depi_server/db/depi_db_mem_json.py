@@ -1,15 +1,61 @@
+import collections
 import os
 import re
 import json
 from depi_server.model.depi_model import Resource, ResourceGroup, Link, LinkWithResources, ResourceRef, ResourceGroupChange, ChangeType, \
     ResourceLinkPattern, ResourceRefPattern
-from depi_server.db.depi_db import DepiDB, DepiBranch
+from depi_server.db.depi_db import DepiDB, DepiBranch, BranchChanges, link_dirty_count, add_counts
+from depi_server.metrics.depi_metrics import timed_db_operation, DB_STATE_BYTES_WRITTEN
 import logging
 
+
+# Each saved version of a branch records which resource groups, resources and links changed since the
+# version before it. The branch collects the keys as it is modified, so that neither a save nor
+# getChangesSince() has to compare whole states.
+def ref_key(rr: ResourceRef) -> tuple[str, str, str]:
+    return rr.toolId, rr.resourceGroupURL, rr.URL
+
+
+def link_key(link: Link) -> tuple[tuple[str, str, str], tuple[str, str, str]]:
+    return ref_key(link.fromRes), ref_key(link.toRes)
+
+
+# The dirty summary is kept up to date the same way, only the links that changed in a save are
+# counted again. What each link counts for is kept for the links that count for something.
+def link_count(link: Link) -> tuple[tuple[str, str], tuple[int, int, int]]:
+    return (link.toRes.toolId, link.toRes.resourceGroupURL), link_dirty_count(
+        link.dirty, len(link.inferredDirtiness) > 0, link.deleted)
+
+
+def link_counts(links) -> dict:
+    counts = {}
+    for link in links:
+        (rgKey, count) = link_count(link)
+        if count != (0, 0, 0):
+            counts[link_key(link)] = (rgKey, count)
+    return counts
+
+
+def update_dirty_counts(counts: dict, rgKey: tuple[str, str], count: tuple[int, int, int], sign: int):
+    total = add_counts(counts.get(rgKey, (0, 0, 0)), count, sign)
+    if total == (0, 0, 0):
+        counts.pop(rgKey, None)
+    else:
+        counts[rgKey] = total
+
+
+def dirty_counts(linkCounts: dict) -> dict:
+    counts = {}
+    for (rgKey, count) in linkCounts.values():
+        update_dirty_counts(counts, rgKey, count, 1)
+    return counts
+
+
 class MemJsonDB(DepiDB):
     def __init__(self, config):
         super().__init__(config)
         self.stateDir: str = config.dbConfig["stateDir"]
+        self.changeHistorySize: int = config.dbConfig.get("changeHistorySize", 1000)
 
         self.branches: dict[str, "MemBranch"] = {"main": MemBranch(self, "main")}
         self.tags: dict[str, "MemBranch"] = {}
@@ -149,6 +195,35 @@ class MemBranch(DepiBranch):
             self.tools: dict[str, dict[str, ResourceGroup]] = {}
         else:
             self.tools: dict[str, dict[str, ResourceGroup]] = tools
+        # the resource group keys, resource keys and links (by key) changed since the last save,
+        # None if the branch didn't start from a saved version
+        self.pendingChanges: tuple[set, set, dict] | None = None
+        if links is None and tools is None:
+            self.pendingChanges = (set(), set(), {})
+        # (version, resource group keys, resource keys, link keys) changed in each saved version
+        self.changeHistory = collections.deque(maxlen=db.changeHistorySize)
+        # the dirty summary of the last saved version, and what each link counted for in it
+        self.linkCounts: dict = {}
+        self.dirtyCounts: dict[tuple[str, str], tuple[int, int, int]] = {}
+
+    def recordResourceGroupChange(self, toolId: str, URL: str, withResources=False):
+        if self.pendingChanges is not None:
+            self.pendingChanges[0].add((toolId, URL))
+            if withResources:
+                rg = self.tools.get(toolId, {}).get(URL)
+                if rg is not None:
+                    for resURL in rg.resources:
+                        self.pendingChanges[1].add((toolId, URL, resURL))
+
+    def recordResourceChange(self, toolId: str, rgURL: str, URL: str):
+        if self.pendingChanges is not None:
+            self.pendingChanges[1].add((toolId, rgURL, URL))
+
+    def recordLinkChange(self, link: Link):
+        # a link is recorded under its key when it changes, and again under the new key when it is
+        # rekeyed, the save looks at what the link is by then
+        if self.pendingChanges is not None:
+            self.pendingChanges[2][link_key(link)] = link
 
     def linkResMatches(self, pathSeparator, linkURL, resURL):
         if linkURL.endswith(pathSeparator):
@@ -189,9 +264,12 @@ class MemBranch(DepiBranch):
 
         newLinks = set([l.copy() for l in self.links])
         newCopy.links = newLinks
+        newCopy.linkCounts = dict(self.linkCounts)
+        newCopy.dirtyCounts = dict(self.dirtyCounts)
 
         return newCopy
 
+    @timed_db_operation("memjson", "saveBranchState")
     def saveBranchState(self):
         if self.isTag:
             raise Exception("Cannot save a tag")
@@ -203,13 +281,108 @@ class MemBranch(DepiBranch):
         branchJS = self.toJson()
         out_file = open(branchDir+"/"+str(self.lastVersion), "w")
         json.dump(branchJS, out_file, indent=2)
+        DB_STATE_BYTES_WRITTEN.inc(out_file.tell())
         out_file.close()
 
+        if self.pendingChanges is not None:
+            (rgKeys, resKeys, links) = self.pendingChanges
+            self.changeHistory.append((self.lastVersion, rgKeys, resKeys, set(links.keys())))
+            for (key, link) in links.items():
+                if key in self.linkCounts:
+                    (rgKey, count) = self.linkCounts.pop(key)
+                    update_dirty_counts(self.dirtyCounts, rgKey, count, -1)
+                if link_key(link) == key and link in self.links:
+                    (rgKey, count) = link_count(link)
+                    if count != (0, 0, 0):
+                        self.linkCounts[key] = (rgKey, count)
+                        update_dirty_counts(self.dirtyCounts, rgKey, count, 1)
+        else:
+            self.linkCounts = link_counts(self.links)
+            self.dirtyCounts = dirty_counts(self.linkCounts)
+        self.pendingChanges = (set(), set(), {})
+
+    def getVersion(self) -> str:
+        return str(self.lastVersion)
+
+    def getDirtySummary(self) -> dict[tuple[str, str], tuple[int, int, int]]:
+        return dict(self.dirtyCounts)
+
+    def restoreVersion(self, version: str):
+        # the saved versions are on disk, the one in memory is reloaded from its file
+        branchFile = self.db.stateDir + "/" + self.name + "/" + version
+        if os.path.exists(branchFile):
+            with open(branchFile, "r") as in_file:
+                record = json.load(in_file)
+            self.tools = MemBranch.toolsFromJson(record["tools"])
+            self.links = set([Link.fromJson(lk) for lk in record["links"]])
+        else:
+            self.tools = {}
+            self.links = set()
+        self.pendingChanges = (set(), set(), {})
+        self.linkCounts = link_counts(self.links)
+        self.dirtyCounts = dirty_counts(self.linkCounts)
+        self.lastVersion = int(version)
+        while len(self.changeHistory) > 0 and self.changeHistory[-1][0] > self.lastVersion:
+            self.changeHistory.pop()
+
+    def getChangesSince(self, version: str) -> BranchChanges | None:
+        try:
+            since = int(version)
+        except ValueError:
+            return None
+        if since > self.lastVersion or self.pendingChanges is None:
+            return None
+        changes = BranchChanges(str(self.lastVersion))
+        if since == self.lastVersion:
+            return changes
+
+        history = [entry for entry in self.changeHistory if entry[0] > since]
+        if len(history) == 0 or history[0][0] != since + 1:
+            return None
+        rgKeys = set()
+        resKeys = set()
+        linkKeys = set()
+        for (_, rgs, resources, links) in history:
+            rgKeys.update(rgs)
+            resKeys.update(resources)
+            linkKeys.update(links)
+
+        # the branch is only changed under the write lock, which saves it before it is released
+        for key in rgKeys:
+            rg = self.tools.get(key[0], {}).get(key[1])
+            if rg is not None:
+                changes.resourceGroups.append(ResourceGroup(name=rg.name, toolId=rg.toolId, version=rg.version,
+                                                            URL=rg.URL, resources={}))
+            else:
+                changes.removedResourceGroups.append(key)
+        for key in resKeys:
+            rg = self.tools.get(key[0], {}).get(key[1])
+            res = rg.resources.get(key[2]) if rg is not None else None
+            if res is not None:
+                changes.resources.append((ResourceGroup(name=rg.name, toolId=rg.toolId, version=rg.version,
+                                                        URL=rg.URL, resources={}),
+                                          Resource(name=res.name, id=res.id, URL=res.URL, deleted=res.deleted)))
+            else:
+                changes.removedResources.append(ResourceRef(key[0], key[1], key[2]))
+        links = {}
+        if len(linkKeys) > 0:
+            for link in self.links:
+                key = link_key(link)
+                if key in linkKeys:
+                    links[key] = link
+        for key in linkKeys:
+            if key in links:
+                changes.links.append(self.linkToLinkWithResources(links[key]))
+            else:
+                changes.removedLinks.append(Link(ResourceRef(*key[0]), ResourceRef(*key[1])))
+        return changes
+
     def markLinkDirty(self, link: Link, currentVersion: str):
         if not link.dirty:
             link.lastCleanVersion = currentVersion
 
         link.dirty = True
+        self.recordLinkChange(link)
         linksUpdated: set[ResourceRef] = set()
 
         linksToProcess: set[ResourceRef] = set()
@@ -235,9 +408,11 @@ class MemBranch(DepiBranch):
                                 break
                         if not found:
                             currLink.inferredDirtiness.add((link.fromRes, currentVersion))
+                            self.recordLinkChange(currLink)
                             if currLink.toRes not in linksUpdated:
                                 linksToProcess.add(currLink.toRes)
 
+    @timed_db_operation("memjson", "updateResourceGroup")
     def updateResourceGroup(self, resourceGroupChange: ResourceGroupChange) -> list[Link]:
         tool = self.tools.get(resourceGroupChange.toolId)
         if tool is None:
@@ -257,9 +432,11 @@ class MemBranch(DepiBranch):
             resourceGroup = ResourceGroup.fromGrpcResourceGroupChange(
                 resourceGroupChange)
             tool[key] = resourceGroup
+            self.recordResourceGroupChange(resourceGroup.toolId, resourceGroup.URL, withResources=True)
         else:
             originalVersion = resourceGroup.version
             resourceGroup.version = resourceGroupChange.version
+            self.recordResourceGroupChange(resourceGroup.toolId, resourceGroup.URL)
             for resourceChange in resourceGroupChange.resources.values():
                 if resourceChange.changeType == ChangeType.Added or \
                    resourceChange.changeType == ChangeType.Modified:
@@ -282,36 +459,55 @@ class MemBranch(DepiBranch):
                      resourceChange.id != resourceChange.newId)):
                     logging.debug("Processing rename change for resource {}".format(
                         resourceChange.URL))
+                    # links hash on their ends, the renamed ones are rekeyed once the scan is done
+                    renamedLinks: list[tuple[Link, ResourceRef | None, ResourceRef | None]] = []
                     for link in self.links:
                         resource = resourceChange.toResource()
                         if link.hasFromLinkExt(resourceGroup, resource, pathSeparator):
                             fromRgRes = self.getResource(link.fromRes)
                             if fromRgRes is not None and fromRgRes[1].URL == resourceChange.URL:
                                 del resourceGroup.resources[fromRgRes[1].URL]
-                                fromRgRes[1].name = resourceChange.newName
-                                fromRgRes[1].URL = resourceChange.newURL
-                                fromRgRes[1].id = resourceChange.newId
+                                self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, fromRgRes[1].URL)
+                                fromRgRes[1].rekey(resourceChange.newName, resourceChange.newId,
+                                                   resourceChange.newURL)
                                 resourceGroup.resources[fromRgRes[1].URL] = fromRgRes[1]
-                                link.fromRes.URL = resourceChange.newURL
-                                linkedResourceGroupsToUpdate.add(link)
+                                self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, fromRgRes[1].URL)
+                                renamedLinks.append((link, link.fromRes.withURL(resourceChange.newURL), None))
                         elif link.hasToLink(resourceGroup, resource):
                             toRgRes = self.getResource(link.toRes)
                             del resourceGroup.resources[toRgRes[1].URL]
-                            toRgRes[1].name = resourceChange.newName
-                            toRgRes[1].URL = resourceChange.newURL
-                            toRgRes[1].id = resourceChange.newId
+                            self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, toRgRes[1].URL)
+                            toRgRes[1].rekey(resourceChange.newName, resourceChange.newId, resourceChange.newURL)
                             resourceGroup.resources[toRgRes[1].URL] = toRgRes[1]
-                            link.toRes.URL = resourceChange.newURL
+                            self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, toRgRes[1].URL)
+                            renamedLinks.append((link, None, link.toRes.withURL(resourceChange.newURL)))
+                        renamedInferred = []
                         for inferred in link.inferredDirtiness:
                             if inferred[0].toolId == resourceGroupChange.toolId and \
                                inferred[0].resourceGroupURL == resourceGroupChange.URL and \
                                inferred[0].URL == resourceChange.URL:
-                                inferred[0].URL = resourceChange.newURL
+                                renamedInferred.append(inferred)
+                        for inferred in renamedInferred:
+                            link.inferredDirtiness.remove(inferred)
+                            link.inferredDirtiness.add((inferred[0].withURL(resourceChange.newURL), inferred[1]))
+                            self.recordLinkChange(link)
+                    for (link, fromRes, toRes) in renamedLinks:
+                        self.links.discard(link)
+                        self.recordLinkChange(link)
+                        toUpdate = link in linkedResourceGroupsToUpdate or fromRes is not None
+                        linkedResourceGroupsToUpdate.discard(link)
+                        link.rekey(fromRes, toRes)
+                        self.links.add(link)
+                        self.recordLinkChange(link)
+                        if toUpdate:
+                            linkedResourceGroupsToUpdate.add(link)
                     if resourceChange.URL in resourceGroup.resources:
                         res = resourceGroup.resources[resourceChange.URL]
                         del resourceGroup.resources[resourceChange.URL]
-                        res.URL = resourceChange.newURL
+                        res.rekey(res.name, res.id, resourceChange.newURL)
                         resourceGroup.resources[resourceChange.newURL] = res
+                        self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, resourceChange.URL)
+                        self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, resourceChange.newURL)
                 elif resourceChange.changeType == ChangeType.Removed:
                     logging.debug("Processing delete for resource {}".format(
                         resourceChange.URL))
@@ -325,12 +521,16 @@ class MemBranch(DepiBranch):
                             if fromRgRes is not None and fromRgRes[1].URL == resourceChange.URL:
                                 fromRgRes[1].deleted = True
                                 link.deleted = True
+                                self.recordResourceChange(link.fromRes.toolId, link.fromRes.resourceGroupURL,
+                                                          link.fromRes.URL)
                                 remove_resource = False
                             linkedResourceGroupsToUpdate.add(link)
                         elif link.hasToLink(resourceGroup, resource):
                             toRgRes = self.getResource(link.toRes)
                             if toRgRes is not None:
                                 toRgRes[1].deleted = True
+                                self.recordResourceChange(link.toRes.toolId, link.toRes.resourceGroupURL,
+                                                          link.toRes.URL)
                             links_to_remove.append(link)
                         newInferred = set()
                         for (infRes, lastClean) in link.inferredDirtiness:
@@ -339,11 +539,15 @@ class MemBranch(DepiBranch):
                                infRes.URL == resource.URL:
                                 continue
                             newInferred.add((infRes, lastClean))
+                        if len(newInferred) != len(link.inferredDirtiness):
+                            self.recordLinkChange(link)
                         link.inferredDirtiness = newInferred
                     for link in links_to_remove:
                         self.links.remove(link)
+                        self.recordLinkChange(link)
                         if remove_resource:
                             resourceGroup.resources.pop(resourceChange.URL)
+                            self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, resourceChange.URL)
 
             logging.debug("Updating resource group ")
             # TODO: figure out how to merge old with new
@@ -357,11 +561,13 @@ class MemBranch(DepiBranch):
                 if link.hasToLinkRef(rr):
                     link.dirty = False
                     link.lastCleanVersion = ""
+                    self.recordLinkChange(link)
                     try:
                         link.inferredDirtiness.remove(rr)
                     except ValueError:
                         pass
 
+    @timed_db_operation("memjson", "markLinksClean")
     def markLinksClean(self, cleanLinks: list[Link], propagateCleanliness: bool):
         for cl in cleanLinks:
             links_to_delete = []
@@ -370,6 +576,7 @@ class MemBranch(DepiBranch):
                    link.hasToLinkRef(cl.toRes):
                     link.dirty = False
                     link.lastCleanVersion = ""
+                    self.recordLinkChange(link)
                     if link.deleted:
                         links_to_delete.append(link)
             for link in links_to_delete:
@@ -385,6 +592,7 @@ class MemBranch(DepiBranch):
                         delete_res = False
                 if delete_res:
                     rg.resources.pop(res.URL)
+                    self.recordResourceChange(rg.toolId, rg.URL, res.URL)
                     for lk2 in self.links:
                         inf_to_remove = []
                         for (rr,lastClean) in lk2.inferredDirtiness:
@@ -393,10 +601,12 @@ class MemBranch(DepiBranch):
                                 inf_to_remove.append((rr,lastClean))
                         for inf_rem in inf_to_remove:
                             lk2.inferredDirtiness.remove(inf_rem)
+                            self.recordLinkChange(lk2)
 
             if propagateCleanliness:
                 self.markInferredDirtinessClean(cl, cl.fromRes, propagateCleanliness)
 
+    @timed_db_operation("memjson", "markInferredDirtinessClean")
     def markInferredDirtinessClean(self, linkToClean: Link, dirtinessSource: ResourceRef,
                                    propagateCleanliness: bool) -> list[(Link,ResourceRef)]:
         targetLink = None
@@ -417,6 +627,8 @@ class MemBranch(DepiBranch):
                     updatedDirtiness.add((res, lastClean))
                 else:
                     cleaned_links.append((targetLink, res))
+            if len(updatedDirtiness) != len(targetLink.inferredDirtiness):
+                self.recordLinkChange(targetLink)
             targetLink.inferredDirtiness = updatedDirtiness
         else:
             workQueue = [targetLink]
@@ -431,6 +643,8 @@ class MemBranch(DepiBranch):
                         updatedDirtiness.add((res, lastClean))
                     else:
                         cleaned_links.append((currLink, res))
+                if len(updatedDirtiness) != len(currLink.inferredDirtiness):
+                    self.recordLinkChange(currLink)
                 currLink.inferredDirtiness = updatedDirtiness
 
                 for link in self.links:
@@ -451,17 +665,21 @@ class MemBranch(DepiBranch):
         if resourceGroup is None:
             tool[key] = rg
             resourceGroup = rg
+            self.recordResourceGroupChange(rg.toolId, rg.URL, withResources=True)
         if rr is not None and rr.URL not in resourceGroup.resources:
             resourceGroup.resources[rr.URL] = Resource(rr.name, rr.id, rr.URL)
+            self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, rr.URL)
             return True
         elif rr is not None:
             res = resourceGroup.resources[rr.URL]
             if res.deleted:
                 res.deleted = False
+                self.recordResourceChange(resourceGroup.toolId, resourceGroup.URL, rr.URL)
                 return True
             else:
                 return False
 
+    @timed_db_operation("memjson", "addResources")
     def addResources(self, resources: list[tuple[ResourceGroup, Resource|None]]):
         for (rg,res) in resources:
             self.addResource(rg, res)
@@ -483,13 +701,16 @@ class MemBranch(DepiBranch):
                 if link == newLink:
                     if link.deleted:
                         link.deleted = False
+                        self.recordLinkChange(link)
                         return True
                     else:
                         return False
 
         self.links.add(newLink)
+        self.recordLinkChange(newLink)
         return True
 
+    @timed_db_operation("memjson", "addLinks")
     def addLinks(self, newLinks: list[LinkWithResources]) -> bool:
         for link in newLinks:
             self.addLink(link)
@@ -518,10 +739,12 @@ class MemBranch(DepiBranch):
             else:
                 logging.debug("Deleting")
                 res.deleted = True
+                self.recordResourceChange(rr.toolId, rr.resourceGroupURL, rr.URL)
                 # TODO - Verify that we actually want to mark the link as deleted
                 for link in self.links:
                     if link.hasFromLinkRef(rr) or link.hasToLinkRef(rr):
                         link.deleted = True
+                        self.recordLinkChange(link)
                 return True
 
 
@@ -570,6 +793,7 @@ class MemBranch(DepiBranch):
 
         return links
 
+    @timed_db_operation("memjson", "getDependencyGraph")
     def getDependencyGraph(self, rr: ResourceRef, upstream: bool, maxDepth: int) -> list[LinkWithResources]:
         processedLinks = set()
 
@@ -610,6 +834,7 @@ class MemBranch(DepiBranch):
                 logging.debug("Found matching link")
         for link in links_to_delete:
             self.links.remove(link)
+            self.recordLinkChange(link)
 
         logging.debug("No match at all")
         return link_was_deleted
@@ -618,10 +843,9 @@ class MemBranch(DepiBranch):
         if oldResourceGroup.toolId in self.tools:
             if oldResourceGroup.URL in self.tools[oldResourceGroup.toolId]:
                 rg = self.tools[oldResourceGroup.toolId][oldResourceGroup.URL]
+                self.recordResourceGroupChange(rg.toolId, rg.URL, withResources=True)
                 rg.version = newResourceGroup.version
-                rg.toolId = newResourceGroup.toolId
-                rg.URL = newResourceGroup.URL
-                rg.name = newResourceGroup.name
+                rg.rekey(newResourceGroup.name, newResourceGroup.toolId, newResourceGroup.URL)
 
                 if oldResourceGroup.toolId != newResourceGroup.toolId or \
                    oldResourceGroup.URL != newResourceGroup.URL:
@@ -629,10 +853,12 @@ class MemBranch(DepiBranch):
                     if newResourceGroup.toolId not in self.tools:
                         self.tools[newResourceGroup.toolId] = {}
                     self.tools[newResourceGroup.toolId][newResourceGroup.URL] = rg
+                self.recordResourceGroupChange(rg.toolId, rg.URL, withResources=True)
 
     def removeResourceGroup(self, toolId: str, URL: str):
         if toolId in self.tools:
             if URL in self.tools[toolId]:
+                self.recordResourceGroupChange(toolId, URL, withResources=True)
                 self.tools[toolId].pop(URL)
             remove_links = []
             for link in self.links:
@@ -641,6 +867,7 @@ class MemBranch(DepiBranch):
                     remove_links.append(link)
             for link in remove_links:
                 self.links.remove(link)
+                self.recordLinkChange(link)
 
     def getResourceGroupVersion(self, toolId: str, URL: str) -> str:
         if toolId in self.tools:
@@ -684,6 +911,7 @@ class MemBranch(DepiBranch):
         rr.deleted = res.deleted
         return None
 
+    @timed_db_operation("memjson", "getResources")
     def getResources(self, resPatterns: list[ResourceRefPattern], includeDeleted: bool) -> list[(ResourceGroup, Resource)]:
         resources = []
 
@@ -742,6 +970,7 @@ class MemBranch(DepiBranch):
                             if m is not None:
                                 yield rg, res
 
+    @timed_db_operation("memjson", "getLinks")
     def getLinks(self, linkPatterns: list[ResourceLinkPattern]) -> list[LinkWithResources]:
         links = []
 
@@ -793,9 +1022,11 @@ class MemBranch(DepiBranch):
                     if m is not None:
                         yield self.linkToLinkWithResources(link)
 
+    @timed_db_operation("memjson", "expandLinks")
     def expandLinks(self, linksToExpand: list[Link]) -> list[LinkWithResources]:
         return [self.linkToLinkWithResources(link) for link in linksToExpand]
 
+    @timed_db_operation("memjson", "getAllLinks")
     def getAllLinks(self, includeDeleted=False) -> list[LinkWithResources]:
         links = []
 
@@ -813,6 +1044,7 @@ class MemBranch(DepiBranch):
                 continue
             yield self.linkToLinkWithResources(link)
 
+    @timed_db_operation("memjson", "getDirtyLinks")
     def getDirtyLinks(self, resourceGroup: ResourceGroup, withInferred: bool) -> list[LinkWithResources]:
         links = []
 
@@ -889,5 +1121,8 @@ class MemBranch(DepiBranch):
         for lk in record["links"]:
             links.add(Link.fromJson(lk))
         newBranch.links = links
+        newBranch.pendingChanges = (set(), set(), {})
+        newBranch.linkCounts = link_counts(links)
+        newBranch.dirtyCounts = dirty_counts(newBranch.linkCounts)
         return newBranch
 
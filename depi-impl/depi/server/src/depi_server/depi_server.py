@@ -1,14 +1,15 @@
+import asyncio
 import datetime
 import time
 
 import depi_pb2_grpc
 import depi_pb2
 import grpc
-from google.protobuf import text_format
 import uuid
 from concurrent import futures
-import queue
 import json
+import queue
+import signal
 from threading import Lock, Thread
 import argparse
 import base64
@@ -19,9 +20,24 @@ from depi_server.model.depi_model import Resource, ResourceRef, ResourceGroup, L
 from depi_server.db.depi_db_mem_json import MemJsonDB
 from depi_server.db.depi_db_dolt import DoltDB
 from depi_server.auth.depi_authorization import *
+from depi_server.interceptors.rpc_trace import create_trace_interceptor
+from depi_server.branch_locks import BranchLockManager
+from depi_server.notification_hub import NotificationHub, Subscriber
+from depi_server.response_cache import ResponseCache, request_key, RESPONSE_CACHE_BYTES
+from depi_server.paging import decode_page_token, page_of, sort_groups, resource_key, link_key
+from depi_server.compact import negotiate_compression, compact_response, compact_stream, COMPACT_CHUNK_SIZE
+from depi_server.bulk_import import ImportSpool, BULK_IMPORT_CHUNK_SIZE
+from depi_server.audit_log import AuditLog, AUDIT_QUEUE_SIZE, AUDIT_FLUSH_INTERVAL
+from depi_server.blackboard import Blackboard, BlackboardIndex, BlackboardStore, BLACKBOARD_SPILL_GRACE
+from depi_server.interceptors.metrics_interceptor import MetricsInterceptor
+from depi_server.metrics.depi_metrics import BLACKBOARD_OPERATION_DURATION
+from depi_server.metrics.metrics_http import start_metrics_server
+from depi_server.metrics.registry import REGISTRY
 
 DEPI_CONFIG_ENV_VAR_NAME = 'DEPI_CONFIG'
 
+CHANGES_BATCH_SIZE = 500
+
 
 class ToolConfig:
     def __init__(self, name, jsonConfig=None):
@@ -96,90 +112,6 @@ def loadConfig(server_root,  config_filename=None):
         print(f"Config file {config_file_name} does not exist.")
 
 
-class Blackboard:
-    def __init__(self):
-        self.changedLinks: set[LinkWithResources] = set()
-        self.resources: dict[str, dict[str, ResourceGroup]] = {}
-        self.deletedLinks: set[LinkWithResources] = set()
-
-    def getResources(self) -> list[tuple[ResourceGroup, Resource]]:
-        resList = []
-        for tool in self.resources.values():
-            for rg in tool.values():
-                for res in rg.resources.values():
-                    resList.append((rg, res))
-        return resList
-
-    def addResource(self, resourceGroup: ResourceGroup, resource: Resource) -> bool:
-        toolResources = self.resources.get(resourceGroup.toolId)
-        if toolResources is None:
-            toolResources = {}
-            self.resources[resourceGroup.toolId] = toolResources
-
-        toolGroup = toolResources.get(resourceGroup.URL)
-        if toolGroup is None:
-            toolGroup = ResourceGroup(resourceGroup.name,
-                                      resourceGroup.toolId,
-                                      resourceGroup.URL,
-                                      resourceGroup.version)
-            toolResources[resourceGroup.URL] = toolGroup
-
-        newRes = Resource(resource.name, resource.id, resource.URL)
-        return toolGroup.addResource(newRes)
-
-    def removeResource(self, ref: ResourceRef) -> bool:
-        toolResources = self.resources.get(ref.toolId)
-        if toolResources is None:
-            return False
-
-        toolGroup = toolResources.get(ref.resourceGroupURL)
-        if toolGroup is None:
-            return False
-
-        return toolGroup.removeResource(ref.URL)
-
-    def expandResource(self, toolId, resourceGroupURL, resourceURL) -> tuple[ResourceGroup, Resource] | None:
-        if toolId in self.resources:
-            if resourceGroupURL in self.resources[toolId]:
-                group = self.resources[toolId][resourceGroupURL]
-                if resourceURL in group.resources:
-                    return group, group.resources[resourceURL]
-        return None
-
-    def linkResources(self, links: list[LinkWithResources]):
-        updates = []
-        for lk in links:
-            if lk not in self.changedLinks:
-                self.changedLinks.add(lk)
-                update = depi_pb2.Update(updateType=depi_pb2.UpdateType.AddLink,
-                                         link=lk.toGrpc())
-                updates.append(update)
-                if lk in self.deletedLinks:
-                    self.deletedLinks.remove(lk)
-            elif lk in self.deletedLinks:
-                self.deletedLinks.remove(lk)
-                update = depi_pb2.Update(updateType=depi_pb2.UpdateType.AddLink,
-                                         link=lk.toGrpc())
-                updates.append(update)
-        return updates
-
-    def unlinkResources(self, links):
-        newChanged = set()
-        updates = []
-        for cl in self.changedLinks:
-            if cl not in links:
-                newChanged.add(cl)
-            else:
-                if cl not in self.deletedLinks:
-                    self.deletedLinks.add(cl)
-                    update = depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveLink,
-                                             link=cl.toGrpc())
-                    updates.append(update)
-
-        self.changedLinks = newChanged
-        return updates
-
-
 class User:
     def __init__(self, name: str, password: str, authorization: Authorization = None):
         self.name = name
@@ -190,31 +122,37 @@ class User:
 class Session:
     def __init__(self, sessionId: str, toolId: str, user: User, mainBranch: DepiBranch):
         self.watchedGroups = set()
-        self.watchingResources = False
-        self.watchingBlackboard = False
-        self.watchingDepi = False
         self.lastRequest = datetime.datetime.now()
-        self.resourceUpdates = queue.Queue()
-        self.blackboardUpdates = queue.Queue()
-        self.depiUpdates = queue.Queue()
+        # the watch streams of this session by stream type, maintained by the NotificationHub
+        self.subscribers: dict[str, Subscriber] = {}
         self.branch: DepiBranch = mainBranch
         #        self.toolId: str = toolId
         self.user: User = user
         self.sessionId = sessionId
+        # set by WatchDepi, the depi watch stream is also sent the dirty summary changes
+        self.watchDirtySummary = False
+
+    def isWatching(self, streamType: str) -> bool:
+        subscriber = self.subscribers.get(streamType)
+        return subscriber is not None and subscriber.attached
+
+    @property
+    def watchingResources(self):
+        return self.isWatching("resources")
 
-    def printGRPC(self, msg):
-        msgType = type(msg).__name__.split(".")[0]
-        logging.debug(
-            "{}({}): {}".format(msgType, self.sessionId, text_format.MessageToString(message=msg, as_one_line=True)))
-        return msg
+    @property
+    def watchingBlackboard(self):
+        return self.isWatching("blackboard")
+
+    @property
+    def watchingDepi(self):
+        return self.isWatching("depi")
+
+
+def dirty_count_to_grpc(key: tuple[str, str], count: tuple[int, int, int]) -> depi_pb2.DirtyCount:
+    return depi_pb2.DirtyCount(toolId=key[0], URL=key[1], dirty=count[0], inferredDirty=count[1],
+                               deletedPending=count[2])
 
-    def close_session(self):
-        if self.watchingResources:
-            self.resourceUpdates.put("quit")
-        if self.watchingBlackboard:
-            self.blackboardUpdates.put("quit")
-        if self.watchingDepi:
-            self.depiUpdates.put("quit")
 
 class DepiServer(depi_pb2_grpc.DepiServicer):
     def __init__(self):
@@ -226,8 +164,30 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
             self.db = DoltDB(config)
 
         self.sessions: dict[str, Session] = {}
-        self.blackboards: dict[str, Blackboard] = {}
-        self.updateLock = Lock()
+        self.blackboardIndex = BlackboardIndex()
+        self.blackboards = BlackboardStore(self.blackboardIndex,
+                                           get_config_value(config.serverConfig, "blackboard_spill_dir",
+                                                            "blackboard_spill"),
+                                           get_config_value(config.serverConfig, "blackboard_user_quota", 0),
+                                           get_config_value(config.serverConfig, "blackboard_total_quota", 0),
+                                           get_config_value(config.serverConfig, "blackboard_idle_timeout", 0),
+                                           get_config_value(config.serverConfig, "blackboard_spill_grace",
+                                                            BLACKBOARD_SPILL_GRACE))
+        self.branchLocks = BranchLockManager()
+        self.hub = NotificationHub(get_config_value(config.serverConfig, "watch_queue_size", 1000),
+                                   get_config_value(config.serverConfig, "watch_overflow", "drop_oldest"),
+                                   get_config_value(config.serverConfig, "watch_replay_size", 1000))
+        self.responseCache = ResponseCache(get_config_value(config.serverConfig, "response_cache_size", 256),
+                                           get_config_value(config.serverConfig, "response_cache_bytes",
+                                                            RESPONSE_CACHE_BYTES))
+        # the sorted results that pages are cut from, kept apart so other reads don't push them out
+        self.pagedResults = ResponseCache(get_config_value(config.serverConfig, "paged_results_size", 64),
+                                          get_config_value(config.serverConfig, "paged_results_bytes",
+                                                           RESPONSE_CACHE_BYTES),
+                                          keepNewest=True)
+        # branch name -> (version, dirty summary) last sent to its watchers, and last read from the db
+        self.dirtySummaries: dict[str, tuple[str, dict[tuple[str, str], tuple[int, int, int]]]] = {}
+        self.dirtyCounts: dict[str, tuple[str, dict[tuple[str, str], tuple[int, int, int]]]] = {}
         self.blackboardAlwaysMain = True
         self.authorizationEnabled = False
         self.session_lock = Lock()
@@ -237,17 +197,30 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         if "directory" in config.auditConfig:
             self.audit_dir = config.auditConfig["directory"]
         if self.audit_dir is not None and len(self.audit_dir) > 0:
-            os.makedirs(self.audit_dir, exist_ok=True)
-        self.audit_lock = Lock()
-        self.curr_audit_date = None
-        self.audit_file = None
-
-        if "authorization_enabled" in config.serverConfig:
-            self.authorizationEnabled = config.serverConfig["authorization_enabled"]
+            self.auditLog = AuditLog(self.audit_dir,
+                                     get_config_value(config.auditConfig, "queue_size", AUDIT_QUEUE_SIZE),
+                                     get_config_value(config.auditConfig, "flush_interval", AUDIT_FLUSH_INTERVAL),
+                                     get_config_value(config.auditConfig, "max_file_size", 0),
+                                     get_config_value(config.auditConfig, "compress", False),
+                                     get_config_value(config.auditConfig, "format", "text"))
+        else:
+            self.auditLog = None
 
         if "session_timeout" in config.serverConfig:
             self.session_timeout = config.serverConfig["session_timeout"]
 
+        self.logins = {}
+        self.loadAuthorization()
+
+        self.session_thread = Thread(target=self.check_session_thread, args=[])
+        self.session_thread.daemon = True
+        self.session_thread.start()
+
+    def loadAuthorization(self):
+        # builds the users and their capabilities from the config, again when it is reloaded
+        if "authorization_enabled" in config.serverConfig:
+            self.authorizationEnabled = config.serverConfig["authorization_enabled"]
+
         if self.authorizationEnabled:
             if "auth_def_file" in config.authConfig:
                 self.auth_rules = AuthorizationConfigParser.parse_config_file(config.authConfig["auth_def_file"])
@@ -256,7 +229,7 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         else:
             self.auth_rules = None
 
-        self.logins = {}
+        logins = {}
         for user in config.usersConfig:
             if self.authorizationEnabled:
                 user_auth = Authorization.create_from_user_config(user["auth_rules"],
@@ -264,16 +237,33 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                                                   user["name"])
             else:
                 user_auth = None
-            self.logins[user["name"]] = User(user["name"], user["password"], user_auth)
-
-        self.session_thread = Thread(target=self.check_session_thread, args=[])
-        self.session_thread.daemon = True
-        self.session_thread.start()
+            if user["name"] in self.logins:
+                # the sessions of a logged in user keep its User, which gets the new rules
+                logins[user["name"]] = self.logins[user["name"]]
+                logins[user["name"]].password = user["password"]
+                logins[user["name"]].authorization = user_auth
+            else:
+                logins[user["name"]] = User(user["name"], user["password"], user_auth)
+        for name, user in self.logins.items():
+            if name not in logins:
+                user.authorization = Authorization([], [])
+        self.logins = logins
+
+    def reloadAuthorization(self):
+        # the new Authorization objects start with empty decision caches, the cached responses
+        # were filtered with the old rules
+        self.loadAuthorization()
+        self.responseCache.clear()
+        self.pagedResults.clear()
+        logging.info("Reloaded the users and authorization rules")
 
     def check_session_thread(self):
         while True:
             try:
                 self.check_sessions()
+                self.log_lock_stats()
+                self.log_watcher_lag()
+                self.blackboards.spillIdle()
 
                 time.sleep(300)
 
@@ -290,37 +280,104 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                     expired_sessions.append(session_key)
             for session_key in expired_sessions:
                 logging.info("Session {} has timed out".format(session_key))
-                self.sessions[session_key].close_session()
+                self.hub.closeSession(self.sessions[session_key])
                 self.sessions.pop(session_key)
         finally:
             self.session_lock.release()
 
-    def get_audit_file(self):
-        if self.audit_dir is None or len(self.audit_dir) == 0:
-            return None
-        curr_date = datetime.date.today()
-        if curr_date == self.curr_audit_date and self.audit_file is not None:
-            return self.audit_file
-        if self.audit_file is not None:
-            self.audit_file.close()
-        log_filename = "{:4d}{:02d}{:02d}".format(curr_date.year, curr_date.month, curr_date.day)
-        self.audit_file = open(self.audit_dir+os.path.sep+log_filename, "a")
-        return self.audit_file
+    def log_lock_stats(self):
+        for branchName, stats in self.branchLocks.getStats().items():
+            if stats["readContended"] == 0 and stats["writeContended"] == 0:
+                continue
+            logging.info("Branch {} lock: {} of {} reads and {} of {} writes waited, {:.3f}s read wait, "
+                         "{:.3f}s write wait, longest wait {:.3f}s".format(
+                branchName, stats["readContended"], stats["readAcquires"], stats["writeContended"],
+                stats["writeAcquires"], stats["readWaitTime"], stats["writeWaitTime"], stats["maxWaitTime"]))
+
+    def log_watcher_lag(self):
+        for stats in self.hub.getStats():
+            if stats["lag"] < 60.0 and stats["dropped"] == 0:
+                continue
+            logging.warning("{} watcher for {} on session {} is {:.1f}s behind, {} updates queued, {} dropped, "
+                            "{} coalesced".format(stats["stream"], stats["user"], stats["sessionId"], stats["lag"],
+                                                  stats["queued"], stats["dropped"], stats["coalesced"]))
+
+    def collect_metrics(self):
+        with self.session_lock:
+            sessions = list(self.sessions.values())
+        watchers = [({"type": streamType}, self.hub.numSubscribers(streamType))
+                    for streamType in ["resources", "blackboard", "depi"]]
+        queued = []
+        lag = []
+        dropped = []
+        coalesced = []
+        for stats in self.hub.getStats():
+            labels = {"session": stats["sessionId"], "user": stats["user"], "type": stats["stream"]}
+            queued.append((labels, stats["queued"]))
+            lag.append((labels, stats["lag"]))
+            dropped.append((labels, stats["dropped"]))
+            coalesced.append((labels, stats["coalesced"]))
+
+        acquires = []
+        contended = []
+        waitTime = []
+        held = []
+        for branchName, stats in self.branchLocks.getStats().items():
+            for mode in ["read", "write"]:
+                labels = {"branch": branchName, "mode": mode}
+                acquires.append((labels, stats[mode + "Acquires"]))
+                contended.append((labels, stats[mode + "Contended"]))
+                waitTime.append((labels, stats[mode + "WaitTime"]))
+            held.append(({"branch": branchName, "mode": "read"}, stats["readers"]))
+            held.append(({"branch": branchName, "mode": "write"}, 1 if stats["writer"] else 0))
+        cacheStats = self.responseCache.getStats()
+        pagedStats = self.pagedResults.getStats()
+        blackboardStats = self.blackboards.getStats()
+
+        return [("depi_sessions", "gauge", "Logged in sessions", [({}, len(sessions))]),
+                ("depi_watchers", "gauge", "Sessions watching for updates", watchers),
+                ("depi_update_queue_depth", "gauge", "Updates waiting to be sent to a watcher", queued),
+                ("depi_update_lag_seconds", "gauge", "Age of the oldest update waiting to be sent to a watcher", lag),
+                ("depi_updates_dropped_total", "counter", "Updates dropped because a watcher fell behind", dropped),
+                ("depi_updates_coalesced_total", "counter", "Updates merged into a queued message because a "
+                                                            "watcher fell behind", coalesced),
+                ("depi_blackboards", "gauge", "Blackboards held in memory and spilled to disk",
+                 [({"state": "memory"}, len(blackboardStats["sizes"])),
+                  ({"state": "spilled"}, blackboardStats["spilled"])]),
+                ("depi_blackboard_size_bytes", "gauge", "Estimated size of the blackboards held in memory",
+                 [({"user": user}, size) for user, size in sorted(blackboardStats["sizes"].items())]),
+                ("depi_blackboard_spills_total", "counter", "Blackboards written to disk",
+                 [({}, blackboardStats["spills"])]),
+                ("depi_blackboard_reloads_total", "counter", "Spilled blackboards read back",
+                 [({}, blackboardStats["reloads"])]),
+                ("depi_branch_lock_acquires_total", "counter", "Branch lock acquisitions", acquires),
+                ("depi_branch_lock_contended_total", "counter", "Branch lock acquisitions that had to wait",
+                 contended),
+                ("depi_branch_lock_wait_seconds_total", "counter", "Time spent waiting for branch locks", waitTime),
+                ("depi_branch_lock_holders", "gauge", "Current holders of branch locks", held),
+                ("depi_response_cache_entries", "gauge", "Read responses kept by branch version",
+                 [({}, cacheStats["entries"])]),
+                ("depi_response_cache_bytes", "gauge", "Serialized size of the read responses kept",
+                 [({}, cacheStats["bytes"])]),
+                ("depi_response_cache_requests_total", "counter", "Read response cache lookups",
+                 [({"result": "hit"}, cacheStats["hits"]), ({"result": "miss"}, cacheStats["misses"])]),
+                ("depi_paged_results_entries", "gauge", "Sorted results kept for paged reads",
+                 [({}, pagedStats["entries"])]),
+                ("depi_paged_results_bytes", "gauge", "Serialized size of the sorted results kept for paged reads",
+                 [({}, pagedStats["bytes"])]),
+                ("depi_paged_results_requests_total", "counter", "Paged result lookups",
+                 [({"result": "hit"}, pagedStats["hits"]), ({"result": "miss"}, pagedStats["misses"])]),
+                ("depi_audit_queue_entries", "gauge", "Audit log entries waiting to be written",
+                 [({}, self.auditLog.queue.qsize() if self.auditLog is not None else 0)])]
 
     def write_audit_log_entry(self, user, operation, data):
-        try:
-            self.audit_lock.acquire()
-            audit_file = self.get_audit_file()
-            if audit_file is None:
-                return
-            curr_time = datetime.datetime.now()
+        if self.auditLog is not None:
+            self.auditLog.write(user, operation, data)
 
-            print("{:02d}:{:02d}:{:02d}.{:03d}|{}|{}|{}".format(curr_time.hour, curr_time.minute,
-                                                              curr_time.second, int(curr_time.microsecond / 1000.0),
-                                                              user, operation, data), file=audit_file)
-            audit_file.flush()
-        finally:
-            self.audit_lock.release()
+    def shutdown(self):
+        # the queued audit log entries are written out before the server exits
+        if self.auditLog is not None:
+            self.auditLog.close()
 
     def get_session(self, session_id):
         try:
@@ -348,11 +405,6 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         finally:
             self.session_lock.release()
 
-    def printGRPC(self, msg):
-        msgType = type(msg).__name__.split(".")[0]
-        logging.debug("{}: {}".format(msgType, text_format.MessageToString(message=msg, as_one_line=True)))
-        return msg
-
     def isAuthorized(self, user, capability, *args):
         if not self.authorizationEnabled:
             return True
@@ -362,6 +414,24 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
 
         return user.authorization.is_authorized(capability, *args)
 
+    def authScope(self, user, capability) -> str:
+        if not self.authorizationEnabled:
+            return SCOPE_UNRESTRICTED
+
+        if user.authorization is None:
+            return SCOPE_NONE
+
+        return user.authorization.classify(capability)
+
+    def mayBeAuthorized(self, user, capability, *args):
+        if not self.authorizationEnabled:
+            return True
+
+        if user.authorization is None:
+            return False
+
+        return user.authorization.may_authorize(capability, *args)
+
     def hasCapability(self, user, capability):
         if not self.authorizationEnabled:
             return True
@@ -372,74 +442,160 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         return user.authorization.has_capability(capability)
 
     def numDepiWatchers(self, branch_name):
-        n=0
-        for session in self.sessions.values():
-           if branch_name is not None and branch_name != session.branch.name:
-               continue
-           if session.watchingDepi:
-               n += 1
-        return n
+        return self.hub.numSubscribers("depi", branch_name)
+
+    def acquireWrite(self, branchName):
+        # updates published while the branch is locked are sent once it is released
+        self.branchLocks.acquireWrite(branchName)
+        self.hub.deferPublishing()
+
+    def releaseWrite(self, branchName):
+        try:
+            self.publishDirtySummary(branchName)
+        finally:
+            try:
+                self.branchLocks.releaseWrite(branchName)
+            finally:
+                self.hub.publishDeferred()
+
+    def dirtySummary(self, branch) -> tuple[str, dict]:
+        # the dirty counts are read once per branch version, GetDirtySummary and the watchers share them
+        version = branch.getVersion()
+        cached = self.dirtyCounts.get(branch.name)
+        if cached is not None and cached[0] == version:
+            return cached
+        cached = (version, branch.getDirtySummary())
+        self.dirtyCounts[branch.name] = cached
+        return cached
+
+    def publishDirtySummary(self, branchName):
+        # called with the branch write locked, sends the resource groups whose dirty counts changed
+        # to the depi watchers that asked for them
+        def accept(session):
+            return session.watchDirtySummary
+
+        if self.hub.numSubscribers("depi", branchName, accept) == 0:
+            self.dirtySummaries.pop(branchName, None)
+            return
+        branch = self.db.getBranch(branchName)
+        if branch is None:
+            return
+        try:
+            version, counts = self.dirtySummary(branch)
+        except Exception:
+            logging.exception("Unable to read the dirty summary of branch {}".format(branchName))
+            return
+        lastVersion, last = self.dirtySummaries.get(branchName, (None, {}))
+        if version == lastVersion:
+            return
+        self.dirtySummaries[branchName] = (version, counts)
+        updates = [depi_pb2.Update(updateType=depi_pb2.UpdateType.DirtyCountChanged,
+                                   dirtyCount=dirty_count_to_grpc(key, counts.get(key, (0, 0, 0))))
+                   for key in sorted(last.keys() | counts.keys()) if last.get(key) != counts.get(key)]
+        if len(updates) > 0:
+            self.hub.publish("depi", branchName, depi_pb2.DepiUpdate(ok=True, msg="", updates=updates), accept)
+
+    def cachedRead(self, method, session, request, responseType, build, version=None, cache=None):
+        # build(branch) makes the response, it is called with the branch read locked and only
+        # when there is no response for the current branch version yet. With a version, the
+        # response for that version is returned, or None if it is no longer known.
+        if cache is None:
+            cache = self.responseCache
+        branch = session.branch
+        self.branchLocks.acquireRead(branch.name)
+        try:
+            current = self.branchLocks.versionToken(branch.name)
+            if version is None:
+                if request.ifNoneMatch == current:
+                    return responseType(ok=True, msg="", notModified=True, version=current)
+                version = current
+            key = (method, branch.name, version, session.user.name, request_key(request))
+            response = cache.get(key)
+            if response is None:
+                if version != current:
+                    return None
+                response = build(branch)
+                if response.ok:
+                    response.version = current
+                    cache.put(key, response)
+            return response
+        finally:
+            self.branchLocks.releaseRead(branch.name)
+
+    def pagedRead(self, method, session, request, responseType, build, groups):
+        # groups are the repeated fields that are paged, see paging.page_of()
+        if request.pageSize <= 0:
+            return self.cachedRead(method, session, request, responseType, build)
+        try:
+            version, offset = decode_page_token(request.pageToken)
+        except ValueError as exc:
+            return responseType(ok=False, msg=str(exc))
+
+        def buildSorted(branch):
+            response = build(branch)
+            sort_groups(response, groups)
+            return response
+
+        response = self.cachedRead(method, session, request, responseType, buildSorted, version, self.pagedResults)
+        if response is None:
+            return responseType(ok=False, msg="The results changed since the first page was read, "
+                                              "read them again from the first page")
+        if not response.ok or response.notModified:
+            return response
+        return page_of(response, groups, response.version, offset, request.pageSize)
 
     def Login(self, request: depi_pb2.LoginRequest, context):
-        self.printGRPC(request)
         if request.user in self.logins:
             if self.logins[request.user].password == request.password:
                 if request.toolId != "blackboard" and \
                         request.toolId != "cli" and \
                         request.toolId not in self.tools:
-                    return self.printGRPC(depi_pb2.LoginResponse(ok=False,
-                                                                 msg="Invalid toolId {}".format(request.toolId),
-                                                                 sessionId=""))
+                    return depi_pb2.LoginResponse(ok=False,
+                                                  msg="Invalid toolId {}".format(request.toolId),
+                                                  sessionId="")
                 sessionId = uuid.uuid4().hex
                 self.add_session(Session(
                     sessionId, request.toolId, self.logins[request.user], self.db.getBranch("main")))
                 if request.user not in self.blackboards:
-                    self.blackboards[request.user] = Blackboard()
-                return self.printGRPC(depi_pb2.LoginResponse(ok=True, msg="",
-                                                             sessionId=sessionId))
-        return self.printGRPC(depi_pb2.LoginResponse(ok=False, msg="Invalid login",
-                                                     sessionId=""))
+                    self.blackboards[request.user] = Blackboard(request.user, self.blackboardIndex)
+                return depi_pb2.LoginResponse(ok=True, msg="",
+                                              sessionId=sessionId)
+        return depi_pb2.LoginResponse(ok=False, msg="Invalid login",
+                                      sessionId="")
 
     def Logout(self, request: depi_pb2.LogoutRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        session.close_session()
+        self.hub.closeSession(session)
         self.remove_session(request.sessionId)
 
-        return self.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def RegisterCallback(self, request: depi_pb2.RegisterCallbackRequest, context):
-        self.printGRPC(request)
-
         def generator(err=None):
             if err is not None:
                 yield err
                 return
 
             try:
-                while True:
-                    update = session.resourceUpdates.get()
-                    if isinstance(update, str):
-                        break
-                    yield depi_pb2.ResourcesUpdatedNotification(ok=True, msg='', updates=[update])
+                for notification in subscriber:
+                    yield notification
             finally:
-                session.watchingResources = False
+                self.hub.unsubscribe(subscriber)
 
         session = self.get_session(request.sessionId)
         if session is None:
-            return generator(self.printGRPC(depi_pb2.ResourcesUpdatedNotification(ok=False,
-                                                                 msg="Invalid session {}".format(request.sessionId),
-                                                                 updates=[])))
+            return generator(depi_pb2.ResourcesUpdatedNotification(ok=False,
+                                                                   msg="Invalid session {}".format(request.sessionId),
+                                                                   updates=[]))
 
-        session.watchingResources = True
+        subscriber = self.hub.subscribe(session, "resources")
 
         return generator()
 
     def WatchBlackboard(self, request: depi_pb2.WatchBlackboardRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
 
         def generator(err=None):
@@ -447,22 +603,19 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                 yield err
                 return
             try:
-                while True:
-                    update = session.blackboardUpdates.get()
-                    if isinstance(update, str):
-                        break
+                for update in subscriber:
                     yield update
             finally:
-                session.watchingBlackboard = False
+                self.hub.unsubscribe(subscriber)
 
         if session is None:
-            return generator(self.printGRPC(
-                depi_pb2.BlackboardUpdate(ok=False, msg="Invalid session {}".format(request.sessionId), updates=[])))
+            return generator(depi_pb2.BlackboardUpdate(ok=False, msg="Invalid session {}".format(request.sessionId), updates=[]))
 
-        session.watchingBlackboard = True
+        subscriber = self.hub.subscribe(session, "blackboard", request.coalesceMillis / 1000.0,
+                                        request.coalesceMaxUpdates)
 
         def on_rpc_done():
-            session.watchingBlackboard = False
+            self.hub.unsubscribe(subscriber)
             logging.debug("Client on {} disconnected from watching".format(request.sessionId))
 
         if context is not None:
@@ -471,41 +624,35 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         return generator()
 
     def UnwatchBlackboard(self, request: depi_pb2.UnwatchBlackboardRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        session.watchingBlackboard = False
-        session.blackboardUpdates.put("quit")
+        self.hub.unsubscribeSession(session, "blackboard")
         return self.GetSuccessResponse()
 
     def WatchDepi(self, request: depi_pb2.WatchDepiRequest, context):
-        self.printGRPC(request)
-
         def generator(err=None):
             if err is not None:
                 yield err
                 return
 
             try:
-                while True:
-                    update = session.depiUpdates.get()
-                    if isinstance(update, str):
-                        break
+                for update in subscriber:
                     yield update
             finally:
-                session.watchingDepi = False
+                self.hub.unsubscribe(subscriber)
 
         session = self.get_session(request.sessionId)
         if session is None:
-            return generator(self.printGRPC(
-                depi_pb2.DepiUpdate(ok=False, msg="Invalid session {}".format(request.sessionId), updates=[])))
+            return generator(depi_pb2.DepiUpdate(ok=False, msg="Invalid session {}".format(request.sessionId), updates=[]))
 
-        session.watchingDepi = True
+        session.watchDirtySummary = request.dirtySummary
+        subscriber = self.hub.subscribe(session, "depi", request.coalesceMillis / 1000.0,
+                                        request.coalesceMaxUpdates, request.resumeFrom)
 
         def on_rpc_done():
-            session.watchingDepi = False
+            self.hub.unsubscribe(subscriber)
             logging.debug("Depi watcher on {} disconnected".format(request.sessionId))
 
         if context is not None:
@@ -514,156 +661,152 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         return generator()
 
     def UnwatchDepi(self, request: depi_pb2.WatchDepiRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        session.watchingDepi = False
-        session.depiUpdates.put("quit")
+        self.hub.unsubscribeSession(session, "depi")
         return self.GetSuccessResponse()
 
     def WatchResourceGroup(self, request: depi_pb2.WatchResourceGroupRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
-
-        session.watchingResources = True
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         session.watchedGroups.add((request.toolId, request.URL))
 
     def UnwatchResourceGroup(self, request: depi_pb2.UnwatchResourceGroupRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         key = (request.toolId, request.URL)
 
         if key in session.watchedGroups:
             session.watchedGroups.remove(key)
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def CreateBranch(self, request: depi_pb2.CreateBranchRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         if self.db.branchExists(request.branchName):
-            return session.printGRPC(self.GetFailureResponse("Branch already exists"))
+            return self.GetFailureResponse("Branch already exists")
 
         isFromTag = False
         fromBranch = request.fromBranch
         fromTag = request.fromTag
         if fromBranch != "":
             if not self.db.branchExists(fromBranch) and not self.db.tagExists(fromBranch):
-                return session.printGRPC(self.GetFailureResponse("Unknown branch"))
+                return self.GetFailureResponse("Unknown branch")
         elif fromTag != "":
             isFromTag = True
             if not self.db.tagExists(fromTag):
-                return session.printGRPC(self.GetFailureResponse("Unknown tag"))
+                return self.GetFailureResponse("Unknown tag")
         else:
             fromBranch = session.branch.name
 
         if not self.isAuthorized(session.user, CapBranchCreate):
-            return session.printGRPC(
-                self.GetFailureResponse("User {} is not authorized to create a branch".format(session.user.name)))
+            return self.GetFailureResponse("User {} is not authorized to create a branch".format(session.user.name))
 
-        if not isFromTag:
-            self.db.createBranch(request.branchName, fromBranch)
-            fromName=fromBranch
-            op="CreateBranch"
-        else:
-            self.db.createBranchFromTag(request.branchName, fromTag)
-            fromName=fromTag
-            op="CreateBranchFromTag"
+        locks = self.branchLocks.acquire(reads=[] if isFromTag else [fromBranch], writes=[request.branchName])
+        try:
+            # another session may have created it while we were waiting
+            if self.db.branchExists(request.branchName):
+                return self.GetFailureResponse("Branch already exists")
+
+            if not isFromTag:
+                self.db.createBranch(request.branchName, fromBranch)
+                fromName=fromBranch
+                op="CreateBranch"
+            else:
+                self.db.createBranchFromTag(request.branchName, fromTag)
+                fromName=fromTag
+                op="CreateBranchFromTag"
+        finally:
+            locks.release()
 
         self.write_audit_log_entry(session.user.name, op, "from={};to={}".format(
             fromName, request.branchName))
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def CreateTag(self, request: depi_pb2.CreateTagRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         fromBranch = request.fromBranch
         if fromBranch != "":
             if not self.db.branchExists(fromBranch):
-                return session.printGRPC(self.GetFailureResponse("Unknown branch"))
+                return self.GetFailureResponse("Unknown branch")
         else:
             fromBranch = session.branch.name
 
         if not self.isAuthorized(session.user, CapBranchTag):
-            return session.printGRPC(
-                self.GetFailureResponse("User {} is not authorized to create a tag".format(session.user.name)))
+            return self.GetFailureResponse("User {} is not authorized to create a tag".format(session.user.name))
 
-        self.db.createTag(request.tagName, fromBranch)
+        self.branchLocks.acquireRead(fromBranch)
+        try:
+            self.db.createTag(request.tagName, fromBranch)
+        finally:
+            self.branchLocks.releaseRead(fromBranch)
 
         self.write_audit_log_entry(session.user.name, "CreateTag", "from={};to={}".format(
             fromBranch, request.tagName))
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def SetBranch(self, request: depi_pb2.SetBranchRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         if not self.isAuthorized(session.user, CapBranchSwitch):
-            return session.printGRPC(
-                self.GetFailureResponse("User {} is not authorized to switch branches".format(session.user.name)))
+            return self.GetFailureResponse("User {} is not authorized to switch branches".format(session.user.name))
 
         if self.db.branchExists(request.branch):
             session.branch = self.db.getBranch(request.branch)
-            return session.printGRPC(self.GetSuccessResponse())
+            self.hub.moveSession(session)
+            return self.GetSuccessResponse()
         else:
-            return session.printGRPC(self.GetFailureResponse("Unknown branch"))
+            return self.GetFailureResponse("Unknown branch")
 
     def GetLastKnownVersion(self, request: depi_pb2.GetLastKnownVersionRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(depi_pb2.GetLastKnownVersionResponse(
+            return depi_pb2.GetLastKnownVersionResponse(
                 ok=False, msg="Invalid session {}".format(request.sessionId),
-                version=""))
+                version="")
 
         branch = session.branch
 
-        return session.printGRPC(
-            depi_pb2.GetLastKnownVersionResponse(
-                ok=True, msg="",
-                version=branch.getResourceGroupVersion(
-                    request.toolId, request.URL)))
+        self.branchLocks.acquireRead(branch.name)
+        try:
+            version = branch.getResourceGroupVersion(request.toolId, request.URL)
+        finally:
+            self.branchLocks.releaseRead(branch.name)
 
-    def AddResourceGroup(self, request: depi_pb2.AddResourceGroupRequest, context):
-        self.printGRPC(request)
+        return depi_pb2.GetLastKnownVersionResponse(
+            ok=True, msg="",
+            version=version)
 
+    def AddResourceGroup(self, request: depi_pb2.AddResourceGroupRequest, context):
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        self.updateLock.acquire()
+        branch = session.branch
+        self.acquireWrite(branch.name)
         try:
-            branch = session.branch
-
             if not self.hasCapability(session.user, CapResGroupAdd):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to create resource groups".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to create resource groups".format(
+                    session.user.name))
 
             if not self.isAuthorized(session.user, CapResGroupAdd,
                                      request.resourceGroup.toolId,
                                      request.resourceGroup.URL):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to create this resource group".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to create this resource group".format(
+                    session.user.name))
 
             branch.addResource(ResourceGroup.fromGrpcResourceGroup(
                 request.resourceGroup), None)
@@ -673,11 +816,7 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
             depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=[
                 depi_pb2.Update(updateType=depi_pb2.UpdateType.AddResourceGroup,
                                 addResourceGroup=request.resourceGroup)])
-            for session in self.sessions.values():
-                if session.branch.name != branch.name:
-                    continue
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
+            self.hub.publishDepi(branch.name, depiUpdate)
 
             self.write_audit_log_entry(session.user.name, "AddResourceGroup",
                                        "toolId={};URL={};name={};version={}".format(
@@ -685,33 +824,28 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                            request.resourceGroup.URL,
                                            request.resourceGroup.name,
                                            request.resourceGroup.version))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def AddResource(self, request: depi_pb2.AddResourceRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        self.updateLock.acquire()
+        branch = session.branch
+        self.acquireWrite(branch.name)
         try:
-            branch = session.branch
-
             if not self.hasCapability(session.user, CapResourceAdd):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to create resources".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to create resources".format(
+                    session.user.name))
 
             if not self.isAuthorized(session.user, CapResourceAdd,
                                      request.toolId,
                                      request.resourceGroupURL,
                                      request.URL):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to create this resource".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to create this resource".format(
+                    session.user.name))
 
             rg = branch.getResourceGroup(request.toolId, request.resourceGroupURL)
 
@@ -723,11 +857,7 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
             depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=[
                 depi_pb2.Update(updateType=depi_pb2.UpdateType.AddResource,
                                 resource=Resource.toGrpc(rg))])
-            for session in self.sessions.values():
-                if session.branch.name != branch.name:
-                    continue
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
+            self.hub.publishDepi(branch.name, depiUpdate)
 
             branch.saveBranchState()
 
@@ -738,25 +868,21 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                            request.URL,
                                            request.name,
                                            request.id))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def LinkResources(self, request: depi_pb2.LinkResourcesRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        self.updateLock.acquire()
+        branch = session.branch
+        self.acquireWrite(branch.name)
         try:
-            branch = session.branch
-
             if not self.hasCapability(session.user, CapLinkAdd):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to create links".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to create links".format(
+                    session.user.name))
 
             if not self.isAuthorized(session.user, CapLinkAdd,
                                      request.link.fromRes.toolId,
@@ -765,9 +891,8 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                      request.link.toRes.toolId,
                                      request.link.toRes.resourceGroupURL,
                                      request.link.toRes.URL):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to create this link".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to create this link".format(
+                    session.user.name))
 
             (fromRg, fromRes) = branch.getResource(ResourceRef.fromGrpc(request.link.fromRes))
             (toRg, toRes) = branch.getResource(ResourceRef.fromGrpc(request.link.toRes))
@@ -780,11 +905,7 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
             depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=[
                 depi_pb2.Update(updateType=depi_pb2.UpdateType.AddLink,
                                 link=link_with_resources.toGrpc())])
-            for session in self.sessions.values():
-                if session.branch.name != branch.name:
-                    continue
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
+            self.hub.publishDepi(branch.name, depiUpdate)
 
             self.write_audit_log_entry(session.user.name, "LinkResources",
                                        "fromToolId={};fromRgURL={};fromURL={};toToolId={};toRgURL={};URL={}".format(
@@ -794,25 +915,21 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                            request.link.toRes.toolId,
                                            request.link.toRes.resourceGroupURL,
                                            request.link.toRes.URL))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def UnlinkResources(self, request: depi_pb2.LinkResourcesRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        self.updateLock.acquire()
+        branch = session.branch
+        self.acquireWrite(branch.name)
         try:
-            branch = session.branch
-
             if not self.hasCapability(session.user, CapLinkRemove):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to remove links".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to remove links".format(
+                    session.user.name))
 
             if not self.isAuthorized(session.user, CapLinkRemove,
                                      request.link.fromRes.toolId,
@@ -821,9 +938,8 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                      request.link.toRes.toolId,
                                      request.link.toRes.resourceGroupURL,
                                      request.link.toRes.URL):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to remove this link".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to remove this link".format(
+                    session.user.name))
 
             branch.removeLink(Link(ResourceRef.fromGrpc(request.link.fromRes),
                                    ResourceRef.fromGrpc(request.link.toRes)))
@@ -833,11 +949,7 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
             depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=[
                 depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveLink,
                                 removeLink=request.link)])
-            for session in self.sessions.values():
-                if session.branch.name != branch.name:
-                    continue
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
+            self.hub.publishDepi(branch.name, depiUpdate)
 
             self.write_audit_log_entry(session.user.name, "UnlinkResources",
                                        "fromToolId={};fromRgURL={};fromURL={};toToolId={};toRgURL={};URL={}".format(
@@ -847,32 +959,27 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                            request.link.toRes.toolId,
                                            request.link.toRes.resourceGroupURL,
                                            request.link.toRes.URL))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def EditResourceGroup(self, request: depi_pb2.EditResourceGroupRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        self.updateLock.acquire()
+        branch = session.branch
+        self.acquireWrite(branch.name)
         try:
-            branch = session.branch
-
             if not self.hasCapability(session.user, CapResGroupChange):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to change resource groups".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to change resource groups".format(
+                    session.user.name))
 
             if not self.isAuthorized(session.user, CapResGroupChange,
                                      request.resourceGroup.toolId,
                                      request.resourceGroup.URL):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to change this resource group".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to change this resource group".format(
+                    session.user.name))
 
             branch.editResourceGroup(ResourceGroup("", request.resourceGroup.toolId,
                                                    request.resourceGroup.URL, ""),
@@ -886,11 +993,7 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                 depi_pb2.Update(updateType=depi_pb2.UpdateType.EditResourceGroup,
                                 editResourceGroup=request.resourceGroup)
             ])
-            for session in self.sessions.values():
-                if session.branch.name != branch.name:
-                    continue
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
+            self.hub.publishDepi(branch.name, depiUpdate)
 
             self.write_audit_log_entry(session.user.name, "EditResourceGroup",
                                        "toolId={};URL={};newToolId={};newURL={};newName={};newVersion={}".format(
@@ -900,32 +1003,27 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                            request.resourceGroup.new_URL,
                                            request.resourceGroup.new_name,
                                            request.resourceGroup.new_version))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def RemoveResourceGroup(self, request: depi_pb2.RemoveResourceGroupRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        self.updateLock.acquire()
+        branch = session.branch
+        self.acquireWrite(branch.name)
         try:
-            branch = session.branch
-
             if not self.hasCapability(session.user, CapResGroupRemove):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to remove resource groups".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to remove resource groups".format(
+                    session.user.name))
 
             if not self.isAuthorized(session.user, CapResGroupRemove,
                                      request.resourceGroup.toolId,
                                      request.resourceGroup.URL):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to remove this resource group".format(
-                        session.user.name)))
+                return self.GetFailureResponse("User {} is not authorized to remove this resource group".format(
+                    session.user.name))
 
             branch.removeResourceGroup(request.resourceGroup.toolId, request.resourceGroup.URL)
 
@@ -936,293 +1034,394 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                 removeResourceGroup=depi_pb2.ResourceGroupRef(toolId=request.resourceGroup.toolId,
                                                                               URL=request.resourceGroup.URL))
             ])
-            for session in self.sessions.values():
-                if session.branch.name != branch.name:
-                    continue
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
+            self.hub.publishDepi(branch.name, depiUpdate)
 
             self.write_audit_log_entry(session.user.name, "RemoveResourceGroup",
                                        "toolId={};URL={}".format(
                                            request.resourceGroup.toolId,
                                            request.resourceGroup.URL))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
 
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
-    def UpdateResourceGroup(self, request: depi_pb2.UpdateResourceGroupRequest, context):
-        self.printGRPC(request)
+    def checkResourceGroupChange(self, user, resourceGroup: depi_pb2.ResourceGroupChange) -> str | None:
+        # returns why the user can't make the change, resources the user can't change are dropped
+        # from it later on
+        if not self.hasCapability(user, CapResGroupChange):
+            return "User {} is not authorized to change resource groups".format(user.name)
 
-        session = self.get_session(request.sessionId)
-        if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+        if not self.hasCapability(user, CapResourceChange):
+            return "User {} is not authorized to change resources".format(user.name)
 
-        self.updateLock.acquire()
-        try:
-            branch = session.branch
+        if not self.isAuthorized(user, CapResGroupChange, resourceGroup.toolId, resourceGroup.URL):
+            return "User {} is not authorized to change this resource group".format(user.name)
+        return None
 
-            if request.updateBranch is not None and request.updateBranch != "":
-                if request.updateBranch != branch.name:
-                    branch = self.db.getBranch(request.updateBranch)
+    def applyResourceGroupChange(self, session, branch: DepiBranch, resourceGroup: depi_pb2.ResourceGroupChange,
+                                 depiUpdates: list) -> ResourceGroupChange:
+        # called with the branch write locked, the caller saves the branch and publishes depiUpdates
+        resourceGroupChange = ResourceGroupChange.fromGrpc(resourceGroup)
+        allowedResources = []
+        for URL in resourceGroupChange.resources:
+            resource = resourceGroupChange.resources[URL]
+            if resource.changeType == ChangeType.Added:
+                if self.isAuthorized(session.user, CapResourceAdd, resourceGroupChange.toolId,
+                                     resourceGroupChange.URL, URL):
+                    allowedResources.append(resource)
+                else:
+                    logging.warning("User {} is not allowed to add resource {} {} {}".format(
+                        session.user.name, resourceGroupChange.toolId, resourceGroupChange.URL, URL))
+            elif (resource.changeType == ChangeType.Modified or resource.changeType == ChangeType.Renamed):
+                if self.isAuthorized(session.user, CapResourceChange, resourceGroupChange.toolId,
+                                     resourceGroupChange.URL, URL):
+                    allowedResources.append(resource)
+                else:
+                    logging.warning("User {} is not allowed to change resource {} {} {}".format(
+                        session.user.name, resourceGroupChange.toolId, resourceGroupChange.URL, URL))
+            elif resource.changeType == ChangeType.Removed:
+                if self.isAuthorized(session.user, CapResourceRemove, resourceGroupChange.toolId,
+                                     resourceGroupChange.URL, URL):
+                    allowedResources.append(resource)
+                else:
+                    logging.warning("User {} is not allowed to remove resource {} {} {}".format(
+                        session.user.name, resourceGroupChange.toolId, resourceGroupChange.URL, URL))
+
+        resourceGroupChange.resources = {}
+        for res in allowedResources:
+            resourceGroupChange.resources[res.URL] = res
+            depiUpdates.append(depi_pb2.Update(updateType=res.getChangeAsUpdateType(),
+                                               resource=res.toResource().toGrpc(resourceGroupChange.toResourceGroup())))
+
+        linkedResourceGroupsToUpdate = branch.updateResourceGroup(resourceGroupChange)
+
+        logging.debug("Sending resource update for {} resources".format(len(linkedResourceGroupsToUpdate)))
+        for lk in linkedResourceGroupsToUpdate:
+            upd = depi_pb2.ResourceUpdate(watchedResource=lk.toRes.toGrpc(), updatedResource=lk.fromRes.toGrpc())
+            depiUpdates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.MarkLinkDirty, markLinkDirty=lk.toGrpc()))
+            self.hub.publishResourceUpdate(branch.name, lk.toRes.toolId, lk.toRes.resourceGroupURL, upd)
+
+        for URL in resourceGroupChange.resources:
+            resource = resourceGroupChange.resources[URL]
+            changeType = "add"
+            if resource.changeType == ChangeType.Modified:
+                changeType = "modify"
+            elif resource.changeType == ChangeType.Renamed:
+                changeType = "rename"
+            elif resource.changeType == ChangeType.Removed:
+                changeType = "remove"
+
+            self.write_audit_log_entry(session.user.name, "UpdateResourceGroupResource",
+                                       "toolId={};rgURL={};URL={};changeType={}".format(
+                                           resourceGroup.toolId,
+                                           resourceGroup.URL,
+                                           URL, changeType))
+        return resourceGroupChange
+
+    def updateBlackboardsForChanges(self, resourceGroupChanges: list[ResourceGroupChange]):
+        # brings the blackboards in line with changes made on main, only the blackboards holding a
+        # changed resource group are visited and each of their users gets one notification
+        updatesByUser = {}
+        for resourceGroupChange in resourceGroupChanges:
+            for blackboardUser in self.blackboardIndex.usersOf((resourceGroupChange.toolId, resourceGroupChange.URL)):
+                if blackboardUser not in self.blackboards:
+                    continue
+                with self.blackboards.use(blackboardUser) as blackboard:
+                    updatesByUser.setdefault(blackboardUser, []).extend(
+                        blackboard.applyResourceGroupChange(resourceGroupChange))
 
+        # send blackboard notifications
+        for blackboardUser, updates in updatesByUser.items():
+            if len(updates) > 0:
+                # the user gets these the next time they watch their blackboard
+                for sess in list(self.sessions.values()):
+                    if sess.user.name == blackboardUser:
+                        self.hub.hold(sess, "blackboard")
+                self.hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates),
+                                           blackboardUser)
 
-            if not self.hasCapability(session.user, CapResGroupChange):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to change resource groups".format(
-                        session.user.name)))
+    def UpdateResourceGroup(self, request: depi_pb2.UpdateResourceGroupRequest, context):
+        session = self.get_session(request.sessionId)
+        if session is None:
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-            if not self.hasCapability(session.user, CapResourceChange):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to change resources".format(
-                        session.user.name)))
+        branch = session.branch
+        if request.updateBranch is not None and request.updateBranch != "":
+            if request.updateBranch != branch.name:
+                branch = self.db.getBranch(request.updateBranch)
 
-            if not self.isAuthorized(session.user, CapResGroupChange,
-                                     request.resourceGroup.toolId,
-                                     request.resourceGroup.URL):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to change this resource group".format(
-                        session.user.name)))
-
-            resourceGroupChange = ResourceGroupChange.fromGrpc(request.resourceGroup)
-            allowedResources = []
-            for URL in resourceGroupChange.resources:
-                resource = resourceGroupChange.resources[URL]
-                if resource.changeType == ChangeType.Added:
-                    if self.isAuthorized(session.user, CapResourceAdd, resourceGroupChange.toolId,
-                                         resourceGroupChange.URL, URL):
-                        allowedResources.append(resource)
-                    else:
-                        logging.warning("User {} is not allowed to add resource {} {} {}".format(
-                            session.user.name, resourceGroupChange.toolId, resourceGroupChange.URL, URL))
-                elif (resource.changeType == ChangeType.Modified or resource.changeType == ChangeType.Renamed):
-                    if self.isAuthorized(session.user, CapResourceChange, resourceGroupChange.toolId,
-                                         resourceGroupChange.URL, URL):
-                        allowedResources.append(resource)
-                    else:
-                        logging.warning("User {} is not allowed to change resource {} {} {}".format(
-                            session.user.name, resourceGroupChange.toolId, resourceGroupChange.URL, URL))
-                elif resource.changeType == ChangeType.Removed:
-                    if self.isAuthorized(session.user, CapResourceRemove, resourceGroupChange.toolId,
-                                         resourceGroupChange.URL, URL):
-                        allowedResources.append(resource)
-                    else:
-                        logging.warning("User {} is not allowed to remove resource {} {} {}".format(
-                            session.user.name, resourceGroupChange.toolId, resourceGroupChange.URL, URL))
+        self.acquireWrite(branch.name)
+        try:
+            err = self.checkResourceGroupChange(session.user, request.resourceGroup)
+            if err is not None:
+                return self.GetFailureResponse(err)
 
-            resourceGroupChange.resources = {}
             depiUpdates = []
-            for res in allowedResources:
-                resourceGroupChange.resources[res.URL] = res
-                depiUpdates.append(depi_pb2.Update(updateType=res.getChangeAsUpdateType(),
-                                                   resource=res.toResource().toGrpc(resourceGroupChange.toResourceGroup())))
-
-            linkedResourceGroupsToUpdate = branch.updateResourceGroup(resourceGroupChange)
+            resourceGroupChange = self.applyResourceGroupChange(session, branch, request.resourceGroup, depiUpdates)
             branch.saveBranchState()
 
             if branch.name == "main":
-                # Clean up blackboards with respect to changes
-                for blackboardUser in self.blackboards:
-                    blackboard = self.blackboards[blackboardUser]
-                    updates = []
-
-                    # look at each resource group in the background
-                    for tool in blackboard.resources.values():
-                        for rg in tool.values():
-
-                            # If the resource group version changes, add a notification
-                            if rg.toolId == resourceGroupChange.toolId and \
-                                    rg.URL == resourceGroupChange.URL and \
-                                    rg.version != resourceGroupChange.version:
-                                updates.append(
-                                    depi_pb2.Update(
-                                        updateType=depi_pb2.UpdateType.ResourceGroupVersionChanged,
-                                        versionChange=depi_pb2.ResourceGroupVersionChange(
-                                            name=resourceGroupChange.name,
-                                            URL=resourceGroupChange.URL,
-                                            toolId=resourceGroupChange.toolId,
-                                            version=rg.version,
-                                            new_version=resourceGroupChange.version)))
-                                rg.version = resourceGroupChange.version
-
-                                # For each changed resource, see if it is in the blackboard, and if it is
-                                # a rename or a removal
-                                for resourceChange in resourceGroupChange.resources.values():
-                                    if resourceChange.URL not in rg.resources:
-                                        continue
-                                    if resourceChange.changeType == int(depi_pb2.ChangeType.Removed):
-                                        # For a removal, add an update and remove the resource from the blackboard
-                                        updates.append(
-                                            depi_pb2.Update(
-                                                updateType=depi_pb2.UpdateType.RemoveResource,
-                                                resource=rg.resources[resourceChange.URL].toGrpc(rg)))
-                                        res = rg.resources.pop(resourceChange.URL)
-
-                                        newChanged = set()
-                                        for link in blackboard.changedLinks:
-                                            if link.fromRes == res or link.toRes == res:
-                                                updates.append(
-                                                    depi_pb2.Update(
-                                                        updateType=depi_pb2.UpdateType.RemoveLink,
-                                                        link=link.toGrpc()))
-                                                if link not in blackboard.deletedLinks:
-                                                    blackboard.deletedLinks.add(link)
-                                            else:
-                                                newChanged.add(link)
-                                            blackboard.changedLinks = newChanged
-
-
-                                    elif resourceChange.changeType == int(depi_pb2.ChangeType.Renamed) or \
-                                            (resourceChange.changeType == int(depi_pb2.ChangeType.Modified) and
-                                             (resourceChange.URL != resourceChange.newURL)):
-
-                                        for link in blackboard.changedLinks:
-                                            fromRes = link.fromRes.toGrpc(link.fromResourceGroup)
-                                            toRes = link.toRes.toGrpc(link.toResourceGroup)
-                                            changed = False
-                                            if link.fromResourceGroup.toolId == resourceGroupChange.toolId and \
-                                                    link.fromResourceGroup.URL == resourceGroupChange.URL and \
-                                                    link.fromRes.URL == resourceChange.URL:
-                                                changed = True
-                                            elif link.toResourceGroup.toolId == resourceGroupChange.toolId and \
-                                                    link.toResourceGroup.URL == resourceGroupChange.URL and \
-                                                    link.toRes.URL == resourceChange.URL:
-                                                changed = True
-
-                                            if changed:
-                                                fromResNew = link.fromRes.toGrpc(link.fromResourceGroup)
-                                                fromResNew.URL = resourceChange.newURL
-                                                fromResNew.name = resourceChange.newName
-                                                fromResNew.id = resourceChange.newId
-
-                                                toResNew = link.toRes.toGrpc(link.toResourceGroup)
-                                                toResNew.URL = resourceChange.newURL
-                                                toResNew.name = resourceChange.newName
-                                                toResNew.id = resourceChange.newId
-
-                                                updates.append(
-                                                    depi_pb2.Update(
-                                                        updateType=depi_pb2.UpdateType.RenameLink,
-                                                        renameLink=depi_pb2.ResourceLinkRename(
-                                                            fromRes=fromRes,
-                                                            fromResNew=fromResNew,
-                                                            toRes=toRes,
-                                                            toResNew=toResNew)))
-                                        # for a rename, perform the rename of the blackboard resource
-                                        # and send a notification
-                                        res = rg.resources.pop(resourceChange.URL)
-                                        rg.resources[resourceChange.newURL] = res
-                                        res.URL = resourceChange.newURL
-                                        res.name = resourceChange.newName
-                                        res.id = resourceChange.newId
-
-                                        updates.append(
-                                            depi_pb2.Update(
-                                                updateType=depi_pb2.UpdateType.RenameResource,
-                                                rename=resourceChange.toGrpc()))
-
-                    # send blackboard notifications
-                    if len(updates) > 0:
-                        for session in self.sessions.values():
-                            if session.user.name == blackboardUser:
-                                session.blackboardUpdates.put(
-                                    depi_pb2.BlackboardUpdate(
-                                        ok=True, msg="", updates=updates))
+                self.updateBlackboardsForChanges([resourceGroupChange])
 
             # send notifications
-            logging.debug("Sending resource update for {} resources".format(len(linkedResourceGroupsToUpdate)))
             logging.debug("Sending depi update for {} resources to {} listeners".format(len(depiUpdates), self.numDepiWatchers(branch.name)))
-            for lk in linkedResourceGroupsToUpdate:
-                upd = depi_pb2.ResourceUpdate(watchedResource=lk.toRes.toGrpc(), updatedResource=lk.fromRes.toGrpc())
-                depiUpdates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.MarkLinkDirty, markLinkDirty=lk.toGrpc()))
-                for session in self.sessions.values():
-                    if session.branch.name != branch.name:
-                        continue
-                    if (lk.toRes.toolId, lk.toRes.resourceGroupURL) in session.watchedGroups and \
-                            session.watchingResources:
-                        session.resourceUpdates.put(upd)
             depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=depiUpdates)
-            for session in self.sessions.values():
-                if session.branch.name != branch.name:
-                    continue
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
-
-            for URL in resourceGroupChange.resources:
-                resource = resourceGroupChange.resources[URL]
-                changeType = "add"
-                if resource.changeType == ChangeType.Modified:
-                    changeType = "modify"
-                elif resource.changeType == ChangeType.Renamed:
-                    changeType = "rename"
-                elif resource.changeType == ChangeType.Removed:
-                    changeType = "remove"
-
-                self.write_audit_log_entry(session.user.name, "UpdateResourceGroupResource",
-                                           "toolId={};rgURL={};URL={};changeType={}".format(
-                                               request.resourceGroup.toolId,
-                                               request.resourceGroup.URL,
-                                               URL, changeType))
-            return session.printGRPC(self.GetSuccessResponse())
+            self.hub.publishDepi(branch.name, depiUpdate)
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
-    def AddResourcesToBlackboard(self, request: depi_pb2.AddResourcesToBlackboardRequest, context):
-        self.printGRPC(request)
+    def UpdateResourceGroups(self, request: depi_pb2.UpdateResourceGroupsRequest, context):
+        # applies many resource group changes, on one or more branches, with each branch locked
+        # and saved once and one depi update per branch
+        session = self.get_session(request.sessionId)
+        if session is None:
+            return self.GetInvalidSessionResponse(request.sessionId)
+
+        changesByBranch = {}
+        for change in request.changes:
+            branchName = change.updateBranch
+            if branchName is None or branchName == "":
+                branchName = session.branch.name
+            changesByBranch.setdefault(branchName, []).append(change.resourceGroup)
+
+        # every change is checked before any is made, so the batch is applied whole or not at all
+        for branchName, changes in changesByBranch.items():
+            if not self.db.branchExists(branchName):
+                return self.GetFailureResponse("Branch {} does not exist".format(branchName))
+            for resourceGroup in changes:
+                err = self.checkResourceGroupChange(session.user, resourceGroup)
+                if err is not None:
+                    return self.GetFailureResponse(err)
+
+        # write() locks the branches in name order, so two batches can't deadlock
+        locks = self.branchLocks.write(*changesByBranch.keys())
+        self.hub.deferPublishing()
+        failed = False
+        try:
+            # a branch that fails to update puts the ones saved before it back to their versions,
+            # the depi updates are only published once every branch is saved
+            applied = []
+            try:
+                for branchName in sorted(changesByBranch.keys()):
+                    if branchName == session.branch.name:
+                        branch = session.branch
+                    else:
+                        branch = self.db.getBranch(branchName)
+
+                    resourceGroupChanges = []
+                    depiUpdates = []
+                    applied.append((branch, branch.getVersion(), resourceGroupChanges, depiUpdates))
+                    for resourceGroup in changesByBranch[branchName]:
+                        resourceGroupChanges.append(self.applyResourceGroupChange(session, branch, resourceGroup,
+                                                                                  depiUpdates))
+                    branch.saveBranchState()
+            except Exception as exc:
+                failed = True
+                logging.exception("Updating resource groups failed, restoring the branches")
+                for (branch, version, _, _) in applied:
+                    branch.restoreVersion(version)
+                return self.GetFailureResponse("Update failed: {}".format(exc))
+
+            for (branch, _, resourceGroupChanges, depiUpdates) in applied:
+                if branch.name == "main":
+                    self.updateBlackboardsForChanges(resourceGroupChanges)
+
+                logging.debug("Sending depi update for {} resources to {} listeners".format(len(depiUpdates), self.numDepiWatchers(branch.name)))
+                self.hub.publishDepi(branch.name, depi_pb2.DepiUpdate(ok=True, msg="", updates=depiUpdates))
+                self.publishDirtySummary(branch.name)
+            return self.GetSuccessResponse()
+        finally:
+            locks.release()
+            if failed:
+                self.hub.discardDeferred()
+            else:
+                self.hub.publishDeferred()
+
+    def BulkImport(self, request_iterator, context):
+        # The records are spooled as they arrive and are applied once the client has sent them
+        # all, on a worker thread that holds the branch's write lock while this stream reports
+        # its progress. The import is saved as one version of the branch, or not at all.
+        session = None
+        chunkSize = get_config_value(config.serverConfig, "bulk_import_chunk_size", BULK_IMPORT_CHUNK_SIZE)
+        resources = ImportSpool("resources", chunkSize)
+        links = ImportSpool("links", chunkSize)
+        worker = None
+        try:
+            reported = 0
+            for request in request_iterator:
+                if session is None:
+                    session = self.get_session(request.sessionId)
+                    if session is None:
+                        yield depi_pb2.BulkImportProgress(ok=False, msg="Invalid session {}".format(request.sessionId))
+                        return
+
+                for res in request.resources:
+                    res.URL = self.normalizeResourceURL(res.toolId, res.URL)
+                    if not self.isAuthorized(session.user, CapResourceAdd, res.toolId, res.resourceGroupURL, res.URL):
+                        yield depi_pb2.BulkImportProgress(
+                            ok=False, msg="User {} is not authorized to add resource {} {} {}".format(
+                                session.user.name, res.toolId, res.resourceGroupURL, res.URL))
+                        return
+                    resources.add(res)
+
+                for link in request.links:
+                    link.fromRes.URL = self.normalizeResourceURL(link.fromRes.toolId, link.fromRes.URL)
+                    link.toRes.URL = self.normalizeResourceURL(link.toRes.toolId, link.toRes.URL)
+                    if not self.isAuthorized(session.user, CapLinkAdd, link.fromRes.toolId,
+                                             link.fromRes.resourceGroupURL, link.fromRes.URL,
+                                             link.toRes.toolId, link.toRes.resourceGroupURL, link.toRes.URL):
+                        yield depi_pb2.BulkImportProgress(
+                            ok=False, msg="User {} is not authorized to add link {} {} {} -> {} {} {}".format(
+                                session.user.name, link.fromRes.toolId, link.fromRes.resourceGroupURL,
+                                link.fromRes.URL, link.toRes.toolId, link.toRes.resourceGroupURL, link.toRes.URL))
+                        return
+                    links.add(link)
+
+                if resources.chunks + links.chunks > reported:
+                    reported = resources.chunks + links.chunks
+                    yield depi_pb2.BulkImportProgress(ok=True, msg="", resourcesReceived=resources.count,
+                                                      linksReceived=links.count)
 
+            if session is None:
+                yield depi_pb2.BulkImportProgress(ok=False, msg="Nothing to import")
+                return
+
+            progress = queue.Queue()
+            worker = Thread(target=self.applyImport, args=(session, resources, links, progress), daemon=True)
+            worker.start()
+            while True:
+                message = progress.get()
+                yield message
+                if message.done or not message.ok:
+                    return
+        finally:
+            # the spools are only closed once the worker is done with them
+            if worker is not None:
+                worker.join()
+            resources.close()
+            links.close()
+
+    def applyImport(self, session, resources: ImportSpool, links: ImportSpool, progress: queue.Queue):
+        branch = session.branch
+        resourcesApplied = 0
+        linksApplied = 0
+
+        def report(**kwargs):
+            progress.put(depi_pb2.BulkImportProgress(ok=True, msg="", resourcesReceived=resources.count,
+                                                     linksReceived=links.count, resourcesApplied=resourcesApplied,
+                                                     linksApplied=linksApplied, **kwargs))
+
+        self.acquireWrite(branch.name)
+        try:
+            version = branch.getVersion()
+            try:
+                for chunk in resources.readChunks():
+                    branch.addResources([(ResourceGroup.fromGrpcResource(res), Resource.fromGrpcResource(res))
+                                         for res in chunk])
+                    resourcesApplied += len(chunk)
+                    report()
+
+                for chunk in links.readChunks():
+                    newLinks = []
+                    for link in chunk:
+                        fromRef = ResourceRef.fromGrpc(link.fromRes)
+                        toRef = ResourceRef.fromGrpc(link.toRes)
+                        fromRgRes = branch.getResource(fromRef)
+                        toRgRes = branch.getResource(toRef)
+                        if fromRgRes is None or toRgRes is None:
+                            raise ValueError("Link {} -> {} refers to a resource that does not exist".format(
+                                fromRef, toRef))
+                        newLinks.append(LinkWithResources(fromRg=fromRgRes[0], fromRes=fromRgRes[1],
+                                                          toRg=toRgRes[0], toRes=toRgRes[1]))
+                    branch.addLinks(newLinks)
+                    linksApplied += len(chunk)
+                    report()
+
+                branch.saveBranchState()
+            except Exception as exc:
+                logging.exception("Bulk import into {} failed, restoring version {}".format(branch.name, version))
+                branch.restoreVersion(version)
+                progress.put(depi_pb2.BulkImportProgress(ok=False, msg="Import failed: {}".format(exc)))
+                return
+
+            # the import can be far too large for one update, watchers are told to read the branch again
+            self.hub.publishDepi(branch.name, depi_pb2.DepiUpdate(ok=True, msg="", resync=True))
+        except Exception as exc:
+            logging.exception("Bulk import into {} failed".format(branch.name))
+            progress.put(depi_pb2.BulkImportProgress(ok=False, msg="Import failed: {}".format(exc)))
+            return
+        finally:
+            self.releaseWrite(branch.name)
+
+        # the same entries a save writes, read back from the spools once the branch is unlocked
+        for chunk in resources.readChunks():
+            for res in chunk:
+                self.write_audit_log_entry(session.user.name, "AddResource", "toolId={};rgURL={};URL={}".format(
+                    res.toolId, res.resourceGroupURL, res.URL))
+
+        for chunk in links.readChunks():
+            for link in chunk:
+                self.write_audit_log_entry(session.user.name, "LinkResources", "fromToolId={};fromRgURL={};fromURL={};toToolId={};toRgURL={};toURL={}".format(
+                    link.fromRes.toolId, link.fromRes.resourceGroupURL, link.fromRes.URL,
+                    link.toRes.toolId, link.toRes.resourceGroupURL, link.toRes.URL))
+
+        report(done=True)
+
+    def normalizeResourceURL(self, toolId: str, URL: str) -> str:
+        toolConfig = config.toolConfig.get(toolId)
+        if toolConfig is not None and not URL.startswith(toolConfig.pathSeparator):
+            return toolConfig.pathSeparator + URL
+        return URL
+
+    def AddResourcesToBlackboard(self, request: depi_pb2.AddResourcesToBlackboardRequest, context):
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         updates = []
-        blackboard = self.blackboards[session.user.name]
-        for res in request.resources:
-            added = blackboard.addResource(ResourceGroup(res.resourceGroupName, res.toolId, res.resourceGroupURL,
-                                                         res.resourceGroupVersion),
-                                           Resource(res.name, res.id, res.URL))
-            if added:
-                update = depi_pb2.Update(updateType=depi_pb2.UpdateType.AddResource,
-                                         resource=depi_pb2.Resource(
-                                             toolId=res.toolId, resourceGroupURL=res.resourceGroupURL,
-                                             resourceGroupName=res.resourceGroupName,
-                                             resourceGroupVersion=res.resourceGroupVersion,
-                                             URL=res.URL,
-                                             name=res.name,
-                                             id=res.id,
-                                             deleted=res.deleted))
-                updates.append(update)
+        with self.blackboards.use(session.user.name) as blackboard:
+            for res in request.resources:
+                added = blackboard.addResource(ResourceGroup(res.resourceGroupName, res.toolId, res.resourceGroupURL,
+                                                             res.resourceGroupVersion),
+                                               Resource(res.name, res.id, res.URL))
+                if added:
+                    update = depi_pb2.Update(updateType=depi_pb2.UpdateType.AddResource,
+                                             resource=depi_pb2.Resource(
+                                                 toolId=res.toolId, resourceGroupURL=res.resourceGroupURL,
+                                                 resourceGroupName=res.resourceGroupName,
+                                                 resourceGroupVersion=res.resourceGroupVersion,
+                                                 URL=res.URL,
+                                                 name=res.name,
+                                                 id=res.id,
+                                                 deleted=res.deleted))
+                    updates.append(update)
 
-        if len(updates) > 0:
-            for sess in self.sessions.values():
-                if sess.watchingBlackboard:
-                    sess.blackboardUpdates.put(
-                        depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
+            # published under the lock, so watchers see the requests in the order they were applied
+            if len(updates) > 0:
+                self.hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
 
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def RemoveResourcesFromBlackboard(self, request: depi_pb2.RemoveResourcesFromBlackboardRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         updates = []
-        blackboard = self.blackboards[session.user.name]
-        for ref in request.resourceRefs:
-            expandedRes = blackboard.expandResource(ref.toolId, ref.resourceGroupURL, ref.URL)
-            if blackboard.removeResource(ref):
-                rg, res = expandedRes
-                update = depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveResource,
-                                         resource=res.toGrpc(rg))
-                updates.append(update)
+        with self.blackboards.use(session.user.name) as blackboard:
+            for ref in request.resourceRefs:
+                expandedRes = blackboard.expandResource(ref.toolId, ref.resourceGroupURL, ref.URL)
+                if blackboard.removeResource(ref):
+                    rg, res = expandedRes
+                    update = depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveResource,
+                                             resource=res.toGrpc(rg))
+                    updates.append(update)
 
-        if len(updates) > 0:
-            for sess in self.sessions.values():
-                if sess.watchingBlackboard:
-                    sess.blackboardUpdates.put(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
+            if len(updates) > 0:
+                self.hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
 
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def lookupLinkResources(self, blackboard: Blackboard, links: list[Link]) -> tuple[
         list[LinkWithResources], str | None]:
@@ -1247,65 +1446,55 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         return result, None
 
     def LinkBlackboardResources(self, request: depi_pb2.LinkBlackboardResourcesRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
-
-        blackboard = self.blackboards[session.user.name]
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        reqLinks = [Link.fromGrpcRef(link) for link in request.links]
+        with self.blackboards.use(session.user.name) as blackboard:
+            reqLinks = [Link.fromGrpcRef(link) for link in request.links]
 
-        start = datetime.datetime.now()
+            start = time.perf_counter()
 
-        links, resp = self.lookupLinkResources(blackboard, reqLinks)
+            links, resp = self.lookupLinkResources(blackboard, reqLinks)
 
-        end = datetime.datetime.now()
+            elapsed = time.perf_counter() - start
+            BLACKBOARD_OPERATION_DURATION.labels("lookupLinks").observe(elapsed)
 
-        if resp is not None:
-            return session.printGRPC(self.GetFailureResponse(resp))
+            if resp is not None:
+                return self.GetFailureResponse(resp)
 
-        print("It took {} seconds to look up {} link resources".format(
-            (end - start).total_seconds(), len(links)))
+            logging.debug("It took {} seconds to look up {} link resources".format(elapsed, len(links)))
 
-        start = datetime.datetime.now()
-        updates = blackboard.linkResources(links)
+            start = time.perf_counter()
+            updates = blackboard.linkResources(links)
 
-        end = datetime.datetime.now()
+            elapsed = time.perf_counter() - start
+            BLACKBOARD_OPERATION_DURATION.labels("linkResources").observe(elapsed)
 
-        print("It took {} seconds to link {} resources".format(
-            (end - start).total_seconds(), len(links)))
+            logging.debug("It took {} seconds to link {} resources".format(elapsed, len(links)))
 
-        if len(updates) > 0:
-            for sess in self.sessions.values():
-                if sess.watchingBlackboard:
-                    sess.blackboardUpdates.put(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
+            if len(updates) > 0:
+                self.hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
 
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def UnlinkBlackboardResources(self, request: depi_pb2.UnlinkBlackboardResourcesRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
-
-        blackboard = self.blackboards[session.user.name]
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        reqLinks = [Link.fromGrpcRef(link) for link in request.links]
-        links, resp = self.lookupLinkResources(blackboard, reqLinks)
-        if resp != None:
-            return session.printGRPC(self.GetFailureResponse(resp))
+        with self.blackboards.use(session.user.name) as blackboard:
+            reqLinks = [Link.fromGrpcRef(link) for link in request.links]
+            links, resp = self.lookupLinkResources(blackboard, reqLinks)
+            if resp != None:
+                return self.GetFailureResponse(resp)
 
-        updates = blackboard.unlinkResources(links)
+            updates = blackboard.unlinkResources(links)
 
-        if len(updates) > 0:
-            for sess in self.sessions.values():
-                if sess.watchingBlackboard:
-                    sess.blackboardUpdates.put(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
+            if len(updates) > 0:
+                self.hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
 
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     @staticmethod
     def GetResourcesAndLinks(links: list[LinkWithResources]) -> \
@@ -1320,120 +1509,279 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         return rrSet, links
 
     def GetBlackboardResources(self, request: depi_pb2.GetBlackboardResourcesRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(depi_pb2.GetBlackboardResourcesResponse(
+            return depi_pb2.GetBlackboardResourcesResponse(
                 ok=False, msg="Invalid session: {}".format(request.sessionId),
                 resources=[],
-                links=[]))
-
-        blackboard = self.blackboards[session.user.name]
+                links=[])
+
+        negotiate_compression(request, context)
+        if request.pageSize <= 0:
+            with self.blackboards.use(session.user.name) as blackboard:
+                bbrrs, bbLinks = blackboard.getSlice(request.toolId, request.resourceGroupURL)
+            response = self.blackboardResourcesResponse(bbrrs, bbLinks)
+            if request.compact:
+                return compact_response(response, "resources", "links")
+            return response
+
+        # the pages are cut from the sorted result for the blackboard's revision when the first
+        # page was read, kept with the paged branch reads
+        try:
+            version, offset = decode_page_token(request.pageToken)
+        except ValueError as exc:
+            return depi_pb2.GetBlackboardResourcesResponse(ok=False, msg=str(exc))
+        groups = [(["resources"], resource_key), (["links"], link_key)]
+        with self.blackboards.use(session.user.name) as blackboard:
+            current = str(blackboard.revision)
+            if version is None:
+                version = current
+            key = ("GetBlackboardResources", session.user.name, version, request_key(request))
+            response = self.pagedResults.get(key)
+            if response is None:
+                if version != current:
+                    return depi_pb2.GetBlackboardResourcesResponse(
+                        ok=False, msg="The blackboard changed since the first page was read, "
+                                      "read it again from the first page")
+                bbrrs, bbLinks = blackboard.getSlice(request.toolId, request.resourceGroupURL)
+                response = self.blackboardResourcesResponse(bbrrs, bbLinks)
+                sort_groups(response, groups)
+                self.pagedResults.put(key, response)
+        response = page_of(response, groups, version, offset, request.pageSize)
+        if request.compact:
+            return compact_response(response, "resources", "links")
+        return response
 
-        (rrs, links) = DepiServer.GetResourcesAndLinks(list(blackboard.changedLinks))
-        bbrrs = blackboard.getResources()
+    @staticmethod
+    def blackboardResourcesResponse(bbrrs, bbLinks) -> depi_pb2.GetBlackboardResourcesResponse:
+        (rrs, links) = DepiServer.GetResourcesAndLinks(bbLinks)
         for bbrr in bbrrs:
             rrs.add(bbrr)
 
         rrs = [rr.toGrpc(rg) for rg, rr in rrs]
-        return session.printGRPC(
-            depi_pb2.GetBlackboardResourcesResponse(
-                ok=True, msg="", resources=rrs,
-                links=links))
+        return depi_pb2.GetBlackboardResourcesResponse(
+            ok=True, msg="", resources=rrs,
+            links=links)
+
+    def GetBlackboardResourcesAsStream(self, request: depi_pb2.GetBlackboardResourcesRequest, context):
+        # The references to the requested slice are taken under the blackboard's lock, the
+        # messages are built and sent after it is released: the resources first, then the links,
+        # at most blackboard_stream_chunk_size of them per message.
+        session = self.get_session(request.sessionId)
+        if session is None:
+            yield depi_pb2.GetBlackboardResourcesResponse(ok=False, msg="Invalid session: {}".format(request.sessionId))
+            return
+
+        negotiate_compression(request, context)
+        chunkSize = get_config_value(config.serverConfig, "blackboard_stream_chunk_size", COMPACT_CHUNK_SIZE)
+        with self.blackboards.use(session.user.name) as blackboard:
+            resources, links = blackboard.getSlice(request.toolId, request.resourceGroupURL)
+
+        # the ends of the links are listed with the resources, as GetBlackboardResources does
+        seen = set()
+        rrs = []
+        for lk in links:
+            for rg, res in [(lk.fromResourceGroup, lk.fromRes), (lk.toResourceGroup, lk.toRes)]:
+                if (rg, res) not in seen:
+                    seen.add((rg, res))
+                    rrs.append((rg, res))
+        rrs = [(rg, res) for rg, res in resources if (rg, res) not in seen] + rrs
+
+        for field, items in [("resources", rrs), ("links", links)]:
+            for i in range(0, len(items), chunkSize):
+                response = depi_pb2.GetBlackboardResourcesResponse(ok=True, msg="")
+                if field == "resources":
+                    response.resources.extend([res.toGrpc(rg) for rg, res in items[i:i + chunkSize]])
+                else:
+                    response.links.extend([lk.toGrpc() for lk in items[i:i + chunkSize]])
+                if request.compact:
+                    response = compact_response(response, "resources", "links")
+                yield response
 
     def SaveBlackboard(self, request: depi_pb2.SaveBlackboardRequest, context):
-        self.printGRPC(request)
-        self.updateLock.acquire()
-        try:
-            session = self.get_session(request.sessionId)
-            if session is None:
-                return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+        # the unary form only reports how the save ended
+        progress = None
+        for progress in self.saveBlackboard(request):
+            pass
+        if progress.ok:
+            return self.GetSuccessResponse()
+        return self.GetFailureResponse(progress.msg)
 
-            if self.blackboardAlwaysMain:
-                branch = self.db.getBranch("main")
-            else:
-                branch = session.branch
+    def SaveBlackboardStream(self, request: depi_pb2.SaveBlackboardRequest, context):
+        yield from self.saveBlackboard(request)
+
+    def saveBlackboard(self, request: depi_pb2.SaveBlackboardRequest):
+        # The blackboard is normalized and authorized before the branch is locked, then a worker
+        # thread saves it in chunks under the branch's write lock while this generator reports its
+        # progress. The save is one version of the branch, or nothing if a chunk fails.
+        session = self.get_session(request.sessionId)
+        if session is None:
+            yield depi_pb2.SaveBlackboardProgress(ok=False, msg="Invalid session {}".format(request.sessionId))
+            return
+
+        if self.blackboardAlwaysMain:
+            branch = self.db.getBranch("main")
+        else:
+            branch = session.branch
 
-            blackboard = self.blackboards[session.user.name]
+        with self.blackboards.use(session.user.name) as blackboard:
+            revision = blackboard.revision
+            blackboardItems = (blackboard.getResources(), list(blackboard.changedLinks))
+            rs, links = self.copyForSave(*blackboardItems)
 
-            rs = blackboard.getResources()
-            if len(rs) > 0 and not self.hasCapability(session.user, CapResourceAdd):
-                return session.printGRPC(
-                    self.GetFailureResponse("User {} is not authorized to add resources".format(session.user.name)))
+        if len(rs) > 0 and not self.hasCapability(session.user, CapResourceAdd):
+            yield depi_pb2.SaveBlackboardProgress(
+                ok=False, msg="User {} is not authorized to add resources".format(session.user.name))
+            return
+        for (rg, res) in rs:
+            if not self.isAuthorized(session.user, CapResourceAdd, rg.toolId, rg.URL, res.URL):
+                yield depi_pb2.SaveBlackboardProgress(
+                    ok=False, msg="User {} is not authorized to add resources".format(session.user.name))
+                return
 
+        yield depi_pb2.SaveBlackboardProgress(ok=True, msg="", resourcesTotal=len(rs), linksTotal=len(links))
+
+        progress = queue.Queue()
+        worker = Thread(target=self.applySave, args=(session, branch, rs, links, revision, blackboardItems, progress),
+                        daemon=True)
+        worker.start()
+        try:
+            while True:
+                message = progress.get()
+                yield message
+                if message.done or not message.ok:
+                    return
+        finally:
+            worker.join()
+
+    def copyForSave(self, rs: list[tuple[ResourceGroup, Resource]], links: list[LinkWithResources]) -> \
+            tuple[list[tuple[ResourceGroup, Resource]], list[LinkWithResources]]:
+        # the branch can keep the objects it is given and the blackboard's are keyed by their URLs,
+        # so the save gets copies, with the URLs of the blackboard's resources normalized
+        groups = {}
+        resources = {}
+
+        def copyGroup(rg: ResourceGroup) -> ResourceGroup:
+            key = (rg.toolId, rg.URL)
+            if key not in groups:
+                groups[key] = ResourceGroup(rg.name, rg.toolId, rg.URL, rg.version)
+            return groups[key]
+
+        def copyResource(res: Resource, URL: str | None = None) -> Resource:
+            if id(res) not in resources:
+                resources[id(res)] = Resource(res.name, res.id, res.URL if URL is None else URL, res.deleted)
+            return resources[id(res)]
+
+        rsCopy = []
+        for (rg, res) in rs:
+            toolConfig = config.getToolConfig(rg.toolId)
+            URL = res.URL
+            if not URL.startswith(toolConfig.pathSeparator):
+                URL = toolConfig.pathSeparator + URL
+            rsCopy.append((copyGroup(rg), copyResource(res, URL)))
+
+        linksCopy = []
+        for link in links:
+            inferred = [(copyGroup(rg), copyResource(res), lastClean) for (rg, res, lastClean) in link.inferredDirtiness]
+            linkCopy = LinkWithResources(copyGroup(link.fromResourceGroup), copyResource(link.fromRes),
+                                         copyGroup(link.toResourceGroup), copyResource(link.toRes),
+                                         link.dirty, link.lastCleanVersion, inferred)
+            linkCopy.deleted = link.deleted
+            linksCopy.append(linkCopy)
+        return rsCopy, linksCopy
+
+    def applySave(self, session, branch: DepiBranch, rs: list[tuple[ResourceGroup, Resource]],
+                  links: list[LinkWithResources], revision: int, blackboardItems: tuple[list, list],
+                  progress: queue.Queue):
+        # rs and links are the copies the branch is given, blackboardItems what is on the blackboard
+        chunkSize = get_config_value(config.serverConfig, "save_chunk_size", BULK_IMPORT_CHUNK_SIZE)
+        resourcesSaved = 0
+        linksSaved = 0
+
+        def report(**kwargs):
+            progress.put(depi_pb2.SaveBlackboardProgress(ok=True, msg="", resourcesTotal=len(rs), linksTotal=len(links),
+                                                         resourcesSaved=resourcesSaved, linksSaved=linksSaved,
+                                                         **kwargs))
+
+        self.acquireWrite(branch.name)
+        try:
+            # the versions are checked under the lock, main may have moved on since the blackboard was read
             checked_versions = set()
             for (rg, res) in rs:
                 if (rg.toolId, rg.URL, rg.version) not in checked_versions:
                     rg_version = branch.getResourceGroupVersion(rg.toolId, rg.URL)
                     if rg_version != '' and rg_version != rg.version:
-                        return session.printGRPC(
-                            self.GetFailureResponse(
-                                "Resource version in blackboard {} does not match resource version in Depi {}".format(
-                                    rg.version, rg_version)))
+                        progress.put(depi_pb2.SaveBlackboardProgress(
+                            ok=False, msg="Resource version in blackboard {} does not match resource version in Depi {}".format(
+                                rg.version, rg_version)))
+                        return
                     checked_versions.add((rg.toolId, rg.URL, rg.version))
 
-                toolConfig = config.getToolConfig(rg.toolId)
-                if not res.URL.startswith(toolConfig.pathSeparator):
-                    res.URL = toolConfig.pathSeparator + res.URL
-
-                if not self.isAuthorized(session.user, CapResourceAdd, rg.toolId, rg.URL, res.URL):
-                    return session.printGRPC(
-                        self.GetFailureResponse("User {} is not authorized to add resources".format(session.user.name)))
-
-            #                branch.addResource(rg, res)
-
-            start = datetime.datetime.now()
-            if len(rs) > 1000:
-                for i in range(0, len(rs), 1000):
-                    if (len(rs) - i < 1000):
-                        branch.addResources(rs[i:len(rs)])
-                    else:
-                        branch.addResources(rs[i:i + 1000])
-            else:
-                branch.addResources(rs)
-
-            end = datetime.datetime.now()
-            logging.debug("It took {} seconds to save the blackboard resources".format((end - start).total_seconds()))
-
-            #            for lk in blackboard.changedLinks:
-            #                branch.addLink(lk)
-            start = datetime.datetime.now()
-            branch.addLinks(list(blackboard.changedLinks))
-            end = datetime.datetime.now()
-
-            resUpdates = [depi_pb2.Update(resource=res.toGrpc(rg)) for (rg,res) in rs]
-            linkUpdates = [depi_pb2.Update(link=link.toGrpc()) for link in blackboard.changedLinks]
-
-            branch.saveBranchState()
-            self._clearBlackboard(session.user.name)
+            version = branch.getVersion()
+            try:
+                start = time.perf_counter()
+                for i in range(0, len(rs), chunkSize):
+                    branch.addResources(rs[i:i + chunkSize])
+                    resourcesSaved += len(rs[i:i + chunkSize])
+                    report()
+                elapsed = time.perf_counter() - start
+                BLACKBOARD_OPERATION_DURATION.labels("saveResources").observe(elapsed)
+                logging.debug("It took {} seconds to save the blackboard resources".format(elapsed))
+
+                start = time.perf_counter()
+                for i in range(0, len(links), chunkSize):
+                    branch.addLinks(links[i:i + chunkSize])
+                    linksSaved += len(links[i:i + chunkSize])
+                    report()
+                elapsed = time.perf_counter() - start
+                BLACKBOARD_OPERATION_DURATION.labels("saveLinks").observe(elapsed)
+                logging.debug("It took {} seconds to save the blackboard links".format(elapsed))
+
+                branch.saveBranchState()
+            except Exception as exc:
+                logging.exception("Saving the blackboard of {} failed, restoring version {}".format(
+                    session.user.name, version))
+                branch.restoreVersion(version)
+                progress.put(depi_pb2.SaveBlackboardProgress(ok=False, msg="Save failed: {}".format(exc)))
+                return
 
-            logging.debug("Sending depi update for {} resources and {} links to {} listeners".format(len(resUpdates), len(linkUpdates), self.numDepiWatchers(None)))
-            allUpdates = resUpdates + linkUpdates
-            depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=allUpdates)
-            for session in self.sessions.values():
-                if session.watchingDepi:
-                    session.depiUpdates.put(depiUpdate)
+            with self.blackboards.use(session.user.name) as blackboard:
+                if blackboard.revision == revision:
+                    self._clearBlackboard(session.user.name)
+                else:
+                    # the blackboard was changed during the save, only what was saved leaves it
+                    updates = blackboard.removeSaved(*blackboardItems)
+                    if len(updates) > 0:
+                        self.hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
+        except Exception as exc:
+            logging.exception("Saving the blackboard of {} failed".format(session.user.name))
+            progress.put(depi_pb2.SaveBlackboardProgress(ok=False, msg="Save failed: {}".format(exc)))
+            return
+        finally:
+            self.releaseWrite(branch.name)
 
-            logging.debug("It took {} seconds to save the blackboard links".format((end - start).total_seconds()))
+        # the watchers get the saved resources and links in messages of at most chunkSize updates
+        allUpdates = [depi_pb2.Update(resource=res.toGrpc(rg)) for (rg, res) in rs] + \
+                     [depi_pb2.Update(link=link.toGrpc()) for link in links]
+        logging.debug("Sending depi update for {} resources and {} links to {} listeners".format(
+            len(rs), len(links), self.numDepiWatchers(branch.name)))
+        for i in range(0, len(allUpdates), chunkSize):
+            self.hub.publishDepi(branch.name, depi_pb2.DepiUpdate(ok=True, msg="", updates=allUpdates[i:i + chunkSize]))
 
-            for (rg,res) in rs:
-                self.write_audit_log_entry(session.user.name, "AddResource", "toolId={};rgURL={};URL={}".format(
-                    rg.toolId, rg.URL, res.URL))
+        for (rg, res) in rs:
+            self.write_audit_log_entry(session.user.name, "AddResource", "toolId={};rgURL={};URL={}".format(
+                rg.toolId, rg.URL, res.URL))
 
-            for link in blackboard.changedLinks:
-                self.write_audit_log_entry(session.user.name, "LinkResources", "fromToolId={};fromRgURL={};fromURL={};toToolId={};toRgURL={};toURL={}".format(
-                    link.fromResourceGroup.toolId, link.fromResourceGroup.URL,
-                    link.fromRes.URL, link.toResourceGroup.toolId,
-                    link.toResourceGroup.URL, link.toRes.URL))
+        for link in links:
+            self.write_audit_log_entry(session.user.name, "LinkResources", "fromToolId={};fromRgURL={};fromURL={};toToolId={};toRgURL={};toURL={}".format(
+                link.fromResourceGroup.toolId, link.fromResourceGroup.URL,
+                link.fromRes.URL, link.toResourceGroup.toolId,
+                link.toResourceGroup.URL, link.toRes.URL))
 
-            return session.printGRPC(self.GetSuccessResponse())
-        finally:
-            self.updateLock.release()
+        report(done=True)
 
     def _clearBlackboard(self, user):
-        if user in self.blackboards:
-            oldBlackboard = self.blackboards[user]
+        with self.blackboards.use(user) as oldBlackboard:
             updates = []
             for tool in oldBlackboard.resources.values():
                 for rg in tool.values():
@@ -1449,130 +1797,168 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                                link=link.toGrpc()))
 
             if len(updates) > 0:
-                for sess in self.sessions.values():
-                    if sess.watchingBlackboard:
-                        sess.blackboardUpdates.put(
-                            depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
+                self.hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg="", updates=updates))
+            oldBlackboard.detach()
 
-        self.blackboards[user] = Blackboard()
+            # the revision carries on, so pages read from the old blackboard aren't taken for the new one's
+            newBlackboard = Blackboard(user, self.blackboardIndex)
+            newBlackboard.revision = oldBlackboard.revision + 1
+            self.blackboards[user] = newBlackboard
 
     def ClearBlackboard(self, request: depi_pb2.ClearBlackboardRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         self._clearBlackboard(session.user.name)
 
-        return session.printGRPC(self.GetSuccessResponse())
+        return self.GetSuccessResponse()
 
     def GetDirtyLinks(self, request: depi_pb2.GetDirtyLinksRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(depi_pb2.GetDirtyLinksResponse(
+            return depi_pb2.GetDirtyLinksResponse(
                 ok=False, msg="Invalid session {}".format(request.sessionId),
                 resources=[],
-                links=[]))
-
-        branch = session.branch
+                links=[])
 
         if not self.hasCapability(session.user, CapLinkRead):
-            return session.printGRPC(
-                depi_pb2.GetDirtyLinksResponse(
-                    ok=False, msg="User {} cannot read links".format(session.user.name),
-                    resources=[],
-                    links=[]))
+            return depi_pb2.GetDirtyLinksResponse(
+                ok=False, msg="User {} cannot read links".format(session.user.name),
+                resources=[],
+                links=[])
 
         logging.debug("Fetching dirty resources for {} {}".format(
             request.toolId, request.URL))
-        resources = []
-        links = []
-        for link in branch.getDirtyLinks(ResourceGroup(toolId=request.toolId, URL=request.URL,name="",version=""), request.withInferred):
-            if self.isAuthorized(session.user, CapLinkRead, link.fromResourceGroup.toolId,
-                                 link.fromResourceGroup.URL, link.fromRes.URL,
-                                 link.toResourceGroup.toolId, link.toResourceGroup.URL,
-                                 link.toRes.URL):
-                logging.debug("Link to {} is dirty".format(link.toRes.URL))
-                resources.append((link.toResourceGroup, link.toRes))
-                links.append(link)
-            else:
-                logging.warning("User {} is not authorized to read link {} {} {} -> {} {} {}".format(
-                    session.user.name,
-                    link.fromResourceGroup.toolId, link.fromResourceGroup.URL, link.fromRes.URL,
-                    link.toResourceGroup.toolId, link.toResourceGroup.URL, link.toRes.URL))
-
-        return session.printGRPC(
-            depi_pb2.GetDirtyLinksResponse(
+        checkRows = self.authScope(session.user, CapLinkRead) != SCOPE_UNRESTRICTED
+        # no links into the resource group can be read, it isn't queried
+        visible = self.mayBeAuthorized(session.user, CapLinkRead, None, None, None, request.toolId, request.URL, None)
+        negotiate_compression(request, context)
+
+        def build(branch):
+            resources = []
+            links = []
+            dirtyLinks = []
+            if visible:
+                dirtyLinks = branch.getDirtyLinks(ResourceGroup(toolId=request.toolId, URL=request.URL, name="", version=""),
+                                                  request.withInferred)
+            for link in dirtyLinks:
+                if not checkRows or self.isAuthorized(session.user, CapLinkRead, link.fromResourceGroup.toolId,
+                                     link.fromResourceGroup.URL, link.fromRes.URL,
+                                     link.toResourceGroup.toolId, link.toResourceGroup.URL,
+                                     link.toRes.URL):
+                    logging.debug("Link to {} is dirty".format(link.toRes.URL))
+                    resources.append((link.toResourceGroup, link.toRes))
+                    links.append(link)
+                else:
+                    logging.warning("User {} is not authorized to read link {} {} {} -> {} {} {}".format(
+                        session.user.name,
+                        link.fromResourceGroup.toolId, link.fromResourceGroup.URL, link.fromRes.URL,
+                        link.toResourceGroup.toolId, link.toResourceGroup.URL, link.toRes.URL))
+
+            return depi_pb2.GetDirtyLinksResponse(
                 ok=True, msg="", resources=[r.toGrpc(rg) for rg, r in resources],
-                links=[lk.toGrpc() for lk in links]))
+                links=[lk.toGrpc() for lk in links])
 
-    def GetDirtyLinksAsStream(self, request: depi_pb2.GetDirtyLinksRequest, context):
-        self.printGRPC(request)
+        response = self.pagedRead("GetDirtyLinks", session, request, depi_pb2.GetDirtyLinksResponse, build,
+                                  [(["links", "resources"], link_key)])
+        if request.compact:
+            return compact_response(response, "resources", "links")
+        return response
 
+    def GetDirtyLinksAsStream(self, request: depi_pb2.GetDirtyLinksRequest, context):
         session = self.get_session(request.sessionId)
         if session is None:
-            yield self.printGRPC(depi_pb2.GetDirtyLinksAsStreamResponse(ok=False,
-                                                   msg="Invalid session {}".format(
-                                                       request.sessionId),
-                                                   resource=depi_pb2.Resource(), link=depi_pb2.ResourceLink()))
+            yield depi_pb2.GetDirtyLinksAsStreamResponse(ok=False,
+                                                         msg="Invalid session {}".format(
+                                                             request.sessionId),
+                                                         resource=depi_pb2.Resource(), link=depi_pb2.ResourceLink())
             return
 
         branch = session.branch
 
         if not self.hasCapability(session.user, CapLinkRead):
-            yield session.printGRPC(
-                depi_pb2.GetDirtyLinksAsStreamResponse(ok=False,
-                                               msg="User {} is not authorized to read links".format(session.user.name),
-                                               resource=depi_pb2.Resource(), link=depi_pb2.ResourceLink()))
+            yield depi_pb2.GetDirtyLinksAsStreamResponse(ok=False,
+                                                         msg="User {} is not authorized to read links".format(session.user.name),
+                                                         resource=depi_pb2.Resource(), link=depi_pb2.ResourceLink())
             return
 
         logging.debug("Fetching dirty resources for {} {}".format(
             request.toolId, request.URL))
-        resources = []
-        for link in branch.getDirtyLinksAsStream(ResourceGroup(toolId=request.toolId, URL=request.URL, name="", version=""), request.withInferred):
-            if self.isAuthorized(session.user, CapLinkRead, link.fromResourceGroup.toolId,
-                                 link.fromResourceGroup.URL, link.fromRes.URL,
-                                 link.toResourceGroup.toolId, link.toResourceGroup.URL,
-                                 link.toRes.URL):
-                logging.debug("Link to {} is dirty".format(link.toRes.URL))
-                resources.append((link.toResourceGroup, link.toRes))
-                yield depi_pb2.GetDirtyLinksAsStreamResponse(ok=True, msg='',
-                    resource=link.toRes.toGrpc(link.toResourceGroup),
-                                                    link=link.toGrpc())
-            else:
-                logging.warning("User {} is not authorized to read link {} {} {} -> {} {} {}".format(
-                    session.user.name,
-                    link.fromResourceGroup.toolId, link.fromResourceGroup.URL, link.fromRes.URL,
-                    link.toResourceGroup.toolId, link.toResourceGroup.URL, link.toRes.URL))
+        checkRows = self.authScope(session.user, CapLinkRead) != SCOPE_UNRESTRICTED
+        # no links into the resource group can be read, it isn't queried
+        visible = self.mayBeAuthorized(session.user, CapLinkRead, None, None, None, request.toolId, request.URL, None)
+        negotiate_compression(request, context)
+        # the responses are built under the read lock and sent after it is released, so a slow
+        # client doesn't hold up the writers on the branch
+        responses = []
+        self.branchLocks.acquireRead(branch.name)
+        try:
+            dirtyLinks = []
+            if visible:
+                dirtyLinks = branch.getDirtyLinksAsStream(ResourceGroup(toolId=request.toolId, URL=request.URL, name="", version=""),
+                                                          request.withInferred)
+            for link in dirtyLinks:
+                if not checkRows or self.isAuthorized(session.user, CapLinkRead, link.fromResourceGroup.toolId,
+                                     link.fromResourceGroup.URL, link.fromRes.URL,
+                                     link.toResourceGroup.toolId, link.toResourceGroup.URL,
+                                     link.toRes.URL):
+                    logging.debug("Link to {} is dirty".format(link.toRes.URL))
+                    responses.append(depi_pb2.GetDirtyLinksAsStreamResponse(ok=True, msg='',
+                                                                            resource=link.toRes.toGrpc(link.toResourceGroup),
+                                                                            link=link.toGrpc()))
+                else:
+                    logging.warning("User {} is not authorized to read link {} {} {} -> {} {} {}".format(
+                        session.user.name,
+                        link.fromResourceGroup.toolId, link.fromResourceGroup.URL, link.fromRes.URL,
+                        link.toResourceGroup.toolId, link.toResourceGroup.URL, link.toRes.URL))
+        finally:
+            self.branchLocks.releaseRead(branch.name)
 
-    def MarkLinksClean(self, request: depi_pb2.MarkLinksCleanRequest, context):
-        self.printGRPC(request)
+        if request.compact:
+            responses = compact_stream(depi_pb2.GetDirtyLinksAsStreamResponse, responses, "resource", "link")
+        for response in responses:
+            yield response
 
+    def GetDirtySummary(self, request: depi_pb2.GetDirtySummaryRequest, context):
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return depi_pb2.GetDirtySummaryResponse(
+                ok=False, msg="Invalid session {}".format(request.sessionId), counts=[])
 
-        self.updateLock.acquire()
-        try:
-            branch = session.branch
+        if not self.hasCapability(session.user, CapLinkRead):
+            return depi_pb2.GetDirtySummaryResponse(
+                ok=False, msg="User {} cannot read links".format(session.user.name), counts=[])
+
+        def build(branch):
+            counts = [dirty_count_to_grpc(key, count) for key, count in sorted(self.dirtySummary(branch)[1].items())
+                      if self.isAuthorized(session.user, CapResGroupRead, key[0], key[1])]
+            return depi_pb2.GetDirtySummaryResponse(ok=True, msg="", counts=counts)
+
+        return self.cachedRead("GetDirtySummary", session, request, depi_pb2.GetDirtySummaryResponse, build)
+
+    def MarkLinksClean(self, request: depi_pb2.MarkLinksCleanRequest, context):
+        session = self.get_session(request.sessionId)
+        if session is None:
+            return self.GetInvalidSessionResponse(request.sessionId)
 
+        branch = session.branch
+        self.acquireWrite(branch.name)
+        try:
             if not self.hasCapability(session.user, CapLinkMarkClean):
-                return session.printGRPC(self.GetFailureResponse(
-                    "User {} is not authorized to mark links clean".format(session.user.name)))
+                return self.GetFailureResponse(
+                    "User {} is not authorized to mark links clean".format(session.user.name))
 
             for link in request.links:
                 if not self.isAuthorized(session.user, CapLinkMarkClean,
                                          link.fromRes.toolId, link.fromRes.resourceGroupURL,
                                          link.fromRes.URL, link.toRes.toolId, link.toRes.resourceGroupURL,
                                          link.toRes.URL):
-                    return session.printGRPC(self.GetFailureResponse(
+                    return self.GetFailureResponse(
                         "User {} is not authorized to mark link {} {} {} -> {} {} {} clean".format(
                             session.user.name, link.fromRes.toolId, link.fromRes.resourceGroupURL,
                             link.fromRes.URL, link.toRes.toolId, link.toRes.resourceGroupURL,
-                            link.toRes.URL)))
+                            link.toRes.URL))
 
             links_to_clean = [Link.fromGrpcRef(l) for l in request.links]
 
@@ -1588,35 +1974,28 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
             if len(updates) > 0:
                 logging.debug("Sending depi update for {} resources to {} listeners".format(len(updates), self.numDepiWatchers(branch.name)))
                 depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=updates)
-                for session in self.sessions.values():
-                    # only send updates to sessions watching the same branch
-                    if session.branch.name != branch.name:
-                        continue
-                    if session.watchingDepi:
-                        session.depiUpdates.put(depiUpdate)
+                self.hub.publishDepi(branch.name, depiUpdate)
 
             for link in cleaned_links:
                 self.write_audit_log_entry(session.user.name, "CleanedLink", "fromToolId={};fromRgURL={};fromURL={};toToolId={};toRgURL={};toURL={}".format(
                     link.fromResourceGroup.toolId, link.fromResourceGroup.URL,
                     link.fromRes.URL, link.toResourceGroup.toolId,
                     link.toResourceGroup.URL, link.toRes.URL))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def MarkInferredDirtinessClean(self, request: depi_pb2.MarkInferredDirtinessCleanRequest, context):
-        self.printGRPC(request)
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
-        self.updateLock.acquire()
+        branch = session.branch
+        self.acquireWrite(branch.name)
         try:
-            branch = session.branch
-
             if not self.hasCapability(session.user, CapLinkMarkClean):
-                return session.printGRPC(self.GetFailureResponse(
-                    "User {} is not authorized to mark links clean".format(session.user.name)))
+                return self.GetFailureResponse(
+                    "User {} is not authorized to mark links clean".format(session.user.name))
 
             targetLink = Link.fromGrpcRef(request.link)
 
@@ -1624,11 +2003,11 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                                      targetLink.fromRes.toolId, targetLink.fromRes.resourceGroupURL,
                                      targetLink.fromRes.URL, targetLink.toRes.toolId,
                                      targetLink.toRes.resourceGroupURL, targetLink.toRes.URL):
-                return session.printGRPC(self.GetFailureResponse(
+                return self.GetFailureResponse(
                     "User {} is not authorized to mark link {} {} {} -> {} {} {} clean".format(
                         session.user.name, targetLink.fromRes.toolId, targetLink.fromRes.resourceGroupURL,
                         targetLink.fromRes.URL, targetLink.toRes.toolId, targetLink.toRes.resourceGroupURL,
-                        targetLink.toRes.URL)))
+                        targetLink.toRes.URL))
 
             dirtinessSource = ResourceRef.fromGrpc(request.dirtinessSource)
             cleaned = branch.markInferredDirtinessClean(targetLink, dirtinessSource, request.propagateCleanliness)
@@ -1643,12 +2022,7 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
 
                 logging.debug("Sending depi update for {} resources to {} listeners".format(len(updates), self.numDepiWatchers(branch.name)))
                 depiUpdate = depi_pb2.DepiUpdate(ok=True, msg="", updates=updates)
-                for session in self.sessions.values():
-                    # only send updates to sessions watching the same branch
-                    if session.branch.name != branch.name:
-                        continue
-                    if session.watchingDepi:
-                        session.depiUpdates.put(depiUpdate)
+                self.hub.publishDepi(branch.name, depiUpdate)
 
             self.write_audit_log_entry(session.user.name, "CleanedInferredLink", "fromToolId={};fromRgURL={};fromURL={};toToolId={};toRgURL={};toURL={};sourceToolId={};sourceRgURL={};sourceURL={};proagate={}".format(
                 targetLink.fromRes.toolId, targetLink.fromRes.resourceGroupURL,
@@ -1656,285 +2030,298 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
                 targetLink.toRes.resourceGroupURL, targetLink.toRes.URL,
                 dirtinessSource.toolId, dirtinessSource.resourceGroupURL,
                 dirtinessSource.URL, request.propagateCleanliness))
-            return session.printGRPC(self.GetSuccessResponse())
+            return self.GetSuccessResponse()
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def DumpDatabase(self, request, context):
-        self.printGRPC(request)
-        self.updateLock.acquire()
-        try:
-            #            self.saveState()
-            pass
-        finally:
-            self.updateLock.release()
+        #            self.saveState()
+        pass
 
     def GetResourceGroups(self, request: depi_pb2.GetResourceGroupsRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(
-                depi_pb2.GetResourceGroupsResponse(
-                    ok=False,
-                    msg="Invalid session {}".format(request.sessionId)))
+            return depi_pb2.GetResourceGroupsResponse(
+                ok=False,
+                msg="Invalid session {}".format(request.sessionId))
 
         if not self.hasCapability(session.user, CapResGroupRead):
-            return session.printGRPC(
-                depi_pb2.GetResourceGroupsResponse(
-                    ok=False,
-                    msg="User {} not authorized to read any resource groups".format(session.user.name),
-                    resourceGroups=[]))
+            return depi_pb2.GetResourceGroupsResponse(
+                ok=False,
+                msg="User {} not authorized to read any resource groups".format(session.user.name),
+                resourceGroups=[])
 
-        branch = session.branch
-
-        resourceGroups = [rg.toGrpc(False) for rg in branch.getResourceGroups()
-                          if self.isAuthorized(session.user, CapResGroupRead, rg.toolId, rg.URL)]
+        def build(branch):
+            resourceGroups = [rg.toGrpc(False) for rg in branch.getResourceGroups()
+                              if self.isAuthorized(session.user, CapResGroupRead, rg.toolId, rg.URL)]
+            return depi_pb2.GetResourceGroupsResponse(
+                ok=True, msg="", resourceGroups=resourceGroups)
 
-        return session.printGRPC(
-            depi_pb2.GetResourceGroupsResponse(
-                ok=True, msg="", resourceGroups=resourceGroups))
+        return self.cachedRead("GetResourceGroups", session, request, depi_pb2.GetResourceGroupsResponse, build)
 
     def GetResourceGroupsForTag(self, request: depi_pb2.GetResourceGroupsForTagRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(
-                depi_pb2.GetResourceGroupsResponse(
-                    ok=False,
-                    msg="Invalid session {}".format(request.sessionId),
-                    resourceGroups=[]))
+            return depi_pb2.GetResourceGroupsResponse(
+                ok=False,
+                msg="Invalid session {}".format(request.sessionId),
+                resourceGroups=[])
 
         if not self.hasCapability(session.user, CapResGroupRead):
-            return session.printGRPC(
-                depi_pb2.GetResourceGroupsResponse(
-                    ok=False,
-                    msg="User {} not authorized to read any resource groups".format(session.user.name),
-                    resourceGroups=[]))
+            return depi_pb2.GetResourceGroupsResponse(
+                ok=False,
+                msg="User {} not authorized to read any resource groups".format(session.user.name),
+                resourceGroups=[])
 
         branch = self.db.getTag(request.tag)
 
         resourceGroups = [rg.toGrpc(False) for rg in branch.getResourceGroups()
                           if self.isAuthorized(session.user, CapResGroupRead, rg.toolId, rg.URL)]
 
-        return session.printGRPC(
-            depi_pb2.GetResourceGroupsResponse(
-                ok=True, msg="", resourceGroups=resourceGroups))
+        return depi_pb2.GetResourceGroupsResponse(
+            ok=True, msg="", resourceGroups=resourceGroups)
 
     def GetResources(self, request: depi_pb2.GetResourcesRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(
-                depi_pb2.GetResourcesResponse(ok=False, resources=[],
-                                              msg="Invalid session {}".format(
-                                                  request.sessionId)))
-
-        branch = session.branch
+            return depi_pb2.GetResourcesResponse(ok=False, resources=[],
+                                                 msg="Invalid session {}".format(
+                                                     request.sessionId))
 
         if not self.hasCapability(session.user, CapResourceRead):
-            return self.printGRPC(
-                depi_pb2.GetResourcesResponse(ok=False, resources=[],
-                                              msg="User {} is not authorized to read resources".format(
-                                                  session.user.name)))
+            return depi_pb2.GetResourcesResponse(ok=False, resources=[],
+                                                 msg="User {} is not authorized to read resources".format(
+                                                     session.user.name))
 
+        # resource groups the user can't read resources of are left out of the query, and the
+        # resources only need checking when the rules depend on their URLs
         patterns = [ResourceRefPattern.fromGrpc(p) for p in request.patterns
-                    if self.isAuthorized(session.user, CapResGroupRead, p.toolId, p.resourceGroupURL)]
-        resources = [res.toGrpc(rg) for (rg, res) in branch.getResources(
-            patterns, request.includeDeleted) if self.isAuthorized(session.user, CapResourceRead, rg.toolId, rg.URL, res.URL)]
+                    if self.isAuthorized(session.user, CapResGroupRead, p.toolId, p.resourceGroupURL) and
+                    self.mayBeAuthorized(session.user, CapResourceRead, p.toolId, p.resourceGroupURL, None)]
+        checkRows = self.authScope(session.user, CapResourceRead) == SCOPE_PATTERNS
+
+        negotiate_compression(request, context)
 
-        return session.printGRPC(
-            depi_pb2.GetResourcesResponse(
+        def build(branch):
+            resources = [res.toGrpc(rg) for (rg, res) in branch.getResources(patterns, request.includeDeleted)
+                         if not checkRows or self.isAuthorized(session.user, CapResourceRead, rg.toolId, rg.URL, res.URL)]
+            return depi_pb2.GetResourcesResponse(
                 ok=True, msg="",
-                resources=resources))
+                resources=resources)
 
-    def GetResourcesAsStream(self, request: depi_pb2.GetResourcesRequest, context):
-        self.printGRPC(request)
+        response = self.pagedRead("GetResources", session, request, depi_pb2.GetResourcesResponse, build,
+                                  [(["resources"], resource_key)])
+        if request.compact:
+            return compact_response(response, "resources")
+        return response
 
+    def GetResourcesAsStream(self, request: depi_pb2.GetResourcesRequest, context):
         def generator(resources):
             for resource in resources:
                 yield resource
 
         session = self.get_session(request.sessionId)
         if session is None:
-            return generator([self.printGRPC(
-                depi_pb2.GetResourcesAsStreamResponse(ok=False, resource=depi_pb2.Resource(),
-                                              msg="Invalid session {}".format(request.sessionId)))])
+            return generator([depi_pb2.GetResourcesAsStreamResponse(ok=False, resource=depi_pb2.Resource(),
+                                                            msg="Invalid session {}".format(request.sessionId))])
 
         branch = session.branch
 
         if not self.hasCapability(session.user, CapResourceRead):
-            return generator([self.printGRPC(
-                depi_pb2.GetResourcesAsStreamResponse(ok=False, resource=depi_pb2.Resource(),
-                                              msg="User {} is not authorized to read resources".format(
-                                                  session.user.name)))])
+            return generator([depi_pb2.GetResourcesAsStreamResponse(ok=False, resource=depi_pb2.Resource(),
+                                                            msg="User {} is not authorized to read resources".format(
+                                                                session.user.name))])
 
+        # resource groups the user can't read resources of are left out of the query, and the
+        # resources only need checking when the rules depend on their URLs
         patterns = [ResourceRefPattern.fromGrpc(p) for p in request.patterns
-                    if self.isAuthorized(session.user, CapResGroupRead, p.toolId, p.resourceGroupURL)]
-        for (rg, res) in branch.getResourcesAsStream(patterns):
-           if self.isAuthorized(session.user, CapResourceRead, rg.toolId, rg.URL, res.URL):
-               yield depi_pb2.GetResourcesAsStreamResponse(ok=True, msg='', resource=res.toGrpc(rg))
+                    if self.isAuthorized(session.user, CapResGroupRead, p.toolId, p.resourceGroupURL) and
+                    self.mayBeAuthorized(session.user, CapResourceRead, p.toolId, p.resourceGroupURL, None)]
+        checkRows = self.authScope(session.user, CapResourceRead) == SCOPE_PATTERNS
+        negotiate_compression(request, context)
+        self.branchLocks.acquireRead(branch.name)
+        try:
+            responses = [depi_pb2.GetResourcesAsStreamResponse(ok=True, msg='', resource=res.toGrpc(rg))
+                         for (rg, res) in branch.getResourcesAsStream(patterns)
+                         if not checkRows or self.isAuthorized(session.user, CapResourceRead, rg.toolId, rg.URL, res.URL)]
+        finally:
+            self.branchLocks.releaseRead(branch.name)
 
-    def GetLinks(self, request: depi_pb2.GetLinksRequest, context):
-        self.printGRPC(request)
+        if request.compact:
+            responses = compact_stream(depi_pb2.GetResourcesAsStreamResponse, responses, "resource")
+        for response in responses:
+            yield response
 
+    def GetLinks(self, request: depi_pb2.GetLinksRequest, context):
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(
-                depi_pb2.GetResourcesResponse(ok=False, resources=[],
-                                              msg="Invalid session {}".format(request.sessionId)))
-
-        branch = session.branch
+            return depi_pb2.GetResourcesResponse(ok=False, resources=[],
+                                                 msg="Invalid session {}".format(request.sessionId))
 
         if not self.hasCapability(session.user, CapLinkRead):
-            return self.printGRPC(
-                depi_pb2.GetResourcesResponse(ok=False, resources=[],
-                                              msg="User {} is not authorized to read links".format(session.user.name)))
-
-        patterns = [ResourceLinkPattern.fromGrpc(p) for p in request.patterns]
-
-        links = [lk.toGrpc() for lk in branch.getLinks(patterns)
-                 if self.isAuthorized(session.user, CapLinkRead, lk.fromResourceGroup.toolId,
-                                      lk.fromResourceGroup.URL, lk.fromRes.URL,
-                                      lk.toResourceGroup.toolId, lk.toResourceGroup.URL,
-                                      lk.toRes.URL)]
-
-        return session.printGRPC(
-            depi_pb2.GetLinksResponse(
-                ok=True, msg="", resourceLinks=links))
+            return depi_pb2.GetResourcesResponse(ok=False, resources=[],
+                                                 msg="User {} is not authorized to read links".format(session.user.name))
+
+        patterns = [ResourceLinkPattern.fromGrpc(p) for p in request.patterns
+                    if self.mayBeAuthorized(session.user, CapLinkRead, p.fromRes.toolId, p.fromRes.resourceGroupURL,
+                                            None, p.toRes.toolId, p.toRes.resourceGroupURL, None)]
+        checkRows = self.authScope(session.user, CapLinkRead) == SCOPE_PATTERNS
+        negotiate_compression(request, context)
+
+        def build(branch):
+            links = [lk.toGrpc() for lk in branch.getLinks(patterns)
+                     if not checkRows or self.isAuthorized(session.user, CapLinkRead, lk.fromResourceGroup.toolId,
+                                          lk.fromResourceGroup.URL, lk.fromRes.URL,
+                                          lk.toResourceGroup.toolId, lk.toResourceGroup.URL,
+                                          lk.toRes.URL)]
+            return depi_pb2.GetLinksResponse(
+                ok=True, msg="", resourceLinks=links)
+
+        response = self.pagedRead("GetLinks", session, request, depi_pb2.GetLinksResponse, build,
+                                  [(["resourceLinks"], link_key)])
+        if request.compact:
+            return compact_response(response, linkField="resourceLinks")
+        return response
 
     def GetLinksAsStream(self, request: depi_pb2.GetLinksRequest, context):
-        self.printGRPC(request)
-
         def generator(send_links):
             for link in send_links:
                 yield link
 
         session = self.get_session(request.sessionId)
         if session is None:
-            return generator([self.printGRPC(
-                depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
-                                                      msg="Invalid session {}".format(request.sessionId)))])
+            return generator([depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
+                                                                    msg="Invalid session {}".format(request.sessionId))])
 
         branch = session.branch
 
         if not self.hasCapability(session.user, CapLinkRead):
-            return generator([self.printGRPC(
-                depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
-                                                      msg="User {} is not authorized to read links".format(
-                                                          session.user.name)))])
+            return generator([depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
+                                                                    msg="User {} is not authorized to read links".format(
+                                                                        session.user.name))])
 
-        patterns = [ResourceLinkPattern.fromGrpc(p) for p in request.patterns]
+        patterns = [ResourceLinkPattern.fromGrpc(p) for p in request.patterns
+                    if self.mayBeAuthorized(session.user, CapLinkRead, p.fromRes.toolId, p.fromRes.resourceGroupURL,
+                                            None, p.toRes.toolId, p.toRes.resourceGroupURL, None)]
+        checkRows = self.authScope(session.user, CapLinkRead) == SCOPE_PATTERNS
+        negotiate_compression(request, context)
 
-        links = [depi_pb2.GetLinksAsStreamResponse(ok=True, msg='', resourceLink=lk.toGrpc())
-                 for lk in branch.getLinks(patterns)
-                 if self.isAuthorized(session.user, CapLinkRead, lk.fromResourceGroup.toolId,
-                                      lk.fromResourceGroup.URL, lk.fromRes.URL,
-                                      lk.toResourceGroup.toolId, lk.toResourceGroup.URL,
-                                      lk.toRes.URL)]
+        self.branchLocks.acquireRead(branch.name)
+        try:
+            links = [depi_pb2.GetLinksAsStreamResponse(ok=True, msg='', resourceLink=lk.toGrpc())
+                     for lk in branch.getLinks(patterns)
+                     if not checkRows or self.isAuthorized(session.user, CapLinkRead, lk.fromResourceGroup.toolId,
+                                          lk.fromResourceGroup.URL, lk.fromRes.URL,
+                                          lk.toResourceGroup.toolId, lk.toResourceGroup.URL,
+                                          lk.toRes.URL)]
+        finally:
+            self.branchLocks.releaseRead(branch.name)
 
+        if request.compact:
+            return compact_stream(depi_pb2.GetLinksAsStreamResponse, links, linkField="resourceLink")
         return generator(links)
 
     def GetAllLinksAsStream(self, request: depi_pb2.GetAllLinksAsStreamRequest, context):
-        self.printGRPC(request)
-
         def generator(send_links):
             for link in send_links:
                 yield link
 
         session = self.get_session(request.sessionId)
         if session is None:
-            return generator([self.printGRPC(
-                depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
-                                                  msg="Invalid session {}".format(request.sessionId)))])
+            return generator([depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
+                                                                msg="Invalid session {}".format(request.sessionId))])
 
         branch = session.branch
 
         if not self.hasCapability(session.user, CapLinkRead):
-            return generator([self.printGRPC(
-                depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
-                                                  msg="User {} is not authorized to read links".format(
-                                                      session.user.name)))])
-
-        for lk in branch.getAllLinksAsStream():
-             if self.isAuthorized(session.user, CapLinkRead, lk.fromResourceGroup.toolId,
-                                  lk.fromResourceGroup.URL, lk.fromRes.URL,
-                                  lk.toResourceGroup.toolId, lk.toResourceGroup.URL,
-                                  lk.toRes.URL):
-                yield depi_pb2.GetLinksAsStreamResponse(ok=True, msg='', resourceLink=lk.toGrpc())
+            return generator([depi_pb2.GetLinksAsStreamResponse(ok=False, resourceLink=depi_pb2.ResourceLink(),
+                                                                msg="User {} is not authorized to read links".format(
+                                                                    session.user.name))])
 
-    def GetDependencyGraph(self, request: depi_pb2.GetDependencyGraphRequest, context):
-        self.printGRPC(request)
+        checkRows = self.authScope(session.user, CapLinkRead) != SCOPE_UNRESTRICTED
+        negotiate_compression(request, context)
+        self.branchLocks.acquireRead(branch.name)
+        try:
+            responses = [depi_pb2.GetLinksAsStreamResponse(ok=True, msg='', resourceLink=lk.toGrpc())
+                         for lk in branch.getAllLinksAsStream()
+                         if not checkRows or self.isAuthorized(session.user, CapLinkRead, lk.fromResourceGroup.toolId,
+                                              lk.fromResourceGroup.URL, lk.fromRes.URL,
+                                              lk.toResourceGroup.toolId, lk.toResourceGroup.URL,
+                                              lk.toRes.URL)]
+        finally:
+            self.branchLocks.releaseRead(branch.name)
 
+        if request.compact:
+            responses = compact_stream(depi_pb2.GetLinksAsStreamResponse, responses, linkField="resourceLink")
+        for response in responses:
+            yield response
+
+    def GetDependencyGraph(self, request: depi_pb2.GetDependencyGraphRequest, context):
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(
-                depi_pb2.GetDependencyGraphResponse(
-                    ok=False, resource=None, links=[],
-                    msg="Invalid session {}".format(request.sessionId)))
-
-        branch = session.branch
+            return depi_pb2.GetDependencyGraphResponse(
+                ok=False, resource=None, links=[],
+                msg="Invalid session {}".format(request.sessionId))
 
         if not self.hasCapability(session.user, CapLinkRead):
-            return session.printGRPC(
-                depi_pb2.GetDependencyGraphResponse(
-                    ok=False, resource=None, links=[],
-                    msg="User {} is not authorized to read links".format(session.user.name)))
+            return depi_pb2.GetDependencyGraphResponse(
+                ok=False, resource=None, links=[],
+                msg="User {} is not authorized to read links".format(session.user.name))
 
         resourceRef = ResourceRef.fromGrpc(request.resource)
-        parentResource = branch.getResource(resourceRef)
+        checkRows = self.authScope(session.user, CapLinkRead) != SCOPE_UNRESTRICTED
+        negotiate_compression(request, context)
 
-        if parentResource is None:
-            return self.GetFailureResponse("Parent resource not found")
+        def build(branch):
+            parentResource = branch.getResource(resourceRef)
 
-        links = [l for l in branch.getDependencyGraph(
-            resourceRef, request.dependenciesType == depi_pb2.DependenciesType.Dependencies, request.maxDepth)
-                 if self.isAuthorized(session.user, CapLinkRead, l.fromResourceGroup.toolId,
-                                      l.fromResourceGroup.URL, l.fromRes.URL, l.toResourceGroup.toolId,
-                                      l.toResourceGroup.URL, l.toRes.URL)]
+            if parentResource is None:
+                return depi_pb2.GetDependencyGraphResponse(ok=False, msg="Parent resource not found")
 
-        rg, resource = parentResource
-        return session.printGRPC(
-            depi_pb2.GetDependencyGraphResponse(ok=True, msg="", resource=resource.toGrpc(rg),
-                                                links=[l.toGrpc() for l in links]))
+            links = [l for l in branch.getDependencyGraph(
+                resourceRef, request.dependenciesType == depi_pb2.DependenciesType.Dependencies, request.maxDepth)
+                     if not checkRows or self.isAuthorized(session.user, CapLinkRead, l.fromResourceGroup.toolId,
+                                          l.fromResourceGroup.URL, l.fromRes.URL, l.toResourceGroup.toolId,
+                                          l.toResourceGroup.URL, l.toRes.URL)]
 
-    def GetBranchList(self, request: depi_pb2.GetBranchListRequest, context):
-        self.printGRPC(request)
+            rg, resource = parentResource
+            return depi_pb2.GetDependencyGraphResponse(ok=True, msg="", resource=resource.toGrpc(rg),
+                                                       links=[l.toGrpc() for l in links])
+
+        response = self.pagedRead("GetDependencyGraph", session, request, depi_pb2.GetDependencyGraphResponse,
+                                  build, [(["links"], link_key)])
+        if request.compact:
+            return compact_response(response, linkField="links")
+        return response
 
+    def GetBranchList(self, request: depi_pb2.GetBranchListRequest, context):
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(
-                depi_pb2.GetBranchListResponse(
-                    ok=False, branches=[], tags=[],
-                    msg="Invalid session {}".format(request.sessionId)))
+            return depi_pb2.GetBranchListResponse(
+                ok=False, branches=[], tags=[],
+                msg="Invalid session {}".format(request.sessionId))
 
         if not self.hasCapability(session.user, CapBranchList):
-            return session.printGRPC(
-                depi_pb2.GetBranchListResponse(
-                    ok=False, branches=[], tags=[],
-                    msg="User {} is not authorized to list branches".format(session.user.name)))
+            return depi_pb2.GetBranchListResponse(
+                ok=False, branches=[], tags=[],
+                msg="User {} is not authorized to list branches".format(session.user.name))
 
         branches = self.db.getBranchList()
         tags = self.db.getTagList()
 
-        return session.printGRPC(
-            depi_pb2.GetBranchListResponse(ok=True, msg="",
-                                           branches=branches,
-                                           tags=tags))
+        return depi_pb2.GetBranchListResponse(ok=True, msg="",
+                                              branches=branches,
+                                              tags=tags)
 
     def UpdateDepi(self, request: depi_pb2.UpdateDepiRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         branch = session.branch
 
         updates = []
-        self.updateLock.acquire()
+        self.acquireWrite(branch.name)
         try:
             for update in request.updates:
                 if update.updateType == depi_pb2.UpdateType.AddResource:
@@ -2025,26 +2412,19 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
             if len(updates) > 0:
                 logging.debug("Sending depi update for {} resources to {} listeners".format(len(updates), self.numDepiWatchers(branch.name)))
                 depiUpdate = depi_pb2.DepiUpdate(ok=True,msg="", updates=updates)
-                for session in self.sessions.values():
-                    # only send updates to sessions watching the same branch
-                    if session.branch.name != branch.name:
-                        continue
-                    if session.watchingDepi:
-                        session.depiUpdates.put(depiUpdate)
-
-            return session.printGRPC(depi_pb2.GenericResponse(ok=True, msg=""))
+                self.hub.publishDepi(branch.name, depiUpdate)
+
+            return depi_pb2.GenericResponse(ok=True, msg="")
         finally:
-            self.updateLock.release()
+            self.releaseWrite(branch.name)
 
     def CurrentBranch(self, request: depi_pb2.CurrentBranchRequest, context):
-        self.printGRPC(request)
-
         session = self.get_session(request.sessionId)
         if session is None:
-            return self.printGRPC(self.GetInvalidSessionResponse(request.sessionId))
+            return self.GetInvalidSessionResponse(request.sessionId)
 
         branch = session.branch
-        return session.printGRPC(depi_pb2.CurrentBranchResponse(ok=True, msg="", branch=branch.name))
+        return depi_pb2.CurrentBranchResponse(ok=True, msg="", branch=branch.name)
 
     def GetBidirectionalChanges(self, request: depi_pb2.GetBidirectionalChangesRequest, context):
         pass
@@ -2056,6 +2436,79 @@ class DepiServer(depi_pb2_grpc.DepiServicer):
         else:
             return self.GetInvalidSessionResponse(request.sessionId)
 
+    def GetChangesSince(self, request: depi_pb2.GetChangesSinceRequest, context):
+        def generator(responses):
+            for response in responses:
+                yield response
+
+        session = self.get_session(request.sessionId)
+        if session is None:
+            return generator([depi_pb2.GetChangesSinceResponse(ok=False, msg="Invalid session {}".format(
+                request.sessionId))])
+
+        if not self.hasCapability(session.user, CapResGroupRead):
+            return generator([depi_pb2.GetChangesSinceResponse(
+                ok=False, msg="User {} not authorized to read any resource groups".format(session.user.name))])
+
+        branch = session.branch
+        self.branchLocks.acquireRead(branch.name)
+        try:
+            changes = branch.getChangesSince(request.sinceVersion)
+            if changes is None:
+                # an unknown or too old version, the client has to read everything again
+                return generator([depi_pb2.GetChangesSinceResponse(ok=True, msg="", version=branch.getVersion(),
+                                                                   resync=True)])
+        finally:
+            self.branchLocks.releaseRead(branch.name)
+
+        user = session.user
+        updates = []
+        for rg in changes.resourceGroups:
+            if self.isAuthorized(user, CapResGroupRead, rg.toolId, rg.URL):
+                updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.AddResourceGroup,
+                                               addResourceGroup=rg.toGrpc(False)))
+        for (toolId, URL) in changes.removedResourceGroups:
+            if self.isAuthorized(user, CapResGroupRead, toolId, URL):
+                updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveResourceGroup,
+                                               removeResourceGroup=depi_pb2.ResourceGroupRef(toolId=toolId, URL=URL)))
+        for (rg, res) in changes.resources:
+            if self.isAuthorized(user, CapResourceRead, rg.toolId, rg.URL, res.URL):
+                updateType = depi_pb2.UpdateType.RemoveResource if res.deleted else depi_pb2.UpdateType.AddResource
+                updates.append(depi_pb2.Update(updateType=updateType, resource=res.toGrpc(rg)))
+        for rr in changes.removedResources:
+            if self.isAuthorized(user, CapResourceRead, rr.toolId, rr.resourceGroupURL, rr.URL):
+                updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveResource,
+                                               resource=depi_pb2.Resource(toolId=rr.toolId,
+                                                                          resourceGroupURL=rr.resourceGroupURL,
+                                                                          URL=rr.URL)))
+        for lk in changes.links:
+            if self.isAuthorized(user, CapLinkRead, lk.fromResourceGroup.toolId, lk.fromResourceGroup.URL,
+                                 lk.fromRes.URL, lk.toResourceGroup.toolId, lk.toResourceGroup.URL, lk.toRes.URL):
+                if lk.deleted:
+                    updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveLink,
+                                                   removeLink=depi_pb2.ResourceLinkRef(
+                                                       fromRes=depi_pb2.ResourceRef(
+                                                           toolId=lk.fromResourceGroup.toolId,
+                                                           resourceGroupURL=lk.fromResourceGroup.URL,
+                                                           URL=lk.fromRes.URL),
+                                                       toRes=depi_pb2.ResourceRef(
+                                                           toolId=lk.toResourceGroup.toolId,
+                                                           resourceGroupURL=lk.toResourceGroup.URL,
+                                                           URL=lk.toRes.URL))))
+                else:
+                    updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.AddLink, link=lk.toGrpc()))
+        for lk in changes.removedLinks:
+            if self.isAuthorized(user, CapLinkRead, lk.fromRes.toolId, lk.fromRes.resourceGroupURL, lk.fromRes.URL,
+                                 lk.toRes.toolId, lk.toRes.resourceGroupURL, lk.toRes.URL):
+                updates.append(depi_pb2.Update(updateType=depi_pb2.UpdateType.RemoveLink, removeLink=lk.toGrpc()))
+
+        responses = [depi_pb2.GetChangesSinceResponse(ok=True, msg="", version=changes.version,
+                                                      updates=updates[i:i + CHANGES_BATCH_SIZE])
+                     for i in range(0, len(updates), CHANGES_BATCH_SIZE)]
+        if len(responses) == 0:
+            responses.append(depi_pb2.GetChangesSinceResponse(ok=True, msg="", version=changes.version))
+        return generator(responses)
+
     def ApproveBidirectionalChange(self, request: depi_pb2.ApproveBidirectionalChangeRequest, context):
         pass
 
@@ -2092,6 +2545,62 @@ def get_config_value(config_dict, key, default):
     else:
         return default
 
+def create_interceptors() -> list:
+    interceptors = []
+    if get_config_value(config.serverConfig, "metrics_port", 0) != 0:
+        interceptors.append(MetricsInterceptor())
+    trace_interceptor = create_trace_interceptor(config.loggingConfig)
+    if trace_interceptor is not None:
+        interceptors.append(trace_interceptor)
+    return interceptors
+
+
+def start_metrics(servicer: DepiServer):
+    metrics_port = get_config_value(config.serverConfig, "metrics_port", 0)
+    if metrics_port != 0:
+        REGISTRY.registerCollector(servicer.collect_metrics)
+        start_metrics_server(get_config_value(config.serverConfig, "metrics_host", "0.0.0.0"), metrics_port)
+
+
+def add_server_ports(server) -> bool:
+    insecure_port = get_config_value(config.serverConfig, "insecure_port", 0)
+    if insecure_port != 0:
+        server.add_insecure_port("[::]:"+str(insecure_port))
+
+    secure_port = get_config_value(config.serverConfig, "secure_port", 0)
+    if secure_port != 0:
+        key_pem_filename = get_config_value(config.serverConfig, "key_pem", None)
+        if key_pem_filename is None:
+            logging.error("Both key_pem and cert_pem config values are requires for a secure server port")
+            return False
+        with open(key_pem_filename, "rb") as file:
+            key_pem = file.read()
+        cert_pem_filename = get_config_value(config.serverConfig, "cert_pem", None)
+        if cert_pem_filename is None:
+            logging.error("Both key_pem and cert_pem config values are requires for a secure server port")
+            return False
+        with open(cert_pem_filename, "rb") as file:
+            cert_pem = file.read()
+        creds = grpc.ssl_server_credentials(((key_pem, cert_pem),))
+        server.add_secure_port("[::]:"+str(secure_port), creds)
+    return True
+
+
+def reload_on_hangup(servicer: DepiServer, server_root, config_filename):
+    # kill -HUP reloads the users and authorization rules from the config file
+    if not hasattr(signal, "SIGHUP"):
+        return
+
+    def reload(signum, frame):
+        try:
+            loadConfig(server_root, config_filename)
+            servicer.reloadAuthorization()
+        except Exception:
+            logging.exception("Unable to reload the authorization config")
+
+    signal.signal(signal.SIGHUP, reload)
+
+
 def serve():
     parser = argparse.ArgumentParser(
         prog="depi_server",
@@ -2099,6 +2608,8 @@ def serve():
     parser.add_argument("-config", "--config", dest="config_file", required=False)
     parser.add_argument("-config-default-mem", "--config-default-mem", dest="config_default_mem", action="store_true")
     parser.add_argument("-config-default-dolt", "--config-default-dolt", dest="config_default_dolt", action="store_true")
+    parser.add_argument("-aio", "--aio", dest="aio", action="store_true",
+                        help="run the asyncio server instead of the thread pool server")
 
     args = parser.parse_args()
 
@@ -2118,33 +2629,26 @@ def serve():
     logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
     logging.debug("git path separator is {}".format(config.toolConfig["git"].pathSeparator))
     logging.debug("webgme path separator is {}".format(config.toolConfig["webgme"].pathSeparator))
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=100))
-    depi_pb2_grpc.add_DepiServicer_to_server(DepiServer(), server)
 
+    if args.aio or get_config_value(config.serverConfig, "mode", "threads") == "aio":
+        from depi_server.depi_server_aio import serve_aio
+        asyncio.run(serve_aio(server_root, config_filename))
+        return
 
-    insecure_port = get_config_value(config.serverConfig, "insecure_port", 0)
-    if insecure_port != 0:
-        server.add_insecure_port("[::]:"+str(insecure_port))
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=100), interceptors=create_interceptors())
+    servicer = DepiServer()
+    depi_pb2_grpc.add_DepiServicer_to_server(servicer, server)
+    start_metrics(servicer)
+    reload_on_hangup(servicer, server_root, config_filename)
 
-    secure_port = get_config_value(config.serverConfig, "secure_port", 0)
-    if secure_port != 0:
-        key_pem_filename = get_config_value(config.serverConfig, "key_pem", None)
-        if key_pem_filename is None:
-            logging.error("Both key_pem and cert_pem config values are requires for a secure server port")
-            return
-        with open(key_pem_filename, "rb") as file:
-            key_pem = file.read()
-        cert_pem_filename = get_config_value(config.serverConfig, "cert_pem", None)
-        if cert_pem_filename is None:
-            logging.error("Both key_pem and cert_pem config values are requires for a secure server port")
-            return
-        with open(cert_pem_filename, "rb") as file:
-            cert_pem = file.read()
-        creds = grpc.ssl_server_credentials(((key_pem, cert_pem),))
-        server.add_secure_port("[::]:"+str(secure_port), creds)
+    if not add_server_ports(server):
+        return
 
     server.start()
-    server.wait_for_termination()
+    try:
+        server.wait_for_termination()
+    finally:
+        servicer.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import logging
+from concurrent import futures
+
+import depi_pb2
+import depi_pb2_grpc
+import grpc
+
+from depi_server import depi_server
+from depi_server.depi_server import DepiServer, get_config_value
+from depi_server.interceptors.handler_wrapper import AioInterceptor
+
+# Runs DepiServer on grpc.aio. The handlers themselves are the ones from DepiServer, they are
+# run on a bounded thread pool so that database work does not block the event loop. The watch
+# streams are the exception, they await their NotificationHub subscription on the event loop
+# and hold no thread while a client is connected.
+
+STREAM_BATCH_SIZE = 100
+
+
+def _next_batch(responses, size):
+    batch = []
+    for response in responses:
+        batch.append(response)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+def _sync_requests(loop, request_iterator):
+    # lets a DepiServer handler running on the thread pool read a grpc.aio request stream
+    iterator = request_iterator.__aiter__()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(iterator.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+class AsyncDepiServer(depi_pb2_grpc.DepiServicer):
+    def __init__(self, servicer: DepiServer, executor: futures.Executor):
+        self.servicer = servicer
+        self.executor = executor
+
+    async def runBlocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def callUnary(self, name, request, context):
+        return await self.runBlocking(getattr(self.servicer, name), request, context)
+
+    async def callServerStream(self, name, request, context):
+        responses = iter(await self.runBlocking(getattr(self.servicer, name), request, context))
+        try:
+            while True:
+                batch = await self.runBlocking(_next_batch, responses, STREAM_BATCH_SIZE)
+                for response in batch:
+                    yield response
+                if len(batch) < STREAM_BATCH_SIZE:
+                    return
+        finally:
+            close = getattr(responses, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except ValueError:
+                    # still running on the pool, it is dropped when that call returns
+                    pass
+
+    async def callClientStream(self, name, request_iterator, context):
+        requests = _sync_requests(asyncio.get_running_loop(), request_iterator)
+        return await self.runBlocking(getattr(self.servicer, name), requests, context)
+
+    async def callBidiStream(self, name, request_iterator, context):
+        requests = _sync_requests(asyncio.get_running_loop(), request_iterator)
+        responses = iter(await self.runBlocking(getattr(self.servicer, name), requests, context))
+        while True:
+            batch = await self.runBlocking(_next_batch, responses, 1)
+            if len(batch) == 0:
+                return
+            yield batch[0]
+
+    async def RegisterCallback(self, request: depi_pb2.RegisterCallbackRequest, context):
+        session = self.servicer.get_session(request.sessionId)
+        if session is None:
+            yield depi_pb2.ResourcesUpdatedNotification(ok=False, msg="Invalid session {}".format(request.sessionId),
+                                                        updates=[])
+            return
+
+        subscriber = self.servicer.hub.subscribe(session, "resources")
+        try:
+            async for notification in subscriber:
+                yield notification
+        finally:
+            self.servicer.hub.unsubscribe(subscriber)
+
+    async def WatchBlackboard(self, request: depi_pb2.WatchBlackboardRequest, context):
+        session = self.servicer.get_session(request.sessionId)
+        if session is None:
+            yield depi_pb2.BlackboardUpdate(ok=False, msg="Invalid session {}".format(request.sessionId), updates=[])
+            return
+
+        subscriber = self.servicer.hub.subscribe(session, "blackboard", request.coalesceMillis / 1000.0,
+                                                 request.coalesceMaxUpdates)
+        try:
+            async for update in subscriber:
+                yield update
+        finally:
+            self.servicer.hub.unsubscribe(subscriber)
+            logging.debug("Client on {} disconnected from watching".format(request.sessionId))
+
+    async def WatchDepi(self, request: depi_pb2.WatchDepiRequest, context):
+        session = self.servicer.get_session(request.sessionId)
+        if session is None:
+            yield depi_pb2.DepiUpdate(ok=False, msg="Invalid session {}".format(request.sessionId), updates=[])
+            return
+
+        session.watchDirtySummary = request.dirtySummary
+        subscriber = self.servicer.hub.subscribe(session, "depi", request.coalesceMillis / 1000.0,
+                                                 request.coalesceMaxUpdates, request.resumeFrom)
+        try:
+            async for update in subscriber:
+                yield update
+        finally:
+            self.servicer.hub.unsubscribe(subscriber)
+            logging.debug("Depi watcher on {} disconnected".format(request.sessionId))
+
+
+def _delegate(method):
+    name = method.name
+    if method.client_streaming and method.server_streaming:
+        async def call(self, request_iterator, context):
+            async for response in self.callBidiStream(name, request_iterator, context):
+                yield response
+    elif method.client_streaming:
+        async def call(self, request_iterator, context):
+            return await self.callClientStream(name, request_iterator, context)
+    elif method.server_streaming:
+        async def call(self, request, context):
+            async for response in self.callServerStream(name, request, context):
+                yield response
+    else:
+        async def call(self, request, context):
+            return await self.callUnary(name, request, context)
+    call.__name__ = name
+    return call
+
+
+# Every RPC that AsyncDepiServer does not implement itself runs the DepiServer handler
+for _method in depi_pb2.DESCRIPTOR.services_by_name["Depi"].methods:
+    if _method.name not in AsyncDepiServer.__dict__:
+        setattr(AsyncDepiServer, _method.name, _delegate(_method))
+
+
+async def serve_aio(server_root=None, config_filename=None):
+    config = depi_server.config
+    workers = get_config_value(config.serverConfig, "aio_workers", 16)
+    executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="depi-aio")
+
+    server = grpc.aio.server(interceptors=[AioInterceptor(i) for i in depi_server.create_interceptors()])
+    servicer = DepiServer()
+    depi_pb2_grpc.add_DepiServicer_to_server(AsyncDepiServer(servicer, executor), server)
+    depi_server.start_metrics(servicer)
+    depi_server.reload_on_hangup(servicer, server_root, config_filename)
+
+    if not depi_server.add_server_ports(server):
+        return
+
+    logging.info("Starting asyncio server with {} worker threads".format(workers))
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(5)
+        executor.shutdown(wait=False)
+        servicer.shutdown()
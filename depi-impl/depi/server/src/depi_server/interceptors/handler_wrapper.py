@@ -0,0 +1,238 @@
+# Shared plumbing for the server interceptors that need to see the messages and the outcome of
+# a call instead of just its method name. grpc.ServerInterceptor only hands out the method
+# handler, so the behaviors inside it are wrapped and report to a CallObserver. The grpc.aio
+# server has coroutine behaviors, those are wrapped by wrap_aio_handler.
+
+import asyncio
+
+import grpc
+
+
+class CallObserver:
+    def onRequest(self, request):
+        pass
+
+    def onResponse(self, response):
+        pass
+
+    def onDone(self, error):
+        pass
+
+
+def method_name(handler_call_details) -> str:
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+def _observe_requests(observer: CallObserver, request_iterator):
+    for request in request_iterator:
+        observer.onRequest(request)
+        yield request
+
+
+def _observe_responses(observer: CallObserver, responses):
+    error = None
+    try:
+        for response in responses:
+            observer.onResponse(response)
+            yield response
+    except GeneratorExit:
+        # the client went away before the stream finished
+        error = "cancelled"
+        raise
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        observer.onDone(error)
+
+
+def wrap_handler(handler, observer_factory):
+    # observer_factory is called once per call and returns a CallObserver, or None if the call
+    # should run unobserved
+    if handler is None:
+        return None
+
+    if handler.unary_unary is not None:
+        behavior = handler.unary_unary
+
+        def unary_unary(request, context):
+            observer = observer_factory()
+            if observer is None:
+                return behavior(request, context)
+            observer.onRequest(request)
+            try:
+                response = behavior(request, context)
+            except Exception as exc:
+                observer.onDone(exc)
+                raise
+            observer.onResponse(response)
+            observer.onDone(None)
+            return response
+
+        return handler._replace(unary_unary=unary_unary)
+
+    if handler.unary_stream is not None:
+        behavior = handler.unary_stream
+
+        def unary_stream(request, context):
+            observer = observer_factory()
+            if observer is None:
+                return behavior(request, context)
+            observer.onRequest(request)
+            try:
+                responses = behavior(request, context)
+            except Exception as exc:
+                observer.onDone(exc)
+                raise
+            return _observe_responses(observer, responses)
+
+        return handler._replace(unary_stream=unary_stream)
+
+    if handler.stream_unary is not None:
+        behavior = handler.stream_unary
+
+        def stream_unary(request_iterator, context):
+            observer = observer_factory()
+            if observer is None:
+                return behavior(request_iterator, context)
+            try:
+                response = behavior(_observe_requests(observer, request_iterator), context)
+            except Exception as exc:
+                observer.onDone(exc)
+                raise
+            observer.onResponse(response)
+            observer.onDone(None)
+            return response
+
+        return handler._replace(stream_unary=stream_unary)
+
+    if handler.stream_stream is not None:
+        behavior = handler.stream_stream
+
+        def stream_stream(request_iterator, context):
+            observer = observer_factory()
+            if observer is None:
+                return behavior(request_iterator, context)
+            try:
+                responses = behavior(_observe_requests(observer, request_iterator), context)
+            except Exception as exc:
+                observer.onDone(exc)
+                raise
+            return _observe_responses(observer, responses)
+
+        return handler._replace(stream_stream=stream_stream)
+
+    return handler
+
+
+async def _observe_requests_async(observer: CallObserver, request_iterator):
+    async for request in request_iterator:
+        observer.onRequest(request)
+        yield request
+
+
+async def _observe_responses_async(observer: CallObserver, responses):
+    error = None
+    try:
+        async for response in responses:
+            observer.onResponse(response)
+            yield response
+    except (GeneratorExit, asyncio.CancelledError):
+        error = "cancelled"
+        raise
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        observer.onDone(error)
+
+
+def wrap_aio_handler(handler, observer_factory):
+    if handler is None:
+        return None
+
+    if handler.unary_unary is not None:
+        behavior = handler.unary_unary
+
+        async def unary_unary(request, context):
+            observer = observer_factory()
+            if observer is None:
+                return await behavior(request, context)
+            observer.onRequest(request)
+            try:
+                response = await behavior(request, context)
+            except asyncio.CancelledError:
+                observer.onDone("cancelled")
+                raise
+            except Exception as exc:
+                observer.onDone(exc)
+                raise
+            observer.onResponse(response)
+            observer.onDone(None)
+            return response
+
+        return handler._replace(unary_unary=unary_unary)
+
+    if handler.unary_stream is not None:
+        behavior = handler.unary_stream
+
+        async def unary_stream(request, context):
+            observer = observer_factory()
+            if observer is None:
+                async for response in behavior(request, context):
+                    yield response
+                return
+            observer.onRequest(request)
+            async for response in _observe_responses_async(observer, behavior(request, context)):
+                yield response
+
+        return handler._replace(unary_stream=unary_stream)
+
+    if handler.stream_unary is not None:
+        behavior = handler.stream_unary
+
+        async def stream_unary(request_iterator, context):
+            observer = observer_factory()
+            if observer is None:
+                return await behavior(request_iterator, context)
+            try:
+                response = await behavior(_observe_requests_async(observer, request_iterator), context)
+            except asyncio.CancelledError:
+                observer.onDone("cancelled")
+                raise
+            except Exception as exc:
+                observer.onDone(exc)
+                raise
+            observer.onResponse(response)
+            observer.onDone(None)
+            return response
+
+        return handler._replace(stream_unary=stream_unary)
+
+    if handler.stream_stream is not None:
+        behavior = handler.stream_stream
+
+        async def stream_stream(request_iterator, context):
+            observer = observer_factory()
+            if observer is None:
+                async for response in behavior(request_iterator, context):
+                    yield response
+                return
+            responses = behavior(_observe_requests_async(observer, request_iterator), context)
+            async for response in _observe_responses_async(observer, responses):
+                yield response
+
+        return handler._replace(stream_stream=stream_stream)
+
+    return handler
+
+
+class AioInterceptor(grpc.aio.ServerInterceptor):
+    # Runs one of the server interceptors on the grpc.aio server, the interceptor decides which
+    # calls to observe in wrapHandler()
+    def __init__(self, interceptor):
+        self.interceptor = interceptor
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        return self.interceptor.wrapHandler(handler, handler_call_details, wrap_aio_handler)
@@ -0,0 +1,56 @@
+import time
+
+import grpc
+
+from depi_server.interceptors.handler_wrapper import CallObserver, method_name, wrap_handler
+from depi_server.metrics.depi_metrics import RPC_REQUESTS, RPC_DURATION, RPC_IN_FLIGHT, RPC_REQUEST_BYTES, \
+    RPC_RESPONSE_BYTES, RPC_STREAM_MESSAGES
+
+
+class RpcMetrics(CallObserver):
+    def __init__(self, method: str, requestStreaming: bool, responseStreaming: bool):
+        self.method = method
+        self.requestStreaming = requestStreaming
+        self.responseStreaming = responseStreaming
+        self.ok = True
+        self.start = time.perf_counter()
+        RPC_IN_FLIGHT.labels(method).inc()
+
+    def onRequest(self, request):
+        RPC_REQUEST_BYTES.labels(self.method).observe(request.ByteSize())
+        if self.requestStreaming:
+            RPC_STREAM_MESSAGES.labels(self.method, "received").inc()
+
+    def onResponse(self, response):
+        RPC_RESPONSE_BYTES.labels(self.method).observe(response.ByteSize())
+        if self.responseStreaming:
+            RPC_STREAM_MESSAGES.labels(self.method, "sent").inc()
+        # most handlers report failures in the response instead of a status code
+        if not getattr(response, "ok", True):
+            self.ok = False
+
+    def onDone(self, error):
+        RPC_IN_FLIGHT.labels(self.method).dec()
+        RPC_DURATION.labels(self.method).observe(time.perf_counter() - self.start)
+        if error == "cancelled":
+            code = "CANCELLED"
+        elif error is not None:
+            code = "ERROR"
+        elif not self.ok:
+            code = "FAILED"
+        else:
+            code = "OK"
+        RPC_REQUESTS.labels(self.method, code).inc()
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    def intercept_service(self, continuation, handler_call_details):
+        return self.wrapHandler(continuation(handler_call_details), handler_call_details)
+
+    def wrapHandler(self, handler, handler_call_details, wrap=wrap_handler):
+        if handler is None:
+            return None
+        method = method_name(handler_call_details)
+        requestStreaming = handler.request_streaming
+        responseStreaming = handler.response_streaming
+        return wrap(handler, lambda: RpcMetrics(method, requestStreaming, responseStreaming))
@@ -0,0 +1,173 @@
+import datetime
+import itertools
+import json
+import logging
+import random
+import time
+
+import grpc
+from google.protobuf import text_format
+
+from depi_server.interceptors.handler_wrapper import CallObserver, method_name, wrap_handler
+
+# Traces the requests and responses of every RPC. Nothing is formatted unless the trace logger
+# is enabled for the configured level and the call is sampled, and message text is cut off once
+# it reaches max_message_chars instead of formatting the whole message first.
+#
+# Configured in the "rpc_trace" entry of the "logging" config section:
+#   "enabled":             false disables the interceptor (default true)
+#   "level":               log level the records are written at (default "debug")
+#   "format":              "text" or "jsonl" (default "text")
+#   "filename":            write the records to this file instead of the server log
+#   "sample_rate":         fraction of calls that are traced (default 1.0)
+#   "methods":             per-method sample rates, e.g. {"GetBlackboardResources": 0.1}
+#   "max_message_chars":   message text is truncated at this length, 0 leaves it out (default 2000)
+#   "max_stream_messages": messages traced per streaming call (default 100)
+#   "redact_fields":       fields that are never written out (default ["password"])
+
+TRACE_LOGGER_NAME = "depi_server.rpc"
+
+
+class _TruncatedOutput(Exception):
+    pass
+
+
+class _LimitedWriter:
+    def __init__(self, limit: int):
+        self.parts = []
+        self.remaining = limit
+        self.truncated = False
+
+    def write(self, text):
+        if len(text) > self.remaining:
+            self.parts.append(text[:self.remaining])
+            self.truncated = True
+            raise _TruncatedOutput()
+        self.parts.append(text)
+        self.remaining -= len(text)
+
+
+def format_message(msg, limit: int, redact_fields=()) -> tuple[str, bool]:
+    if limit <= 0:
+        return "", False
+
+    fields = msg.DESCRIPTOR.fields_by_name
+    redacted = [name for name in redact_fields if name in fields]
+    if len(redacted) > 0:
+        copy = type(msg)()
+        copy.CopyFrom(msg)
+        for name in redacted:
+            copy.ClearField(name)
+        msg = copy
+
+    out = _LimitedWriter(limit)
+    try:
+        text_format.PrintMessage(msg, out, as_one_line=True)
+    except _TruncatedOutput:
+        pass
+    return "".join(out.parts), out.truncated
+
+
+class RpcTrace(CallObserver):
+    def __init__(self, tracer, method: str, callId: int):
+        self.tracer = tracer
+        self.method = method
+        self.callId = callId
+        self.sessionId = ""
+        self.start = time.perf_counter()
+        self.numRequests = 0
+        self.numResponses = 0
+
+    def onRequest(self, request):
+        self.numRequests += 1
+        if self.sessionId == "":
+            self.sessionId = getattr(request, "sessionId", "")
+        if self.numRequests <= self.tracer.maxStreamMessages:
+            self.tracer.emit(self, "request", request)
+
+    def onResponse(self, response):
+        self.numResponses += 1
+        if self.numResponses <= self.tracer.maxStreamMessages:
+            self.tracer.emit(self, "response", response)
+
+    def onDone(self, error):
+        self.tracer.emit(self, "end", None, error=error,
+                         durationMs=round((time.perf_counter() - self.start) * 1000.0, 3))
+
+
+class RpcTraceInterceptor(grpc.ServerInterceptor):
+    def __init__(self, traceConfig: dict):
+        self.logger = logging.getLogger(TRACE_LOGGER_NAME)
+        level = logging.getLevelName(str(traceConfig.get("level", "debug")).upper())
+        self.level = level if isinstance(level, int) else logging.DEBUG
+        self.format = traceConfig.get("format", "text")
+        self.sampleRate = float(traceConfig.get("sample_rate", 1.0))
+        self.methodSampleRates = {method: float(rate) for method, rate in traceConfig.get("methods", {}).items()}
+        self.maxMessageChars = int(traceConfig.get("max_message_chars", 2000))
+        self.maxStreamMessages = int(traceConfig.get("max_stream_messages", 100))
+        self.redactFields = traceConfig.get("redact_fields", ["password"])
+        self.callIds = itertools.count(1)
+
+        filename = traceConfig.get("filename")
+        if filename is not None:
+            handler = logging.FileHandler(filename)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(self.level)
+            self.logger.propagate = False
+
+    def getSampleRate(self, method: str) -> float:
+        return self.methodSampleRates.get(method, self.sampleRate)
+
+    def startCall(self, method: str):
+        if not self.logger.isEnabledFor(self.level):
+            return None
+        rate = self.getSampleRate(method)
+        if rate < 1.0 and random.random() >= rate:
+            return None
+        return RpcTrace(self, method, next(self.callIds))
+
+    def intercept_service(self, continuation, handler_call_details):
+        return self.wrapHandler(continuation(handler_call_details), handler_call_details)
+
+    def wrapHandler(self, handler, handler_call_details, wrap=wrap_handler):
+        method = method_name(handler_call_details)
+        if self.getSampleRate(method) <= 0.0:
+            return handler
+        return wrap(handler, lambda: self.startCall(method))
+
+    def emit(self, trace: RpcTrace, event: str, msg, error=None, durationMs=None):
+        record = {"time": datetime.datetime.now().isoformat(),
+                  "call": trace.callId,
+                  "method": trace.method,
+                  "session": trace.sessionId,
+                  "event": event}
+        if msg is not None:
+            text, truncated = format_message(msg, self.maxMessageChars, self.redactFields)
+            record["type"] = msg.DESCRIPTOR.name
+            record["size"] = msg.ByteSize()
+            record["message"] = text
+            record["truncated"] = truncated
+        else:
+            record["requests"] = trace.numRequests
+            record["responses"] = trace.numResponses
+            record["durationMs"] = durationMs
+            record["error"] = None if error is None else str(error)
+
+        if self.format == "jsonl":
+            self.logger.log(self.level, json.dumps(record))
+        elif msg is not None:
+            self.logger.log(self.level, "{}[{}] {} {}({}) {} bytes: {}{}".format(
+                trace.method, trace.callId, event, record["type"], trace.sessionId, record["size"],
+                record["message"], "..." if record["truncated"] else ""))
+        else:
+            self.logger.log(self.level, "{}[{}] end ({}) {} ms, {} requests, {} responses{}".format(
+                trace.method, trace.callId, trace.sessionId, durationMs, trace.numRequests,
+                trace.numResponses, "" if error is None else ", error: {}".format(error)))
+
+
+def create_trace_interceptor(loggingConfig: dict):
+    traceConfig = loggingConfig.get("rpc_trace", {})
+    if not traceConfig.get("enabled", True):
+        return None
+    return RpcTraceInterceptor(traceConfig)
@@ -0,0 +1,45 @@
+import functools
+import time
+
+from depi_server.metrics.registry import Counter, Gauge, Histogram, SIZE_BUCKETS
+
+# The metrics that are updated as the server runs. Values that are already tracked elsewhere
+# (sessions, watchers, queue depths, branch lock statistics) are read at scrape time by the
+# collector that DepiServer registers instead.
+
+RPC_REQUESTS = Counter("depi_rpc_requests_total", "RPC calls by method and result",
+                       ["method", "code"])
+RPC_DURATION = Histogram("depi_rpc_duration_seconds", "RPC latency, for streams until the stream ends",
+                         ["method"])
+RPC_IN_FLIGHT = Gauge("depi_rpc_in_flight", "RPC calls currently being handled", ["method"])
+RPC_REQUEST_BYTES = Histogram("depi_rpc_request_bytes", "Serialized size of request messages",
+                              ["method"], buckets=SIZE_BUCKETS)
+RPC_RESPONSE_BYTES = Histogram("depi_rpc_response_bytes", "Serialized size of response messages",
+                               ["method"], buckets=SIZE_BUCKETS)
+RPC_STREAM_MESSAGES = Counter("depi_rpc_stream_messages_total", "Messages on streaming RPCs",
+                              ["method", "direction"])
+
+DB_OPERATION_DURATION = Histogram("depi_db_operation_seconds", "Time spent in storage backend operations",
+                                  ["backend", "operation"])
+DB_STATE_BYTES_WRITTEN = Counter("depi_db_state_bytes_written_total", "Bytes written to memjson state files")
+DB_CONNECTION_WAIT = Histogram("depi_db_connection_wait_seconds", "Time to get a connection from the Dolt pool")
+DB_CONNECTIONS_CREATED = Counter("depi_db_connections_created_total",
+                                 "Dolt connections opened because the pool was empty or a connection was stale")
+
+BLACKBOARD_OPERATION_DURATION = Histogram("depi_blackboard_operation_seconds", "Time spent in blackboard operations",
+                                          ["operation"])
+
+
+def timed_db_operation(backend: str, operation: str):
+    histogram = DB_OPERATION_DURATION.labels(backend, operation)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,43 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from depi_server.metrics.registry import REGISTRY
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        try:
+            body = self.registry.render().encode("utf-8")
+        except Exception as exc:
+            logging.error("Error rendering metrics", exc_info=exc)
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("metrics: " + format, *args)
+
+
+def start_metrics_server(host: str, port: int, registry=None) -> ThreadingHTTPServer:
+    handler = MetricsRequestHandler
+    if registry is not None:
+        handler = type("BoundMetricsRequestHandler", (MetricsRequestHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http")
+    thread.daemon = True
+    thread.start()
+    logging.info("Serving metrics on {}:{}".format(host, server.server_address[1]))
+    return server
@@ -0,0 +1,231 @@
+import math
+import threading
+import time
+
+# A small metrics registry that renders the Prometheus text exposition format. It only covers
+# what the server needs (counters, gauges and histograms with labels, plus collector callbacks
+# for values that are cheaper to read at scrape time than to keep up to date).
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(["{}=\"{}\"".format(k, escape_label_value(v)) for k, v in labels.items()]) + "}"
+
+
+def format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelNames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.lock = threading.Lock()
+        self.children: dict[tuple, object] = {}
+        if registry is None:
+            registry = REGISTRY
+        registry.register(self)
+
+    def newChild(self):
+        pass
+
+    def labels(self, *labelValues):
+        if len(labelValues) != len(self.labelNames):
+            raise ValueError("Metric {} expects labels {}".format(self.name, self.labelNames))
+        key = tuple(str(v) for v in labelValues)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.get(key)
+                if child is None:
+                    child = self.newChild()
+                    self.children[key] = child
+        return child
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        with self.lock:
+            children = list(self.children.items())
+        result = []
+        for key, child in children:
+            result.extend(child.samples(self.name, dict(zip(self.labelNames, key))))
+        return result
+
+
+class _Value:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self.lock:
+            self.value = float(value)
+
+    def get(self) -> float:
+        with self.lock:
+            return self.value
+
+    def samples(self, name, labels):
+        return [(name, labels, self.get())]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def newChild(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def newChild(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1.0):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self.lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+            count = self.count
+        result = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            result.append((name + "_bucket", dict(labels, le=format_value(float(bound))), cumulative))
+        result.append((name + "_bucket", dict(labels, le="+Inf"), count))
+        result.append((name + "_sum", labels, total))
+        result.append((name + "_count", labels, count))
+        return result
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelNames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelNames, registry)
+
+    def newChild(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: dict[str, Metric] = {}
+        self.collectors = []
+
+    def register(self, metric: Metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError("Metric {} is already registered".format(metric.name))
+            self.metrics[metric.name] = metric
+
+    def registerCollector(self, collector):
+        # collector() returns a list of (name, type, help, [(labels, value), ...])
+        with self.lock:
+            self.collectors.append(collector)
+
+    def unregisterCollector(self, collector):
+        with self.lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+
+        for collector in collectors:
+            for name, metricType, help, values in collector():
+                lines.append("# HELP {} {}".format(name, help))
+                lines.append("# TYPE {} {}".format(name, metricType))
+                for labels, value in values:
+                    lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
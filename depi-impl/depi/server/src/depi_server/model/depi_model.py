@@ -1,21 +1,42 @@
+import sys
+
 import depi_pb2
 
 global config
 
 
+def intern(value):
+    # tool ids and resource group URLs repeat on every resource and link, so they share one string
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
 class Resource:
+    __slots__ = ("name", "id", "URL", "deleted", "changeType", "_hash")
+
     def __init__(self, name: str, id: str, URL: str, deleted=False, changeType=depi_pb2.ChangeType.Added):
         self.name: str = name
         self.id: str = id
         self.URL: str = URL
         self.deleted: bool = deleted
         self.changeType: depi_pb2.ChangeType = changeType
+        self._hash: int | None = None
 
     def __eq__(self, other) -> bool:
         return self.id == other.id and self.URL == other.URL
 
     def __hash__(self) -> int:
-        return hash((hash(self.id), hash(self.URL)))
+        if self._hash is None:
+            self._hash = hash((self.id, self.URL))
+        return self._hash
+
+    def rekey(self, name: str, id: str, URL: str):
+        # the hash is cached, so a resource in a set or dict has to be taken out while it is renamed
+        self.name = name
+        self.id = id
+        self.URL = URL
+        self._hash = None
 
     def toGrpc(self, resourceGroup: "ResourceGroup") -> depi_pb2.Resource:
         return depi_pb2.Resource(
@@ -99,21 +120,32 @@ class ResourceChange:
         return Resource(name=self.name, id=self.id, URL=self.URL, deleted=self.deleted)
 
 class ResourceGroup:
+    __slots__ = ("name", "toolId", "URL", "version", "resources", "_hash")
+
     def __init__(self, name: str, toolId: str, URL: str, version: str, resources: dict[str,Resource] | None = None):
         self.name: str = name
-        self.toolId: str = toolId
-        self.URL: str = URL
+        self.toolId: str = intern(toolId)
+        self.URL: str = intern(URL)
         self.version: str = version
         if resources is None:
             self.resources: dict[str, Resource] = {}
         else:
             self.resources: dict[str, Resource] = resources
+        self._hash: int | None = None
 
     def __eq__(self, other) -> bool:
         return self.name == other.name and self.URL == other.URL
 
     def __hash__(self) -> int:
-        return hash((hash(self.name), hash(self.URL)))
+        if self._hash is None:
+            self._hash = hash((self.name, self.URL))
+        return self._hash
+
+    def rekey(self, name: str, toolId: str, URL: str):
+        self.name = name
+        self.toolId = intern(toolId)
+        self.URL = intern(URL)
+        self._hash = None
 
     def getResource(self, url: str) -> Resource:
         return self.resources.get(url)
@@ -238,10 +270,14 @@ class ResourceGroupChange:
 
 
 class ResourceRef:
+    # refs are shared between links and their inferred dirtiness, a renamed ref is a new ref
+    __slots__ = ("toolId", "resourceGroupURL", "URL", "_hash")
+
     def __init__(self, toolId, resourceGroupURL, url):
-        self.toolId: str = toolId
-        self.resourceGroupURL: str = resourceGroupURL
+        self.toolId: str = intern(toolId)
+        self.resourceGroupURL: str = intern(resourceGroupURL)
         self.URL: str = url
+        self._hash: int | None = None
 
     def __eq__(self, other) -> bool:
         return self.toolId == other.toolId and \
@@ -249,13 +285,16 @@ class ResourceRef:
                self.URL == other.URL
 
     def __hash__(self) -> int:
-        return hash((hash(self.toolId), 
-                     hash(self.resourceGroupURL), 
-                     hash(self.URL)))
+        if self._hash is None:
+            self._hash = hash((self.toolId, self.resourceGroupURL, self.URL))
+        return self._hash
 
     def copy(self) -> "ResourceRef":
         return ResourceRef(self.toolId, self.resourceGroupURL, self.URL)
 
+    def withURL(self, URL: str) -> "ResourceRef":
+        return ResourceRef(self.toolId, self.resourceGroupURL, URL)
+
     @staticmethod
     def fromResourceGroupAndRes(rg: ResourceGroup, r: Resource) -> "ResourceRef":
         return ResourceRef(toolId=rg.toolId, resourceGroupURL=rg.URL,  url=r.URL)
@@ -286,6 +325,8 @@ class ResourceRef:
 
 
 class Link:
+    __slots__ = ("fromRes", "toRes", "dirty", "deleted", "lastCleanVersion", "inferredDirtiness", "_hash")
+
     def __init__(self, fromRes: ResourceRef, toRes: ResourceRef, dirty=False,
                  inferredDirtiness : set[tuple[ResourceRef,str]]|None = None):
         self.fromRes: ResourceRef = fromRes
@@ -297,12 +338,22 @@ class Link:
             self.inferredDirtiness: set[tuple[ResourceRef, str]] = set()
         else:
             self.inferredDirtiness: set[tuple[ResourceRef,str]] = inferredDirtiness
+        self._hash: int | None = None
 
     def __eq__(self, other) -> bool:
         return self.fromRes == other.fromRes and self.toRes == other.toRes
 
     def __hash__(self) -> int:
-        return hash((hash(self.fromRes), hash(self.toRes)))
+        if self._hash is None:
+            self._hash = hash((self.fromRes, self.toRes))
+        return self._hash
+
+    def rekey(self, fromRes: ResourceRef | None = None, toRes: ResourceRef | None = None):
+        if fromRes is not None:
+            self.fromRes = fromRes
+        if toRes is not None:
+            self.toRes = toRes
+        self._hash = None
 
     def copy(self):
         inferred = [(rr.copy(), lastClean) for (rr, lastClean) in self.inferredDirtiness]
@@ -394,6 +445,9 @@ class Link:
 
 
 class LinkWithResources:
+    __slots__ = ("fromResourceGroup", "fromRes", "toResourceGroup", "toRes", "dirty", "deleted",
+                 "lastCleanVersion", "inferredDirtiness", "_hash")
+
     def __init__(self, fromRg: ResourceGroup, fromRes: Resource,
                  toRg: ResourceGroup, toRes: Resource, dirty=False, lastCleanVersion="",
                  inferredDirtiness: list[tuple[ResourceGroup, Resource, str]] | None = None):
@@ -408,13 +462,20 @@ class LinkWithResources:
             self.inferredDirtiness: list[tuple[ResourceGroup, Resource, str]] = []
         else:
             self.inferredDirtiness: list[tuple[ResourceGroup, Resource, str]] = inferredDirtiness
+        self._hash: int | None = None
 
     def __eq__(self, other) -> bool:
         return self.fromResourceGroup == other.fromResourceGroup and \
                self.fromRes == other.fromRes and self.toRes == other.toRes
 
     def __hash__(self) -> int:
-        return hash((hash(self.fromResourceGroup), hash(self.fromRes), hash(self.toResourceGroup), hash(self.toRes)))
+        if self._hash is None:
+            self._hash = hash((self.fromResourceGroup, self.fromRes, self.toResourceGroup, self.toRes))
+        return self._hash
+
+    def rekey(self):
+        # called after one of the ends was renamed or replaced
+        self._hash = None
 
     def compareFromResURL(self, resURL: str) -> bool:
         if self.fromRes.URL == resURL:
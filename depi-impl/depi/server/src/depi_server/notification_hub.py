@@ -0,0 +1,471 @@
+import collections
+import logging
+import threading
+import time
+
+import depi_pb2
+
+from depi_server.update_queue import UpdateQueue
+
+# Delivers updates to the watch streams. Subscribers are indexed by stream type and branch so a
+# publish only touches the streams that want it, and every subscriber has a bounded queue so a
+# client that stops reading can't make the server buffer updates without limit. When a queue is
+# full the overflow policy decides what happens:
+#   coalesce     the update is merged into the last queued message
+#   drop_oldest  the oldest queued message is dropped and the client is sent a resync marker
+#   disconnect   the queue is discarded and the stream is ended with an error
+#
+# A watcher can also ask for its updates to be batched: everything published within window
+# seconds of the first queued update (or until maxBatch updates are queued) is sent as one
+# message, with additions that are removed again inside the batch reduced to the removal.
+#
+# Write handlers call deferPublishing() when they take a branch write lock and publishDeferred()
+# after they release it, so the fan out happens outside of the lock. Publishes to a branch are
+# numbered when they are made, under the branch lock, and delivered in that order even when two
+# handlers flush at the same time. A handler that rolls its changes back calls discardDeferred()
+# instead, the publications are dropped but their numbers are passed on so later ones aren't held
+# up. Depi updates are stamped and kept for replay when they are published, so a handler that can
+# still roll back publishes them last.
+#
+# Depi updates are also stamped with a per-branch sequence number and the last replaySize of them
+# are kept, so a watcher that reconnects with resumeFrom gets what it missed. When the updates it
+# asks for are no longer kept, or are from before the server was started, it gets a resync marker
+# instead. Sequence numbers start at the server's start time in microseconds, so they keep
+# increasing across restarts. Depi updates published with an accept filter (the dirty counts) only
+# go to some of the watchers, they are not numbered and not kept for replay.
+
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = [OVERFLOW_COALESCE, OVERFLOW_DROP_OLDEST, OVERFLOW_DISCONNECT]
+
+STREAM_MESSAGES = {"depi": depi_pb2.DepiUpdate,
+                   "blackboard": depi_pb2.BlackboardUpdate,
+                   "resources": depi_pb2.ResourcesUpdatedNotification}
+
+# blackboard updates are not tied to a branch
+BRANCH_STREAMS = {"depi", "resources"}
+
+ORDER_WAIT_TIMEOUT = 5.0
+
+ADD_TYPES = {depi_pb2.UpdateType.AddResource: "resource",
+             depi_pb2.UpdateType.AddLink: "link",
+             depi_pb2.UpdateType.AddResourceGroup: "resourceGroup"}
+REMOVE_TYPES = {depi_pb2.UpdateType.RemoveResource: "resource",
+                depi_pb2.UpdateType.RemoveLink: "link",
+                depi_pb2.UpdateType.RemoveResourceGroup: "resourceGroup"}
+
+
+def _ref_key(res) -> tuple:
+    return res.toolId, res.resourceGroupURL, res.URL
+
+
+def update_key(update: depi_pb2.Update):
+    # the object an update is about, or None if it can't be collapsed
+    field = update.WhichOneof("update_data")
+    if field is None:
+        return None
+    data = getattr(update, field)
+    if field == "resource":
+        return "resource", _ref_key(data)
+    if field in ("link", "markLinkClean", "markLinkDirty", "removeLink"):
+        return "link", _ref_key(data.fromRes), _ref_key(data.toRes)
+    if field in ("addResourceGroup", "removeResourceGroup"):
+        return "resourceGroup", data.toolId, data.URL
+    return None
+
+
+def collapse_updates(updates) -> list:
+    # drops an add of a resource, link or resource group that is removed later in the batch,
+    # together with the updates about it in between. The remove is kept: an add is also sent for
+    # what already existed, so the watcher may have it from before.
+    added: dict[tuple, int] = {}
+    dropped = set()
+    keys = [update_key(update) for update in updates]
+    for i, update in enumerate(updates):
+        key = keys[i]
+        if key is None:
+            continue
+        if ADD_TYPES.get(update.updateType) == key[0]:
+            added[key] = i
+        elif REMOVE_TYPES.get(update.updateType) == key[0] and key in added:
+            start = added.pop(key)
+            dropped.update([j for j in range(start, i) if keys[j] == key])
+    if len(dropped) == 0:
+        return list(updates)
+    return [update for i, update in enumerate(updates) if i not in dropped]
+
+
+class Subscriber(UpdateQueue):
+    def __init__(self, session, streamType: str, maxSize: int, overflow: str, window: float = 0.0,
+                 maxBatch: int = 0):
+        super().__init__()
+        self.session = session
+        self.streamType = streamType
+        self.branchName = session.branch.name if streamType in BRANCH_STREAMS else None
+        self.messageType = STREAM_MESSAGES[streamType]
+        self.maxSize = maxSize
+        self.overflow = overflow
+        self.window = window
+        self.maxBatch = maxBatch
+        self.closed = False
+        self.resync = False
+        # the sequence number of the last depi update queued, anything older is a duplicate
+        self.lastSequence = 0
+        # False while updates are only being held for a stream that has not been opened yet
+        self.attached = True
+
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.lastDelivery = time.monotonic()
+
+    def offer(self, item):
+        now = time.monotonic()
+        if isinstance(item, str):
+            self.closed = True
+            self.items.append((now, item))
+            return
+        if self.closed:
+            return
+        if self.streamType == "depi" and item.sequence > 0:
+            if item.sequence <= self.lastSequence:
+                return
+            self.lastSequence = item.sequence
+
+        self.published += 1
+        if self.maxSize <= 0 or len(self.items) < self.maxSize:
+            self.items.append((now, item))
+        elif self.overflow == OVERFLOW_COALESCE:
+            queuedAt, last = self.items[-1]
+            # the queued message may be shared with other subscribers
+            merged = self.messageType()
+            merged.CopyFrom(last)
+            merged.updates.extend(item.updates)
+            if self.streamType == "depi" and item.sequence > 0:
+                merged.sequence = item.sequence
+            self.items[-1] = (queuedAt, merged)
+            self.coalesced += 1
+        elif self.overflow == OVERFLOW_DISCONNECT:
+            self.dropped += len(self.items) + 1
+            self.items.clear()
+            self.items.append((now, self.messageType(
+                ok=False, msg="Disconnected, more than {} updates were waiting to be sent".format(self.maxSize))))
+            self.items.append((now, "quit"))
+            self.closed = True
+            logging.warning("Disconnected {} watcher on session {}, it stopped reading updates".format(
+                self.streamType, self.session.sessionId))
+        else:
+            self.items.popleft()
+            self.items.append((now, item))
+            self.dropped += 1
+            self.resync = True
+
+    def take(self):
+        self.lastDelivery = time.monotonic()
+        if self.resync:
+            self.resync = False
+            return self.messageType(ok=True, msg="", resync=True)
+        queuedAt, item = self.items.popleft()
+        if isinstance(item, str):
+            return item
+        self.delivered += 1
+        if (self.window <= 0 and self.maxBatch <= 0) or not item.ok or item.resync:
+            return item
+
+        updates = list(item.updates)
+        sequence = item.sequence if self.streamType == "depi" else 0
+        while len(self.items) > 0:
+            queuedAt, nextItem = self.items[0]
+            if isinstance(nextItem, str) or not nextItem.ok or nextItem.resync:
+                break
+            if self.maxBatch > 0 and len(updates) + len(nextItem.updates) > self.maxBatch:
+                break
+            self.items.popleft()
+            self.delivered += 1
+            updates.extend(nextItem.updates)
+            if self.streamType == "depi":
+                sequence = max(sequence, nextItem.sequence)
+        updates = collapse_updates(updates)
+        if len(updates) == 0:
+            return None
+        if self.streamType == "depi":
+            return self.messageType(ok=True, msg="", updates=updates, sequence=sequence)
+        return self.messageType(ok=True, msg="", updates=updates)
+
+    def available(self) -> bool:
+        if self.resync:
+            return True
+        if len(self.items) == 0:
+            return False
+        if self.window <= 0 or self.closed:
+            return True
+        if time.monotonic() - self.items[0][0] >= self.window:
+            return True
+        if self.maxBatch > 0:
+            queued = 0
+            for queuedAt, item in self.items:
+                if isinstance(item, str):
+                    return True
+                queued += len(item.updates)
+                if queued >= self.maxBatch:
+                    return True
+        return False
+
+    def waitTime(self):
+        if self.window <= 0 or len(self.items) == 0:
+            return None
+        return max(0.0, self.items[0][0] + self.window - time.monotonic())
+
+    def getStats(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            return {"sessionId": self.session.sessionId,
+                    "user": self.session.user.name,
+                    "stream": self.streamType,
+                    "branch": self.branchName,
+                    "attached": self.attached,
+                    "queued": len(self.items),
+                    "published": self.published,
+                    "delivered": self.delivered,
+                    "dropped": self.dropped,
+                    "coalesced": self.coalesced,
+                    "lastSequence": self.lastSequence,
+                    "lag": now - self.items[0][0] if len(self.items) > 0 else 0.0,
+                    "idle": now - self.lastDelivery}
+
+
+class NotificationHub:
+    def __init__(self, maxQueueSize: int = 1000, overflow: str = OVERFLOW_DROP_OLDEST, replaySize: int = 1000):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown watch overflow policy {}, expected one of {}".format(
+                overflow, ", ".join(OVERFLOW_POLICIES)))
+        self.maxQueueSize = maxQueueSize
+        self.overflow = overflow
+        self.lock = threading.Lock()
+        # stream type -> branch name (None for blackboard) -> session id -> subscriber
+        self.index: dict[str, dict[str | None, dict[str, Subscriber]]] = {t: {} for t in STREAM_MESSAGES}
+        self.deferred = threading.local()
+
+        self.orderCond = threading.Condition(threading.Lock())
+        self.tickets: dict[tuple[str, str | None], int] = {}
+        self.deliveredTickets: dict[tuple[str, str | None], int] = {}
+
+        self.replaySize = replaySize
+        self.sequenceBase = time.time_ns() // 1000
+        # branch name -> the last depi sequence number, guarded by orderCond
+        self.sequences: dict[str, int] = {}
+        # branch name -> (sequence, depi update), guarded by orderCond
+        self.replay: dict[str, collections.deque] = {}
+
+    def subscribe(self, session, streamType: str, window: float = 0.0, maxBatch: int = 0,
+                  resumeFrom: int = 0) -> Subscriber:
+        # a session has one stream of each type, a new watch replaces the previous one
+        subscriber = Subscriber(session, streamType, self.maxQueueSize, self.overflow, window, maxBatch)
+        with self.lock:
+            old = session.subscribers.get(streamType)
+            if old is not None and not old.attached:
+                with old.lock:
+                    old.attached = True
+                    old.window = window
+                    old.maxBatch = maxBatch
+                return old
+            if old is not None:
+                self._remove(old)
+            if streamType == "depi" and resumeFrom > 0:
+                # queued before the subscriber is added, updates published from here on are
+                # delivered to it and the ones that were also replayed are skipped
+                missed = self.missedUpdates(subscriber.branchName, resumeFrom)
+                if missed is None:
+                    subscriber.resync = True
+                    logging.info("Can't resume depi updates on {} from {} for session {}, sending resync".format(
+                        subscriber.branchName, resumeFrom, session.sessionId))
+                else:
+                    for update in missed:
+                        subscriber.put(update)
+            self.index[streamType].setdefault(subscriber.branchName, {})[session.sessionId] = subscriber
+            session.subscribers[streamType] = subscriber
+        if old is not None:
+            old.put("quit")
+        return subscriber
+
+    def hold(self, session, streamType: str):
+        # keeps the updates for a session that isn't watching yet, its next watch receives them
+        with self.lock:
+            if streamType in session.subscribers:
+                return
+            subscriber = Subscriber(session, streamType, self.maxQueueSize, self.overflow)
+            subscriber.attached = False
+            self.index[streamType].setdefault(subscriber.branchName, {})[session.sessionId] = subscriber
+            session.subscribers[streamType] = subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self.lock:
+            self._remove(subscriber)
+        subscriber.put("quit")
+
+    def unsubscribeSession(self, session, streamType: str):
+        subscriber = session.subscribers.get(streamType)
+        if subscriber is not None:
+            self.unsubscribe(subscriber)
+
+    def closeSession(self, session):
+        for subscriber in list(session.subscribers.values()):
+            self.unsubscribe(subscriber)
+
+    def _remove(self, subscriber: Subscriber):
+        session = subscriber.session
+        subscribers = self.index[subscriber.streamType].get(subscriber.branchName)
+        if subscribers is not None and subscribers.get(session.sessionId) is subscriber:
+            del subscribers[session.sessionId]
+            if len(subscribers) == 0:
+                del self.index[subscriber.streamType][subscriber.branchName]
+        if session.subscribers.get(subscriber.streamType) is subscriber:
+            del session.subscribers[subscriber.streamType]
+
+    def moveSession(self, session):
+        # called when a session switches to another branch
+        with self.lock:
+            for subscriber in list(session.subscribers.values()):
+                if subscriber.streamType not in BRANCH_STREAMS:
+                    continue
+                self._remove(subscriber)
+                subscriber.branchName = session.branch.name
+                with subscriber.lock:
+                    # sequence numbers are per branch
+                    subscriber.lastSequence = 0
+                self.index[subscriber.streamType].setdefault(subscriber.branchName, {})[session.sessionId] = \
+                    subscriber
+                session.subscribers[subscriber.streamType] = subscriber
+
+    def numSubscribers(self, streamType: str, branchName: str | None = None, accept=None) -> int:
+        with self.lock:
+            if branchName is not None:
+                streams = [self.index[streamType].get(branchName, {})]
+            else:
+                streams = self.index[streamType].values()
+            return sum([1 for subscribers in streams for s in subscribers.values()
+                        if s.attached and (accept is None or accept(s.session))])
+
+    def deferPublishing(self):
+        depth = getattr(self.deferred, "depth", 0)
+        if depth == 0:
+            self.deferred.pending = []
+        self.deferred.depth = depth + 1
+
+    def publishDeferred(self):
+        self.deferred.depth -= 1
+        if self.deferred.depth > 0:
+            return
+        pending = self.deferred.pending
+        self.deferred.pending = None
+        for publication in pending:
+            self._deliver(*publication)
+
+    def discardDeferred(self):
+        self.deferred.depth -= 1
+        if self.deferred.depth > 0:
+            return
+        pending = self.deferred.pending
+        self.deferred.pending = None
+        for (key, ticket, message, accept) in pending:
+            if ticket is not None:
+                self._waitForTurn(key, ticket)
+                self._passTicket(key, ticket)
+
+    def publish(self, streamType: str, branchName: str | None, message, accept=None):
+        # branchName None sends to the subscribers on every branch, accept(session) can filter further
+        key = (streamType, branchName)
+        ticket = None
+        if streamType in BRANCH_STREAMS and branchName is not None:
+            with self.orderCond:
+                ticket = self.tickets.get(key, 0) + 1
+                self.tickets[key] = ticket
+                if streamType == "depi" and accept is None:
+                    message = self._stamp(branchName, message)
+        publication = (key, ticket, message, accept)
+        if getattr(self.deferred, "pending", None) is not None:
+            self.deferred.pending.append(publication)
+        else:
+            self._deliver(*publication)
+
+    def _stamp(self, branchName: str, message):
+        # called with orderCond held
+        sequence = self.sequences.get(branchName, 0) + 1
+        self.sequences[branchName] = sequence
+        stamped = depi_pb2.DepiUpdate()
+        stamped.CopyFrom(message)
+        stamped.sequence = self.sequenceBase + sequence
+        if self.replaySize > 0:
+            replay = self.replay.get(branchName)
+            if replay is None:
+                replay = collections.deque(maxlen=self.replaySize)
+                self.replay[branchName] = replay
+            replay.append((stamped.sequence, stamped))
+        return stamped
+
+    def missedUpdates(self, branchName: str, resumeFrom: int) -> list | None:
+        # the depi updates published on a branch after resumeFrom, or None if they aren't all kept
+        with self.orderCond:
+            last = self.sequenceBase + self.sequences.get(branchName, 0)
+            if resumeFrom == last:
+                return []
+            if resumeFrom > last:
+                return None
+            replay = self.replay.get(branchName)
+            if replay is None or len(replay) == 0 or replay[0][0] > resumeFrom + 1:
+                return None
+            return [update for sequence, update in replay if sequence > resumeFrom]
+
+    def publishDepi(self, branchName: str | None, update: depi_pb2.DepiUpdate):
+        self.publish("depi", branchName, update)
+
+    def publishBlackboard(self, update: depi_pb2.BlackboardUpdate, userName: str | None = None):
+        if userName is None:
+            self.publish("blackboard", None, update)
+        else:
+            self.publish("blackboard", None, update, lambda session: session.user.name == userName)
+
+    def publishResourceUpdate(self, branchName: str, toolId: str, URL: str, update: depi_pb2.ResourceUpdate):
+        self.publish("resources", branchName,
+                     depi_pb2.ResourcesUpdatedNotification(ok=True, msg="", updates=[update]),
+                     lambda session: (toolId, URL) in session.watchedGroups)
+
+    def _deliver(self, key, ticket, message, accept):
+        streamType, branchName = key
+        if ticket is not None:
+            self._waitForTurn(key, ticket)
+        try:
+            with self.lock:
+                if branchName is None:
+                    subscribers = [s for subs in self.index[streamType].values() for s in subs.values()]
+                else:
+                    subscribers = list(self.index[streamType].get(branchName, {}).values())
+            for subscriber in subscribers:
+                if accept is None or accept(subscriber.session):
+                    subscriber.put(message)
+        finally:
+            if ticket is not None:
+                self._passTicket(key, ticket)
+
+    def _passTicket(self, key, ticket):
+        with self.orderCond:
+            if self.deliveredTickets.get(key, 0) < ticket:
+                self.deliveredTickets[key] = ticket
+            self.orderCond.notify_all()
+
+    def _waitForTurn(self, key, ticket):
+        with self.orderCond:
+            deadline = time.monotonic() + ORDER_WAIT_TIMEOUT
+            while self.deliveredTickets.get(key, 0) < ticket - 1:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.warning("Gave up waiting for earlier {} updates on {}".format(key[0], key[1]))
+                    return
+                self.orderCond.wait(remaining)
+
+    def getStats(self) -> list[dict]:
+        with self.lock:
+            subscribers = [s for streams in self.index.values() for subs in streams.values() for s in subs.values()]
+        return [s.getStats() for s in subscribers]
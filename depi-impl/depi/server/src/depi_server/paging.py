@@ -0,0 +1,83 @@
+import base64
+import json
+
+# Paging splits a large response into messages under gRPC's size limit, it does not make the read
+# cheaper. Page tokens hold the branch version (or blackboard revision) the first page was read at
+# and the offset of the next item. The pages are cut from the whole sorted response that was built
+# for that version, which the server keeps in a store of its own, so a client paging through a
+# result sees one state of the branch even while it is being written to, as long as the response
+# is still kept.
+#
+# The repeated fields of a response are paged in groups: the fields of a group run in parallel
+# (resources[i] belongs to links[i]) and are cut together, the groups follow each other.
+
+
+def resource_key(res) -> tuple:
+    return res.toolId, res.resourceGroupURL, res.URL
+
+
+def link_key(link) -> tuple:
+    return resource_key(link.fromRes) + resource_key(link.toRes)
+
+
+def encode_page_token(version: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"v": version, "o": offset}).encode("utf-8")).decode("ascii")
+
+
+def decode_page_token(token: str) -> tuple[str | None, int]:
+    # raises ValueError for a token that wasn't made by encode_page_token
+    if len(token) == 0:
+        return None, 0
+    try:
+        record = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        version = record["v"]
+        offset = record["o"]
+    except (ValueError, TypeError, KeyError) as exc:
+        raise ValueError("Invalid page token") from exc
+    if not isinstance(version, str) or not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid page token")
+    return version, offset
+
+
+def sort_groups(response, groups):
+    # gives the pages the same order each time a response is built for a version
+    for (fields, key) in groups:
+        rows = sorted(zip(*[getattr(response, field) for field in fields]), key=lambda row: key(row[0]))
+        for i, field in enumerate(fields):
+            items = [row[i] for row in rows]
+            response.ClearField(field)
+            getattr(response, field).extend(items)
+
+
+def page_of(response, groups, version: str, offset: int, pageSize: int):
+    paged = set([field for (fields, key) in groups for field in fields])
+    page = type(response)()
+    for field, value in response.ListFields():
+        if field.name in paged:
+            continue
+        if field.label == field.LABEL_REPEATED:
+            getattr(page, field.name).extend(value)
+        elif field.message_type is not None:
+            getattr(page, field.name).CopyFrom(value)
+        else:
+            setattr(page, field.name, value)
+
+    start = offset
+    remaining = pageSize
+    total = sum([len(getattr(response, fields[0])) for (fields, key) in groups])
+    for (fields, key) in groups:
+        size = len(getattr(response, fields[0]))
+        if remaining <= 0:
+            break
+        if start >= size:
+            start -= size
+            continue
+        end = min(size, start + remaining)
+        for field in fields:
+            getattr(page, field).extend(getattr(response, field)[start:end])
+        remaining -= end - start
+        start = 0
+
+    if offset + pageSize < total:
+        page.nextPageToken = encode_page_token(version, offset + pageSize)
+    return page
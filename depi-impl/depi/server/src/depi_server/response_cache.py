@@ -0,0 +1,68 @@
+import collections
+import threading
+
+# Read responses kept by branch version. A response depends on who asked as well as on the
+# request, so the key holds the user and the request without its session. Entries for older
+# versions of a branch are never hit again, they are pushed out by newer ones.
+#
+# The cache is bounded by entries and by the serialized size of the responses it holds. A
+# response bigger than the byte bound is not kept, unless keepNewest is set: then the latest
+# response is kept whatever its size, until the next one pushes it out.
+
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def request_key(request) -> bytes:
+    key = type(request)()
+    key.CopyFrom(request)
+    for field in ["sessionId", "ifNoneMatch", "pageSize", "pageToken", "compact", "compress"]:
+        if field in key.DESCRIPTOR.fields_by_name:
+            key.ClearField(field)
+    return key.SerializeToString(deterministic=True)
+
+
+class ResponseCache:
+    def __init__(self, maxEntries: int = 256, maxBytes: int = RESPONSE_CACHE_BYTES, keepNewest=False):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.keepNewest = keepNewest
+        self.lock = threading.Lock()
+        # key -> (response, size)
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response):
+        if self.maxEntries <= 0:
+            return
+        size = response.ByteSize()
+        if size > self.maxBytes and not self.keepNewest:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (response, size)
+            self.bytes += size
+            while len(self.entries) > 1 and (len(self.entries) > self.maxEntries or self.bytes > self.maxBytes):
+                self.bytes -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def getStats(self) -> dict:
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
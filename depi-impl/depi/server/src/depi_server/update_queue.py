@@ -0,0 +1,92 @@
+import asyncio
+import collections
+import threading
+
+# The queue between the RPCs that produce updates and a watch stream. Producers always run on a
+# thread, the consumer is either a thread blocked in get() (threaded server) or a coroutine
+# awaiting getAsync() (grpc.aio server), which does not hold a thread while it waits.
+# A str item ends the stream. Subclasses change what is queued by overriding offer(), take(),
+# available() and waitTime(), which are always called with the lock held. take() may return None
+# when there turned out to be nothing to send, the consumer then keeps waiting.
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class UpdateQueue:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.items = collections.deque()
+        self.waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def offer(self, item):
+        self.items.append(item)
+
+    def take(self):
+        return self.items.popleft()
+
+    def available(self) -> bool:
+        return len(self.items) > 0
+
+    def waitTime(self):
+        # how long until available() may change without a put(), None for no limit
+        return None
+
+    def put(self, item):
+        with self.lock:
+            self.offer(item)
+            self.ready.notify()
+            waiters = self.waiters
+            self.waiters = []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def get(self):
+        with self.lock:
+            while True:
+                if self.available():
+                    item = self.take()
+                    if item is not None:
+                        return item
+                    continue
+                self.ready.wait(self.waitTime())
+
+    async def getAsync(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                if self.available():
+                    item = self.take()
+                    if item is not None:
+                        return item
+                    continue
+                waiter = (loop, loop.create_future())
+                self.waiters.append(waiter)
+                timeout = self.waitTime()
+            try:
+                await asyncio.wait([waiter[1]], timeout=timeout)
+            finally:
+                with self.lock:
+                    if waiter in self.waiters:
+                        self.waiters.remove(waiter)
+
+    def qsize(self) -> int:
+        with self.lock:
+            return len(self.items)
+
+    def __iter__(self):
+        while True:
+            update = self.get()
+            if isinstance(update, str):
+                return
+            yield update
+
+    async def __aiter__(self):
+        while True:
+            update = await self.getAsync()
+            if isinstance(update, str):
+                return
+            yield update
@@ -0,0 +1,94 @@
+import asyncio
+import shutil
+import sys
+import tempfile
+import unittest
+from concurrent import futures
+
+sys.path.append("src")
+
+import grpc
+import depi_pb2
+import depi_pb2_grpc
+from depi_server import depi_server
+from depi_server.depi_server_aio import AsyncDepiServer
+from depi_server.model.depi_model import Resource, ResourceGroup
+
+
+class TestAioServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.state_dir = tempfile.mkdtemp(prefix="depi_aio_test_")
+        depi_server.config = depi_server.Config({
+            "tools": {"git": {"pathSeparator": "/"}, "webgme": {"pathSeparator": "/"}},
+            "db": {"type": "memjson", "stateDir": self.state_dir},
+            "audit": {"directory": ""},
+            "users": [{"name": "mark", "password": "mark"}]
+        })
+        self.servicer = depi_server.DepiServer()
+        self.servicer.db.getBranch("main").saveBranchState()
+
+        # fewer worker threads than watchers, the watch streams must not need one
+        self.executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.server = grpc.aio.server()
+        depi_pb2_grpc.add_DepiServicer_to_server(AsyncDepiServer(self.servicer, self.executor), self.server)
+        port = self.server.add_insecure_port("localhost:0")
+        await self.server.start()
+        self.channel = grpc.aio.insecure_channel("localhost:{}".format(port))
+        self.stub = depi_pb2_grpc.DepiStub(self.channel)
+
+    async def asyncTearDown(self):
+        await self.channel.close()
+        await self.server.stop(None)
+        self.executor.shutdown()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    async def login(self):
+        resp = await self.stub.Login(depi_pb2.LoginRequest(user="mark", password="mark", toolId="git"))
+        self.assertTrue(resp.ok, resp.msg)
+        return resp.sessionId
+
+    async def test_watchers_do_not_hold_threads(self):
+        sessions = [await self.login() for _ in range(8)]
+        streams = [self.stub.WatchBlackboard(depi_pb2.WatchBlackboardRequest(sessionId=s)) for s in sessions]
+        while sum([1 for s in self.servicer.sessions.values() if s.watchingBlackboard]) < len(sessions):
+            await asyncio.sleep(0.01)
+
+        resource = depi_pb2.Resource(toolId="git", resourceGroupName="rg", resourceGroupURL="/rg",
+                                     resourceGroupVersion="1", name="a", URL="/a", id="/a")
+        for sessionId in sessions:
+            resp = await asyncio.wait_for(self.stub.AddResourcesToBlackboard(
+                depi_pb2.AddResourcesToBlackboardRequest(sessionId=sessionId, resources=[resource])), 5)
+            self.assertTrue(resp.ok, resp.msg)
+
+        for stream in streams:
+            update = await asyncio.wait_for(stream.read(), 5)
+            self.assertEqual("/a", update.updates[0].resource.URL)
+            stream.cancel()
+
+    async def test_unwatch_ends_stream(self):
+        sessionId = await self.login()
+        stream = self.stub.WatchDepi(depi_pb2.WatchDepiRequest(sessionId=sessionId))
+        session = self.servicer.sessions[sessionId]
+        while not session.watchingDepi:
+            await asyncio.sleep(0.01)
+
+        resp = await self.stub.UnwatchDepi(depi_pb2.WatchDepiRequest(sessionId=sessionId))
+        self.assertTrue(resp.ok, resp.msg)
+        self.assertEqual(grpc.aio.EOF, await asyncio.wait_for(stream.read(), 5))
+
+    async def test_server_stream(self):
+        # more resources than are fetched from the handler in one batch
+        rg = ResourceGroup(name="rg", toolId="git", URL="/rg", version="1")
+        self.servicer.db.getBranch("main").addResources(
+            [(rg, Resource(name="r{}".format(i), id="/r{}".format(i), URL="/r{}".format(i))) for i in range(250)])
+
+        sessionId = await self.login()
+        responses = [r async for r in self.stub.GetResourcesAsStream(depi_pb2.GetResourcesRequest(
+            sessionId=sessionId, patterns=[depi_pb2.ResourceRefPattern(toolId="git", resourceGroupURL="/rg",
+                                                                       URLPattern=".*")]))]
+        self.assertEqual(250, len(responses))
+        self.assertTrue(all([r.ok for r in responses]))
+
+
+if __name__ == '__main__':
+    unittest.main()
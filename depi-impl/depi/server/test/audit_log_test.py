@@ -0,0 +1,98 @@
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+sys.path.append("src")
+
+from depi_server.audit_log import AuditLog
+from depi_server import audit_query
+
+
+class TestAuditLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="depi_audit_")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, filename):
+        path = os.path.join(self.dir, filename)
+        if filename.endswith(".gz"):
+            with gzip.open(path, "rt") as in_file:
+                return in_file.read().splitlines()
+        with open(path, "r") as in_file:
+            return in_file.read().splitlines()
+
+    def test_entries_are_written_on_close(self):
+        log = AuditLog(self.dir, queueSize=10, flushInterval=10.0)
+        for i in range(25):
+            log.write("mark", "AddResource", "URL=/r{}".format(i))
+        log.close()
+        today = datetime.date.today().strftime("%Y%m%d")
+        lines = self.read(today)
+        self.assertEqual(25, len(lines))
+        self.assertTrue(lines[0].endswith("|mark|AddResource|URL=/r0"))
+        self.assertTrue(lines[-1].endswith("|mark|AddResource|URL=/r24"))
+
+    def test_rotate_and_compress(self):
+        log = AuditLog(self.dir, flushInterval=0.0, maxFileSize=100, compress=True)
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        log.queue.put((yesterday, "mark", "LinkResources", "old"))
+        for i in range(10):
+            log.write("mark", "AddResource", "URL=/r{}".format(i))
+        log.close()
+
+        today = datetime.date.today().strftime("%Y%m%d")
+        files = sorted(os.listdir(self.dir))
+        self.assertIn(yesterday.strftime("%Y%m%d") + ".gz", files)
+        self.assertIn(today + ".1.gz", files)
+        self.assertEqual(["old"], [line.split("|")[-1] for line in self.read(yesterday.strftime("%Y%m%d") + ".gz")])
+
+        lines = []
+        for filename in files:
+            if filename.startswith(today):
+                lines.extend(self.read(filename))
+        self.assertEqual(sorted(["URL=/r{}".format(i) for i in range(10)]),
+                         sorted([line.split("|")[-1] for line in lines]))
+
+    def test_jsonl_index_and_query(self):
+        log = AuditLog(self.dir, flushInterval=0.0, maxFileSize=2000, compress=True, format="jsonl")
+        link = "fromToolId=git;fromRgURL=/repo;fromURL=/a{};toToolId=webgme;toRgURL=/proj;toURL=/b"
+        for i in range(20):
+            log.write("mark" if i % 2 == 0 else "gabor", "LinkResources", link.format(i))
+        log.write("mark", "AddResourceGroup", "toolId=git;URL=/other;name=other;version=1")
+        log.close()
+
+        files = audit_query.audit_files(self.dir)
+        self.assertTrue(any([f.endswith(".gz") for f in files]))
+        self.assertTrue(all([audit_query.load_index(f) is not None for f in files]))
+
+        entries = list(audit_query.query(self.dir, user="gabor", group="webgme:/proj"))
+        self.assertEqual(["/a{}".format(i) for i in range(1, 20, 2)], [e["fields"]["fromURL"] for e in entries])
+        entries = list(audit_query.query(self.dir, group="git:/repo", resource="/a4"))
+        self.assertEqual(1, len(entries))
+        self.assertEqual("mark", entries[0]["user"])
+        self.assertEqual(["AddResourceGroup"], [e["op"] for e in audit_query.query(self.dir, group="git:/other")])
+        tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.assertEqual([], list(audit_query.query(self.dir, user="mark", start=tomorrow)))
+
+    def test_late_entry_for_compressed_day(self):
+        yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+        link = "fromToolId=git;fromRgURL=/repo;fromURL={};toToolId=git;toRgURL=/repo;toURL=/b"
+        for url in ["/early", "/late"]:
+            log = AuditLog(self.dir, flushInterval=0.0, compress=True, format="jsonl")
+            log.queue.put((yesterday, "mark", "LinkResources", link.format(url)))
+            log.close()
+
+        day = yesterday.strftime("%Y%m%d")
+        self.assertEqual([day + ".jsonl.1.gz", day + ".jsonl.1.idx", day + ".jsonl.gz", day + ".jsonl.idx"],
+                         sorted(os.listdir(self.dir)))
+        entries = list(audit_query.query(self.dir, user="mark", group="git:/repo"))
+        self.assertEqual(["/early", "/late"], [e["fields"]["fromURL"] for e in entries])
+
+        with self.assertRaises(ValueError):
+            list(audit_query.query(self.dir, resource="/late"))
@@ -0,0 +1,50 @@
+import unittest
+import sys
+
+sys.path.append("src")
+
+from depi_server.auth.depi_authorization import Authorization, CapLinkRead, CapResourceRead, CapResGroupRead, \
+    CapLinkAdd, CapResourceAdd, SCOPE_NONE, SCOPE_UNRESTRICTED, SCOPE_GROUPS, SCOPE_PATTERNS
+from depi_server.bench import auth_bench
+
+
+class TestAuthorization(unittest.TestCase):
+    def test_cached_decisions_match_verify_all(self):
+        auth = Authorization([], [CapLinkRead("git", "/repo*", "*.py", "webgme", "*", "/a/*"),
+                                  CapLinkRead("git", "/repo1", "*", "*", "/proj|/other", "*"),
+                                  CapResourceRead("git", "/repo*", "/src/*"),
+                                  CapResGroupRead("git*", "*")])
+        links = [("git", "/repo1", "x.py", "webgme", "/p", "/a/b"),
+                 ("git", "/repo1", "x.py", "webgme", "/p", "/b"),
+                 ("git", "/repo2", "x.c", "webgme", "/p", "/a/b"),
+                 ("git", "/repo1", "x.c", "git", "/other", "/z"),
+                 ("git", "/repo1", "x\0y", "git", "/other", "/z")]
+        # twice, the second round comes from the decision cache
+        for _ in range(2):
+            for args in links:
+                self.assertEqual(auth.verify_all(CapLinkRead, *args), auth.is_authorized(CapLinkRead, *args), args)
+            for args in [("git", "/repo3", "/src/a"), ("git", "/repo3", "/doc/a"), ("webgme", "/repo3", "/src/a")]:
+                self.assertEqual(auth.verify_all(CapResourceRead, *args),
+                                 auth.is_authorized(CapResourceRead, *args), args)
+            self.assertTrue(auth.is_authorized(CapResGroupRead, "git", "/any"))
+            self.assertFalse(auth.is_authorized(CapResGroupRead, "webgme", "/any"))
+
+    def test_classify(self):
+        auth = Authorization([], [CapLinkRead("*", "*", "*", "*", "*", "*"),
+                                  CapResourceRead("git", "/repo*", "*"),
+                                  CapResGroupRead("git", "/repo1"),
+                                  CapLinkAdd("git", "*", "/src/*", "git", "*", "*")])
+        self.assertEqual(SCOPE_UNRESTRICTED, auth.classify(CapLinkRead))
+        self.assertEqual(SCOPE_GROUPS, auth.classify(CapResourceRead))
+        self.assertEqual(SCOPE_GROUPS, auth.classify(CapResGroupRead))
+        self.assertEqual(SCOPE_PATTERNS, auth.classify(CapLinkAdd))
+        self.assertEqual(SCOPE_NONE, auth.classify(CapResourceAdd))
+
+        self.assertTrue(auth.may_authorize(CapResourceRead, "git", "/repo2", None))
+        self.assertFalse(auth.may_authorize(CapResourceRead, "webgme", "/repo2", None))
+        self.assertTrue(auth.may_authorize(CapLinkAdd, None, None, None, "git", "/x", None))
+        self.assertFalse(auth.may_authorize(CapLinkAdd, "git", "/x", "/doc/a", None, None, None))
+
+    def test_auth_bench(self):
+        result = auth_bench.run_benchmarks(["dirs"], [200], 5, 1, 1)
+        self.assertEqual(auth_bench.OPERATIONS, [r["operation"] for r in result["results"]])
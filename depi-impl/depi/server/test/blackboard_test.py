@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import sys
+
+sys.path.append("src")
+
+import depi_pb2
+from depi_server.blackboard import Blackboard, BlackboardIndex, BlackboardStore
+from depi_server.model.depi_model import Resource, ResourceGroup, ResourceChange, ResourceGroupChange, \
+    LinkWithResources
+
+
+class TestBlackboard(unittest.TestCase):
+    def setUp(self):
+        self.index = BlackboardIndex()
+        self.blackboard = Blackboard("mark", self.index)
+        self.git = ResourceGroup("repo", "git", "/repo", "1")
+        self.webgme = ResourceGroup("proj", "webgme", "/proj", "1")
+        for rg, URL in [(self.git, "/a"), (self.git, "/b"), (self.webgme, "/x")]:
+            self.blackboard.addResource(rg, Resource(URL, URL, URL))
+
+    def link(self, fromURL, toURL):
+        fromRg, fromRes = self.blackboard.expandResource("git", "/repo", fromURL)
+        toRg, toRes = self.blackboard.expandResource("webgme", "/proj", toURL)
+        return LinkWithResources(fromRg, fromRes, toRg, toRes)
+
+    def test_adjacency(self):
+        self.assertEqual(["mark"], self.index.usersOf(("git", "/repo")))
+        self.blackboard.linkResources([self.link("/a", "/x"), self.link("/b", "/x")])
+        self.assertEqual(2, len(self.blackboard.linksOf("webgme", "/proj", "/x")))
+        self.assertEqual(1, len(self.blackboard.linksOf("git", "/repo", "/a")))
+
+        self.assertEqual(1, len(self.blackboard.unlinkResources([self.link("/a", "/x")])))
+        self.assertEqual(1, len(self.blackboard.changedLinks))
+        self.assertEqual(1, len(self.blackboard.deletedLinks))
+        self.assertEqual(1, len(self.blackboard.linkResources([self.link("/a", "/x")])))
+        self.assertEqual(0, len(self.blackboard.deletedLinks))
+        self.assertEqual(2, len(self.blackboard.linksOf("webgme", "/proj", "/x")))
+
+        self.blackboard.detach()
+        self.assertEqual([], self.index.usersOf(("git", "/repo")))
+
+    def test_rename_and_remove(self):
+        self.blackboard.linkResources([self.link("/a", "/x"), self.link("/b", "/x")])
+        change = ResourceGroupChange("repo", "git", "/repo", "2")
+        change.resources["/a"] = ResourceChange("/a", "/a", "/a", "/c", "/c", "/c",
+                                                changeType=int(depi_pb2.ChangeType.Renamed))
+        updates = self.blackboard.applyResourceGroupChange(change)
+        self.assertEqual([depi_pb2.UpdateType.ResourceGroupVersionChanged, depi_pb2.UpdateType.RenameLink,
+                          depi_pb2.UpdateType.RenameResource], [u.updateType for u in updates])
+        self.assertEqual("/a", updates[1].renameLink.fromRes.URL)
+        self.assertEqual("/c", updates[1].renameLink.fromResNew.URL)
+        self.assertEqual("/x", updates[1].renameLink.toResNew.URL)
+
+        # the renamed link is found by its new URL, in the set and in the adjacency
+        self.assertIn(self.link("/c", "/x"), self.blackboard.changedLinks)
+        self.assertEqual([], self.blackboard.linksOf("git", "/repo", "/a"))
+        self.assertEqual(1, len(self.blackboard.linksOf("git", "/repo", "/c")))
+        self.assertEqual([], self.blackboard.applyResourceGroupChange(change))
+
+        change = ResourceGroupChange("proj", "webgme", "/proj", "2")
+        change.resources["/x"] = ResourceChange("/x", "/x", "/x", "/x", "/x", "/x",
+                                                changeType=int(depi_pb2.ChangeType.Removed))
+        updates = self.blackboard.applyResourceGroupChange(change)
+        self.assertEqual(2, len([u for u in updates if u.updateType == depi_pb2.UpdateType.RemoveLink]))
+        self.assertEqual(0, len(self.blackboard.changedLinks))
+        self.assertEqual(2, len(self.blackboard.deletedLinks))
+
+    def test_spill_and_reload(self):
+        spillDir = tempfile.mkdtemp(prefix="depi_spill_")
+        try:
+            self.blackboard.linkResources([self.link("/a", "/x")])
+            self.blackboard.unlinkResources([self.link("/a", "/x")])
+            self.blackboard.linkResources([self.link("/b", "/x")])
+            store = BlackboardStore(self.index, spillDir, userQuota=self.blackboard.estimatedSize() - 1)
+            store["mark"] = self.blackboard
+            with store.use("mark") as blackboard:
+                self.assertIs(self.blackboard, blackboard)
+                self.assertEqual(0, store.getStats()["spilled"])
+            self.assertEqual({}, store.getStats()["sizes"])
+            self.assertEqual(1, len(os.listdir(spillDir)))
+            self.assertIn("mark", store)
+
+            with store.use("mark") as blackboard:
+                self.assertEqual(self.blackboard.toJson(), blackboard.toJson())
+                self.assertIn(self.link("/b", "/x"), blackboard.changedLinks)
+                self.assertIn(self.link("/a", "/x"), blackboard.deletedLinks)
+                self.assertEqual(1, len(blackboard.linksOf("git", "/repo", "/b")))
+                self.assertIs(blackboard.expandResource("git", "/repo", "/b")[1],
+                              blackboard.linksOf("git", "/repo", "/b")[0].fromRes)
+            # a reloaded blackboard stays in memory for the grace period although it is over the quota
+            self.assertEqual({"spilled": 0, "spills": 1, "reloads": 1},
+                             {k: v for k, v in store.getStats().items() if k != "sizes"})
+            store.enforceQuotas()
+            self.assertEqual(0, store.getStats()["spilled"])
+            store.spillGrace = 0
+            store.enforceQuotas()
+            self.assertEqual({"spilled": 1, "spills": 2, "reloads": 1},
+                             {k: v for k, v in store.getStats().items() if k != "sizes"})
+
+            store.userQuota = 0
+            store.totalQuota = 1
+            store["gabor"] = Blackboard("gabor", self.index)
+            store.idleTimeout = 0.001
+            with store.use("gabor"):
+                pass
+            store.enforceQuotas()
+            self.assertIn("gabor", store)
+            time.sleep(0.01)
+            # an empty blackboard is dropped instead of spilled
+            store.spillIdle()
+            self.assertNotIn("gabor", store)
+            self.assertIn("mark", store)
+        finally:
+            shutil.rmtree(spillDir)
+
+    def test_spill_waits_for_the_user(self):
+        spillDir = tempfile.mkdtemp(prefix="depi_spill_")
+        try:
+            store = BlackboardStore(self.index, spillDir, userQuota=1)
+            store["mark"] = self.blackboard
+            with store.use("mark"):
+                # a spill doesn't wait for a blackboard that is in use, and leaves it in memory
+                done = threading.Event()
+                threading.Thread(target=lambda: (store.spill("mark"), done.set())).start()
+                self.assertTrue(done.wait(5))
+                self.assertEqual(0, store.getStats()["spilled"])
+                # the other users' tables stay available meanwhile
+                self.assertNotIn("gabor", store)
+            self.assertEqual(1, store.getStats()["spilled"])
+        finally:
+            shutil.rmtree(spillDir)
+
+    def test_parallel_use(self):
+        store = BlackboardStore(self.index)
+        store["mark"] = self.blackboard
+        partial = []
+
+        def add(start):
+            for i in range(start, start + 200, 10):
+                with store.use("mark") as blackboard:
+                    # no other request's batch is seen half applied
+                    if (len(blackboard.resources["git"]["/repo"].resources) - 2) % 10 != 0:
+                        partial.append(i)
+                    for j in range(i, i + 10):
+                        URL = "/r{}".format(j)
+                        blackboard.addResource(self.git, Resource(URL, URL, URL))
+                        time.sleep(0)
+
+        threads = [threading.Thread(target=add, args=(n * 200,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], partial)
+        self.assertEqual(802, len(self.blackboard.resources["git"]["/repo"].resources))
+
+        # a save takes what it saved off the blackboard and leaves what was added while it ran
+        rs = self.blackboard.getResources()
+        self.blackboard.addResource(self.git, Resource("/late", "/late", "/late"))
+        updates = self.blackboard.removeSaved(rs, [])
+        self.assertEqual(803, len(updates))
+        self.assertEqual(["/late"], list(self.blackboard.resources["git"]["/repo"].resources))
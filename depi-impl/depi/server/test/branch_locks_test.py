@@ -0,0 +1,120 @@
+import threading
+import time
+import unittest
+import sys
+
+sys.path.append("src")
+
+from depi_server.branch_locks import BranchLockManager
+
+
+class TestBranchLocks(unittest.TestCase):
+    def test_readers_share(self):
+        locks = BranchLockManager()
+        locks.acquireRead("main")
+        acquired = threading.Event()
+
+        def reader():
+            locks.acquireRead("main")
+            acquired.set()
+            locks.releaseRead("main")
+
+        t = threading.Thread(target=reader)
+        t.start()
+        self.assertTrue(acquired.wait(2))
+        t.join()
+        locks.releaseRead("main")
+        self.assertEqual(0, locks.getStats()["main"]["readContended"])
+
+    def test_writer_excludes_readers_on_same_branch_only(self):
+        locks = BranchLockManager()
+        locks.acquireWrite("main")
+        mainRead = threading.Event()
+        otherWrite = threading.Event()
+
+        def mainReader():
+            locks.acquireRead("main")
+            mainRead.set()
+            locks.releaseRead("main")
+
+        def otherWriter():
+            locks.acquireWrite("review")
+            otherWrite.set()
+            locks.releaseWrite("review")
+
+        threads = [threading.Thread(target=mainReader), threading.Thread(target=otherWriter)]
+        for t in threads:
+            t.start()
+        self.assertTrue(otherWrite.wait(2))
+        self.assertFalse(mainRead.wait(0.1))
+        locks.releaseWrite("main")
+        self.assertTrue(mainRead.wait(2))
+        for t in threads:
+            t.join()
+
+        stats = locks.getStats()
+        self.assertEqual(1, stats["main"]["readContended"])
+        self.assertEqual(0, stats["review"]["writeContended"])
+
+    def test_waiting_writer_blocks_new_readers(self):
+        locks = BranchLockManager()
+        locks.acquireRead("main")
+        order = []
+
+        def writer():
+            locks.acquireWrite("main")
+            order.append("write")
+            locks.releaseWrite("main")
+
+        def reader():
+            locks.acquireRead("main")
+            order.append("read")
+            locks.releaseRead("main")
+
+        w = threading.Thread(target=writer)
+        w.start()
+        while locks.getStats()["main"]["waitingWriters"] == 0:
+            time.sleep(0.01)
+        r = threading.Thread(target=reader)
+        r.start()
+        time.sleep(0.1)
+        locks.releaseRead("main")
+        w.join()
+        r.join()
+        self.assertEqual(["write", "read"], order)
+
+    def test_multi_branch_acquire_in_order(self):
+        locks = BranchLockManager()
+        errors = []
+
+        def worker(reads, writes):
+            try:
+                for _ in range(200):
+                    with locks.acquire(reads=reads, writes=writes):
+                        pass
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker, args=(["main"], ["review"])),
+                   threading.Thread(target=worker, args=(["review"], ["main"])),
+                   threading.Thread(target=worker, args=([], ["review", "main"]))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+            self.assertFalse(t.is_alive())
+        self.assertEqual([], errors)
+        stats = locks.getStats()
+        self.assertFalse(stats["main"]["writer"])
+        self.assertEqual(0, stats["review"]["readers"])
+
+    def test_version_changes_on_write(self):
+        locks = BranchLockManager()
+        version = locks.versionToken("main")
+        with locks.read("main"):
+            pass
+        self.assertEqual(version, locks.versionToken("main"))
+        with locks.write("main"):
+            pass
+        self.assertNotEqual(version, locks.versionToken("main"))
+        self.assertNotEqual(locks.versionToken("main"), BranchLockManager().versionToken("main"))
@@ -5,6 +5,7 @@ import depi_server
 
 from depi_server.model.depi_model import (ResourceGroup, Resource, Link, LinkWithResources, ResourceRef)
 from depi_server import depi_server
+from depi_server.response_cache import ResponseCache
 
 class TestDepiServer(unittest.TestCase):
     depi: depi_server.DepiServer = None
@@ -150,6 +151,188 @@ class TestDepiServer(unittest.TestCase):
                 self.assertEqual(rg.version, "222222", "resource group version should be updated")
         self.assertTrue(found, "The updated resource group should be present in the resource groups")
 
+    def test_get_resource_groups_not_modified(self):
+        self.login()
+        self.make_data_model()
+
+        resp = self.depi.GetResourceGroups(depi_pb2.GetResourceGroupsRequest(sessionId=self.session), None)
+        self.assertTrue(resp.ok, resp.msg)
+        self.assertEqual(2, len(resp.resourceGroups))
+
+        resp = self.depi.GetResourceGroups(depi_pb2.GetResourceGroupsRequest(sessionId=self.session,
+                                                                             ifNoneMatch=resp.version), None)
+        self.assertTrue(resp.notModified, "Resource groups should not have changed")
+        self.assertEqual(0, len(resp.resourceGroups))
+
+        rg_edit = depi_pb2.ResourceGroupEdit(toolId="git", URL="resourcegroup2", new_toolId="git",
+                                             new_URL="resourcegroup3", new_name="resourcegroup3", new_version="1")
+        edit_resp = self.depi.EditResourceGroup(depi_pb2.EditResourceGroupRequest(sessionId=self.session,
+                                                                                  resourceGroup=rg_edit), None)
+        self.assertTrue(edit_resp.ok, edit_resp.msg)
+
+        resp = self.depi.GetResourceGroups(depi_pb2.GetResourceGroupsRequest(sessionId=self.session,
+                                                                             ifNoneMatch=resp.version), None)
+        self.assertFalse(resp.notModified, "Resource groups were edited")
+        self.assertIn("resourcegroup3", [rg.URL for rg in resp.resourceGroups])
+
+    def test_get_changes_since(self):
+        self.login()
+        self.make_data_model()
+
+        responses = list(self.depi.GetChangesSince(depi_pb2.GetChangesSinceRequest(sessionId=self.session), None))
+        self.assertEqual(1, len(responses))
+        self.assertTrue(responses[0].resync, "An empty version should ask for a full read")
+        version = responses[0].version
+
+        rg_edit = depi_pb2.ResourceGroupEdit(toolId="git", URL="resourcegroup2", new_toolId="git",
+                                             new_URL="resourcegroup3", new_name="resourcegroup3", new_version="1")
+        resp = self.depi.EditResourceGroup(depi_pb2.EditResourceGroupRequest(sessionId=self.session,
+                                                                             resourceGroup=rg_edit), None)
+        self.assertTrue(resp.ok, resp.msg)
+
+        responses = list(self.depi.GetChangesSince(depi_pb2.GetChangesSinceRequest(
+            sessionId=self.session, sinceVersion=version), None))
+        self.assertFalse(responses[0].resync, "The changes since the version should be known")
+        updates = [u for r in responses for u in r.updates]
+        self.assertIn((depi_pb2.UpdateType.AddResourceGroup, "resourcegroup3"),
+                      [(u.updateType, u.addResourceGroup.URL) for u in updates])
+        self.assertIn((depi_pb2.UpdateType.RemoveResourceGroup, "resourcegroup2"),
+                      [(u.updateType, u.removeResourceGroup.URL) for u in updates])
+        self.assertNotIn("resourcegroup1", [u.addResourceGroup.URL for u in updates])
+
+        responses = list(self.depi.GetChangesSince(depi_pb2.GetChangesSinceRequest(
+            sessionId=self.session, sinceVersion=responses[0].version), None))
+        self.assertEqual(0, len(responses[0].updates))
+
+    def test_get_resources_paged(self):
+        self.login()
+        self.make_data_model()
+
+        def request(pageToken=""):
+            return depi_pb2.GetResourcesRequest(sessionId=self.session, pageSize=2, pageToken=pageToken, patterns=[
+                depi_pb2.ResourceRefPattern(toolId="git", resourceGroupURL=rg, URLPattern=".*")
+                for rg in ["resourcegroup1", "resourcegroup2"]])
+
+        resp = self.depi.GetResources(request(), None)
+        self.assertTrue(resp.ok, resp.msg)
+        urls = [r.URL for r in resp.resources]
+
+        # pages after a write still come from the state the first page was read from
+        rg_edit = depi_pb2.ResourceGroupEdit(toolId="git", URL="resourcegroup2", new_toolId="git",
+                                             new_URL="resourcegroup3", new_name="resourcegroup3", new_version="1")
+        edit_resp = self.depi.EditResourceGroup(depi_pb2.EditResourceGroupRequest(sessionId=self.session,
+                                                                                  resourceGroup=rg_edit), None)
+        self.assertTrue(edit_resp.ok, edit_resp.msg)
+
+        while resp.nextPageToken != "":
+            resp = self.depi.GetResources(request(resp.nextPageToken), None)
+            self.assertTrue(resp.ok, resp.msg)
+            self.assertLessEqual(len(resp.resources), 2)
+            urls.extend([r.URL for r in resp.resources])
+        self.assertEqual(["resource1", "resource2", "resource3", "resource4", "resource5"], urls)
+
+        resp = self.depi.GetResources(request("not a token"), None)
+        self.assertFalse(resp.ok)
+
+    def test_get_blackboard_resources_paged(self):
+        self.login()
+        self.make_data_model()
+
+        def add(urls):
+            self.depi.AddResourcesToBlackboard(depi_pb2.AddResourcesToBlackboardRequest(
+                sessionId=self.session, resources=[depi_pb2.Resource(
+                    toolId="git", resourceGroupName="bbrg", resourceGroupURL="bbrg", resourceGroupVersion="1",
+                    name=url, id=url, URL=url) for url in urls]), None)
+
+        add(["/c", "/a", "/b"])
+        request = depi_pb2.GetBlackboardResourcesRequest(sessionId=self.session, pageSize=2)
+        resp = self.depi.GetBlackboardResources(request, None)
+        self.assertTrue(resp.ok, resp.msg)
+        urls = [r.URL for r in resp.resources]
+
+        # the later pages come from the blackboard as it was when the first page was read
+        add(["/0"])
+        while resp.nextPageToken != "":
+            request.pageToken = resp.nextPageToken
+            resp = self.depi.GetBlackboardResources(request, None)
+            self.assertTrue(resp.ok, resp.msg)
+            urls.extend([r.URL for r in resp.resources])
+        self.assertEqual(["/a", "/b", "/c"], urls)
+
+        # a cleared blackboard starts from a later revision, the old pages don't match it
+        user = self.depi.sessions[self.session].user.name
+        revision = self.depi.blackboards[user].revision
+        self.depi.ClearBlackboard(depi_pb2.ClearBlackboardRequest(sessionId=self.session), None)
+        self.assertGreater(self.depi.blackboards[user].revision, revision)
+
+    def test_paged_results_kept_apart(self):
+        self.login()
+        self.make_data_model()
+        self.depi.responseCache = ResponseCache(1)
+
+        request = depi_pb2.GetResourcesRequest(sessionId=self.session, pageSize=2, patterns=[
+            depi_pb2.ResourceRefPattern(toolId="git", resourceGroupURL="resourcegroup1", URLPattern=".*")])
+        resp = self.depi.GetResources(request, None)
+        self.assertTrue(resp.ok, resp.msg)
+
+        # other reads fill the response cache, the paged result is not pushed out
+        for rg in ["resourcegroup1", "resourcegroup2"]:
+            other = self.depi.GetResources(depi_pb2.GetResourcesRequest(sessionId=self.session, patterns=[
+                depi_pb2.ResourceRefPattern(toolId="git", resourceGroupURL=rg, URLPattern=".*")]), None)
+            self.assertTrue(other.ok, other.msg)
+        request.pageToken = resp.nextPageToken
+        resp = self.depi.GetResources(request, None)
+        self.assertTrue(resp.ok, resp.msg)
+
+        cache = ResponseCache(10, other.ByteSize() * 2)
+        cache.put("a", other)
+        cache.put("b", other)
+        cache.put("c", other)
+        self.assertEqual(2, cache.getStats()["entries"])
+        self.assertIsNone(cache.get("a"))
+        cache.put("d", self.depi.GetResourceGroups(depi_pb2.GetResourceGroupsRequest(sessionId=self.session), None))
+        self.assertLessEqual(cache.getStats()["bytes"], other.ByteSize() * 2)
+
+    def test_get_links_compact(self):
+        self.login()
+        self.make_data_model()
+
+        request = depi_pb2.GetLinksRequest(sessionId=self.session, patterns=[
+            depi_pb2.ResourceLinkPattern(
+                fromRes=depi_pb2.ResourceRefPattern(toolId="git", resourceGroupURL=from_rg, URLPattern=".*"),
+                toRes=depi_pb2.ResourceRefPattern(toolId="git", resourceGroupURL=to_rg, URLPattern=".*"))
+            for (from_rg, to_rg) in [("resourcegroup1", "resourcegroup1"), ("resourcegroup1", "resourcegroup2"),
+                                     ("resourcegroup2", "resourcegroup2")]])
+        plain = self.depi.GetLinks(request, None)
+        self.assertTrue(plain.ok, plain.msg)
+        self.assertEqual(4, len(plain.resourceLinks))
+
+        request.compact = True
+        resp = self.depi.GetLinks(request, None)
+        self.assertTrue(resp.ok, resp.msg)
+        self.assertEqual(0, len(resp.resourceLinks))
+        listing = resp.compact
+        # each group and resource is sent once however many links use it
+        self.assertEqual(2, len(listing.groups))
+        self.assertEqual(5, len(listing.resources))
+
+        def url(index):
+            res = listing.resources[index]
+            return listing.groups[res.group].URL, res.URL
+
+        self.assertEqual([((lk.fromRes.resourceGroupURL, lk.fromRes.URL), (lk.toRes.resourceGroupURL, lk.toRes.URL))
+                          for lk in plain.resourceLinks],
+                         [(url(lk.fromRes), url(lk.toRes)) for lk in listing.links])
+
+        # the compact response is built from a copy of the cached one
+        self.assertEqual(len(plain.resourceLinks), len(self.depi.GetLinks(
+            depi_pb2.GetLinksRequest(sessionId=self.session, patterns=request.patterns), None).resourceLinks))
+
+        chunks = list(self.depi.GetAllLinksAsStream(
+            depi_pb2.GetAllLinksAsStreamRequest(sessionId=self.session, compact=True), None))
+        self.assertEqual(1, len(chunks))
+        self.assertEqual(4, len(chunks[0].compact.links))
+
     def test_update_in_folder(self):
         self.login()
         self.make_data_model()
@@ -211,6 +394,258 @@ class TestDepiServer(unittest.TestCase):
                 found = True
         self.assertTrue(found, "Should have found the link that was updated")
 
+    def test_update_resource_groups(self):
+        self.login()
+        self.make_data_model()
+        subscriber = self.depi.hub.subscribe(self.depi.sessions[self.session], "depi")
+
+        def change(rg, version, res):
+            return depi_pb2.BranchResourceGroupChange(resourceGroup=depi_pb2.ResourceGroupChange(
+                toolId="git", URL=rg, name=rg, version=version, resources=[depi_pb2.ResourceChange(
+                    URL=res, name=res, id=res, new_URL=res, new_name=res, new_id=res,
+                    changeType=depi_pb2.ChangeType.Modified)]))
+
+        resp = self.depi.UpdateResourceGroups(depi_pb2.UpdateResourceGroupsRequest(
+            sessionId=self.session, changes=[change("resourcegroup1", "000001", "resource1"),
+                                             change("resourcegroup2", "123457", "resource4")]), None)
+        self.assertTrue(resp.ok, resp.msg)
+
+        # one update for the whole batch
+        self.assertEqual(1, subscriber.qsize())
+        update = subscriber.get()
+        dirty = [(u.markLinkDirty.fromRes.URL, u.markLinkDirty.toRes.URL) for u in update.updates
+                 if u.updateType == depi_pb2.UpdateType.MarkLinkDirty]
+        self.assertEqual(sorted([("resource1", "resource2"), ("resource4", "resource5")]), sorted(dirty))
+        self.depi.hub.unsubscribe(subscriber)
+
+        branch = self.depi.db.getBranch("main")
+        self.assertEqual("000001", branch.getResourceGroupVersion("git", "resourcegroup1"))
+        self.assertEqual("123457", branch.getResourceGroupVersion("git", "resourcegroup2"))
+
+    def test_update_resource_groups_rolled_back(self):
+        self.login()
+        self.make_data_model()
+        subscriber = self.depi.hub.subscribe(self.depi.sessions[self.session], "depi")
+
+        def change(version, branch=""):
+            return depi_pb2.BranchResourceGroupChange(updateBranch=branch, resourceGroup=depi_pb2.ResourceGroupChange(
+                toolId="git", URL="resourcegroup1", name="resourcegroup1", version=version, resources=[]))
+
+        main = self.depi.db.getBranch("main")
+        originalVersion = main.getResourceGroupVersion("git", "resourcegroup1")
+        resp = self.depi.UpdateResourceGroups(depi_pb2.UpdateResourceGroupsRequest(
+            sessionId=self.session, changes=[change("5"), change("6", "nosuchbranch")]), None)
+        self.assertFalse(resp.ok)
+        self.assertEqual(originalVersion, main.getResourceGroupVersion("git", "resourcegroup1"))
+
+        # main is saved first, the other branch fails to save and main is put back
+        self.depi.db.createBranch("other", "main")
+        other = self.depi.db.getBranch("other")
+
+        def failSave():
+            raise RuntimeError("disk full")
+        other.saveBranchState = failSave
+        resp = self.depi.UpdateResourceGroups(depi_pb2.UpdateResourceGroupsRequest(
+            sessionId=self.session, changes=[change("5"), change("6", "other")]), None)
+        self.assertFalse(resp.ok)
+        self.assertEqual(originalVersion, self.depi.db.getBranch("main").getResourceGroupVersion("git", "resourcegroup1"))
+        self.assertEqual(0, subscriber.qsize())
+        self.assertEqual(0, self.depi.hub.deferred.depth)
+        self.depi.hub.unsubscribe(subscriber)
+
+    def test_dirty_summary(self):
+        self.login()
+        self.make_data_model()
+        response = self.depi.GetDirtySummary(depi_pb2.GetDirtySummaryRequest(sessionId=self.session), None)
+        self.assertTrue(response.ok, response.msg)
+        self.assertEqual(0, len(response.counts))
+
+        session = self.depi.sessions[self.session]
+        session.watchDirtySummary = True
+        subscriber = self.depi.hub.subscribe(session, "depi")
+        resp = self.depi.UpdateResourceGroup(depi_pb2.UpdateResourceGroupRequest(
+            sessionId=self.session, resourceGroup=depi_pb2.ResourceGroupChange(
+                toolId="git", URL="resourcegroup1", name="resourcegroup1", version="000001",
+                resources=[depi_pb2.ResourceChange(URL="resource1", name="resource1", id="resource1",
+                                                   new_URL="resource1", new_name="resource1", new_id="resource1",
+                                                   changeType=depi_pb2.ChangeType.Modified)])), None)
+        self.assertTrue(resp.ok, resp.msg)
+
+        response = self.depi.GetDirtySummary(depi_pb2.GetDirtySummaryRequest(sessionId=self.session), None)
+        counts = {(c.toolId, c.URL): (c.dirty, c.inferredDirty, c.deletedPending) for c in response.counts}
+        self.assertEqual({("git", "resourcegroup1"): (1, 1, 0), ("git", "resourcegroup2"): (0, 2, 0)}, counts)
+
+        pushed = [u.dirtyCount for update in [subscriber.get() for _ in range(subscriber.qsize())]
+                  for u in update.updates if u.updateType == depi_pb2.UpdateType.DirtyCountChanged]
+        self.assertEqual(counts, {(c.toolId, c.URL): (c.dirty, c.inferredDirty, c.deletedPending) for c in pushed})
+        self.depi.hub.unsubscribe(subscriber)
+
+        self.assertTrue(self.depi.GetDirtySummary(depi_pb2.GetDirtySummaryRequest(
+            sessionId=self.session, ifNoneMatch=response.version), None).notModified)
+
+    def test_dirty_summary_failure(self):
+        self.login()
+        self.make_data_model()
+        session = self.depi.sessions[self.session]
+        session.watchDirtySummary = True
+        subscriber = self.depi.hub.subscribe(session, "depi")
+        branch = self.depi.db.getBranch("main")
+
+        def fail():
+            raise RuntimeError("dirty summary query failed")
+
+        branch.getDirtySummary = fail
+        try:
+            # a failed summary leaves the branch unlocked and the updates delivered
+            for _ in range(2):
+                resp = self.depi.MarkLinksClean(depi_pb2.MarkLinksCleanRequest(sessionId=self.session, links=[]), None)
+                self.assertTrue(resp.ok, resp.msg)
+            self.assertFalse(self.depi.branchLocks.getStats()["main"]["writer"])
+            self.assertEqual(0, self.depi.hub.deferred.depth)
+        finally:
+            del branch.getDirtySummary
+            self.depi.hub.unsubscribe(subscriber)
+
+    def test_bulk_import(self):
+        self.login()
+        self.make_data_model()
+        branch = self.depi.db.getBranch("main")
+
+        def res(url):
+            return depi_pb2.Resource(toolId="git", resourceGroupName="importrg", resourceGroupURL="importrg",
+                                     resourceGroupVersion="1", name=url, id=url, URL=url)
+
+        def ref(url):
+            return depi_pb2.ResourceRef(toolId="git", resourceGroupURL="importrg", URL=url)
+
+        requests = [depi_pb2.BulkImportRequest(sessionId=self.session, resources=[res("/a"), res("/b")]),
+                    depi_pb2.BulkImportRequest(resources=[res("/c")],
+                                               links=[depi_pb2.ResourceLinkRef(fromRes=ref("/a"), toRes=ref("/b")),
+                                                      depi_pb2.ResourceLinkRef(fromRes=ref("/b"), toRes=ref("/c"))])]
+        audited = []
+        self.depi.write_audit_log_entry = lambda user, operation, data: audited.append((operation, data))
+        progress = list(self.depi.BulkImport(iter(requests), None))
+        self.assertTrue(all([p.ok for p in progress]), progress[-1].msg)
+        self.assertTrue(progress[-1].done)
+        self.assertEqual((3, 2), (progress[-1].resourcesApplied, progress[-1].linksApplied))
+        self.assertEqual(6, len(branch.getAllLinks()))
+        self.assertEqual(["AddResource"] * 3 + ["LinkResources"] * 2, [op for op, data in audited])
+        self.assertEqual("toolId=git;rgURL=importrg;URL=/a", audited[0][1])
+
+        # a link to a resource that doesn't exist fails the whole import
+        version = branch.getVersion()
+        requests = [depi_pb2.BulkImportRequest(sessionId=self.session, resources=[res("/d")],
+                                               links=[depi_pb2.ResourceLinkRef(fromRes=ref("/d"), toRes=ref("/x"))])]
+        progress = list(self.depi.BulkImport(iter(requests), None))
+        self.assertFalse(progress[-1].ok)
+        self.assertEqual(version, branch.getVersion())
+        self.assertIsNone(branch.getResource(ResourceRef(toolId="git", resourceGroupURL="importrg", url="/d")))
+        self.assertIsNotNone(branch.getResource(ResourceRef(toolId="git", resourceGroupURL="importrg", url="/c")))
+
+    def test_save_blackboard_stream(self):
+        self.login()
+        self.make_data_model()
+        branch = self.depi.db.getBranch("main")
+        depi_server.config.serverConfig["save_chunk_size"] = 2
+        try:
+            resources = [depi_pb2.Resource(toolId="git", resourceGroupName="saverg", resourceGroupURL="saverg",
+                                           resourceGroupVersion="1", name=url, id=url, URL=url)
+                         for url in ["/a", "/b", "/c"]]
+            self.depi.AddResourcesToBlackboard(depi_pb2.AddResourcesToBlackboardRequest(
+                sessionId=self.session, resources=resources), None)
+            refs = [depi_pb2.ResourceRef(toolId="git", resourceGroupURL="saverg", URL=url) for url in ["/a", "/b", "/c"]]
+            self.depi.LinkBlackboardResources(depi_pb2.LinkBlackboardResourcesRequest(
+                sessionId=self.session, links=[depi_pb2.ResourceLinkRef(fromRes=refs[0], toRes=refs[1]),
+                                               depi_pb2.ResourceLinkRef(fromRes=refs[1], toRes=refs[2])]), None)
+
+            subscriber = self.depi.hub.subscribe(self.depi.sessions[self.session], "depi")
+            progress = list(self.depi.SaveBlackboardStream(
+                depi_pb2.SaveBlackboardRequest(sessionId=self.session), None))
+            self.assertTrue(all([p.ok for p in progress]), progress[-1].msg)
+            self.assertEqual((3, 2), (progress[0].resourcesTotal, progress[0].linksTotal))
+            self.assertEqual([(2, 0), (3, 0), (3, 2), (3, 2)],
+                             [(p.resourcesSaved, p.linksSaved) for p in progress[1:]])
+            self.assertTrue(progress[-1].done)
+
+            # five updates go out in messages of at most two
+            messages = [subscriber.get() for _ in range(subscriber.qsize())]
+            self.assertEqual([2, 2, 1], [len(m.updates) for m in messages])
+            self.depi.hub.unsubscribe(subscriber)
+            self.assertIsNotNone(branch.getResource(ResourceRef(toolId="git", resourceGroupURL="saverg", url="/c")))
+            self.assertEqual(0, len(self.depi.blackboards[self.depi.sessions[self.session].user.name].changedLinks))
+        finally:
+            del depi_server.config.serverConfig["save_chunk_size"]
+
+    def test_save_blackboard_normalizes_copies(self):
+        self.login()
+        self.make_data_model()
+        branch = self.depi.db.getBranch("main")
+        resources = [depi_pb2.Resource(toolId="git", resourceGroupName="saverg", resourceGroupURL="saverg",
+                                       resourceGroupVersion="1", name=url, id=url, URL=url) for url in ["a", "b"]]
+        self.depi.AddResourcesToBlackboard(depi_pb2.AddResourcesToBlackboardRequest(
+            sessionId=self.session, resources=resources), None)
+        refs = [depi_pb2.ResourceRef(toolId="git", resourceGroupURL="saverg", URL=url) for url in ["a", "b"]]
+        self.depi.LinkBlackboardResources(depi_pb2.LinkBlackboardResourcesRequest(
+            sessionId=self.session, links=[depi_pb2.ResourceLinkRef(fromRes=refs[0], toRes=refs[1])]), None)
+        blackboard = self.depi.blackboards[self.depi.sessions[self.session].user.name]
+
+        # a failed save leaves the blackboard as it was, keyed by the URLs it was given
+        saveBranchState = branch.saveBranchState
+
+        def failSave():
+            raise RuntimeError("disk full")
+        branch.saveBranchState = failSave
+        progress = list(self.depi.SaveBlackboardStream(depi_pb2.SaveBlackboardRequest(sessionId=self.session), None))
+        self.assertFalse(progress[-1].ok)
+        branch.saveBranchState = saveBranchState
+        self.assertEqual([("a", "a"), ("b", "b")],
+                         sorted([(URL, res.URL) for rg in blackboard.resources["git"].values()
+                                 for URL, res in rg.resources.items()]))
+        self.assertTrue(all([link in blackboard.changedLinks for link in list(blackboard.changedLinks)]))
+        self.assertEqual(["a"], [link.fromRes.URL for link in blackboard.linksOf("git", "saverg", "a")])
+
+        progress = list(self.depi.SaveBlackboardStream(depi_pb2.SaveBlackboardRequest(sessionId=self.session), None))
+        self.assertTrue(progress[-1].ok, progress[-1].msg)
+        self.assertIsNotNone(branch.getResource(ResourceRef(toolId="git", resourceGroupURL="saverg", url="/a")))
+        self.assertEqual(1, len(branch.getLinksWithResource(
+            ResourceRef(toolId="git", resourceGroupURL="saverg", url="/a"), False)))
+
+    def test_blackboard_resources_stream(self):
+        self.login()
+        self.make_data_model()
+        depi_server.config.serverConfig["blackboard_stream_chunk_size"] = 2
+        try:
+            resources = [depi_pb2.Resource(toolId=toolId, resourceGroupName=rgURL, resourceGroupURL=rgURL,
+                                           resourceGroupVersion="1", name=url, id=url, URL=url)
+                         for toolId, rgURL, url in [("git", "rga", "/a"), ("git", "rga", "/b"), ("git", "rgb", "/c"),
+                                                    ("webgme", "rgc", "/d")]]
+            self.depi.AddResourcesToBlackboard(depi_pb2.AddResourcesToBlackboardRequest(
+                sessionId=self.session, resources=resources), None)
+            refs = [depi_pb2.ResourceRef(toolId=r.toolId, resourceGroupURL=r.resourceGroupURL, URL=r.URL)
+                    for r in resources]
+            self.depi.LinkBlackboardResources(depi_pb2.LinkBlackboardResourcesRequest(
+                sessionId=self.session, links=[depi_pb2.ResourceLinkRef(fromRes=refs[0], toRes=refs[3]),
+                                               depi_pb2.ResourceLinkRef(fromRes=refs[2], toRes=refs[3])]), None)
+
+            responses = list(self.depi.GetBlackboardResourcesAsStream(
+                depi_pb2.GetBlackboardResourcesRequest(sessionId=self.session), None))
+            self.assertTrue(all([r.ok for r in responses]))
+            self.assertEqual([2, 2, 0], [len(r.resources) for r in responses])
+            self.assertEqual(2, sum([len(r.links) for r in responses]))
+
+            responses = list(self.depi.GetBlackboardResourcesAsStream(
+                depi_pb2.GetBlackboardResourcesRequest(sessionId=self.session, toolId="git",
+                                                       resourceGroupURL="rga"), None))
+            self.assertEqual({"/a", "/b", "/d"}, set([res.URL for r in responses for res in r.resources]))
+            self.assertEqual([("/a", "/d")], [(lk.fromRes.URL, lk.toRes.URL) for r in responses for lk in r.links])
+
+            response = self.depi.GetBlackboardResources(depi_pb2.GetBlackboardResourcesRequest(
+                sessionId=self.session, toolId="webgme"), None)
+            self.assertEqual({"/a", "/c", "/d"}, set([res.URL for res in response.resources]))
+            self.assertEqual(2, len(response.links))
+        finally:
+            del depi_server.config.serverConfig["blackboard_stream_chunk_size"]
+
     def test_add_in_folder(self):
         self.login()
         self.make_data_model()
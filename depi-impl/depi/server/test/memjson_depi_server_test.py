@@ -3,6 +3,7 @@ import unittest
 import shutil
 import sys
 import json
+import tempfile
 
 sys.path.append("src")
 sys.path.append("test")
@@ -50,6 +51,9 @@ class TestDepiServerMemJson(depi_server_test.TestDepiServer):
 
     def setUp(self):
         json_config = json.loads(TestDepiServerMemJson.json_config_str)
+        # the audit log of a test run goes to a temporary directory, not into the source tree
+        self.auditDir = tempfile.mkdtemp(prefix="depi_audit_")
+        json_config["audit"]["directory"] = self.auditDir
         depi_server.config = depi_server.Config(json_config)
         state_dir = depi_server.config.dbConfig["stateDir"]
         if os.path.exists(state_dir):
@@ -60,10 +64,18 @@ class TestDepiServerMemJson(depi_server_test.TestDepiServer):
         main_branch = self.depi.db.getBranch("main")
         main_branch.saveBranchState()
 
+    def tearDown(self):
+        if self.depi.auditLog is not None:
+            self.depi.auditLog.close()
+        shutil.rmtree(self.auditDir, ignore_errors=True)
+
     def reSetUp(self):
         json_config = json.loads(TestDepiServerMemJson.json_config_str)
+        json_config["audit"]["directory"] = self.auditDir
         depi_server.config = depi_server.Config(json_config)
         state_dir = depi_server.config.dbConfig["stateDir"]
+        if self.depi.auditLog is not None:
+            self.depi.auditLog.close()
         self.depi: depi_server.DepiServer = depi_server.DepiServer()
 
         self.login()
@@ -0,0 +1,63 @@
+import unittest
+import sys
+import urllib.request
+
+sys.path.append("src")
+
+from depi_server.metrics.registry import MetricsRegistry, Counter, Gauge, Histogram
+from depi_server.metrics.metrics_http import start_metrics_server
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_render(self):
+        requests = Counter("test_requests_total", "Requests", ["method", "code"], registry=self.registry)
+        requests.labels("Login", "OK").inc()
+        requests.labels("Login", "OK").inc()
+        requests.labels("Get\"Links", "ERROR").inc()
+        sessions = Gauge("test_sessions", "Sessions", registry=self.registry)
+        sessions.set(3)
+        self.registry.registerCollector(lambda: [("test_watchers", "gauge", "Watchers",
+                                                  [({"type": "depi"}, 2)])])
+
+        text = self.registry.render()
+        self.assertIn("# TYPE test_requests_total counter", text)
+        self.assertIn("test_requests_total{method=\"Login\",code=\"OK\"} 2", text)
+        self.assertIn("test_requests_total{method=\"Get\\\"Links\",code=\"ERROR\"} 1", text)
+        self.assertIn("test_sessions 3", text)
+        self.assertIn("test_watchers{type=\"depi\"} 2", text)
+
+    def test_histogram(self):
+        hist = Histogram("test_seconds", "Latency", buckets=(0.1, 1.0), registry=self.registry)
+        hist.observe(0.05)
+        hist.observe(0.5)
+        hist.observe(5)
+
+        text = self.registry.render()
+        self.assertIn("test_seconds_bucket{le=\"0.1\"} 1", text)
+        self.assertIn("test_seconds_bucket{le=\"1\"} 2", text)
+        self.assertIn("test_seconds_bucket{le=\"+Inf\"} 3", text)
+        self.assertIn("test_seconds_count 3", text)
+        self.assertIn("test_seconds_sum 5.55", text)
+
+    def test_duplicate_name(self):
+        Counter("test_dup_total", "Dup", registry=self.registry)
+        with self.assertRaises(ValueError):
+            Counter("test_dup_total", "Dup", registry=self.registry)
+
+    def test_http(self):
+        Counter("test_http_total", "Http", registry=self.registry).inc()
+        server = start_metrics_server("localhost", 0, self.registry)
+        try:
+            with urllib.request.urlopen("http://localhost:{}/metrics".format(server.server_address[1])) as resp:
+                self.assertTrue(resp.headers["Content-Type"].startswith("text/plain"))
+                self.assertIn("test_http_total 1", resp.read().decode("utf-8"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
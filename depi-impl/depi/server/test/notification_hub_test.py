@@ -0,0 +1,205 @@
+import unittest
+import sys
+import threading
+
+sys.path.append("src")
+
+import depi_pb2
+from depi_server.depi_server import Session, User
+from depi_server.notification_hub import NotificationHub, OVERFLOW_COALESCE, OVERFLOW_DROP_OLDEST, \
+    OVERFLOW_DISCONNECT, collapse_updates
+
+
+class Branch:
+    def __init__(self, name):
+        self.name = name
+
+
+def depi_update(n):
+    return depi_pb2.DepiUpdate(ok=True, msg="", updates=[
+        depi_pb2.Update(updateType=depi_pb2.UpdateType.AddResource, resource=depi_pb2.Resource(URL="/r{}".format(n)))])
+
+
+def link_update(updateType, n):
+    link = depi_pb2.ResourceLink(fromRes=depi_pb2.Resource(toolId="git", resourceGroupURL="/rg", URL="/a"),
+                                 toRes=depi_pb2.Resource(toolId="git", resourceGroupURL="/rg", URL="/b{}".format(n)))
+    if updateType == depi_pb2.UpdateType.MarkLinkClean:
+        return depi_pb2.Update(updateType=updateType, markLinkClean=link)
+    return depi_pb2.Update(updateType=updateType, link=link)
+
+
+def drain(subscriber):
+    messages = []
+    while subscriber.available():
+        messages.append(subscriber.get())
+    return messages
+
+
+class TestNotificationHub(unittest.TestCase):
+    def make_session(self, sessionId, branchName="main", userName="mark"):
+        return Session(sessionId, "git", User(userName, ""), Branch(branchName))
+
+    def test_branch_index(self):
+        hub = NotificationHub()
+        main = hub.subscribe(self.make_session("s1"), "depi")
+        other = hub.subscribe(self.make_session("s2", "other"), "depi")
+
+        hub.publishDepi("main", depi_update(1))
+        hub.publishDepi(None, depi_update(2))
+        self.assertEqual(2, len(drain(main)))
+        self.assertEqual(1, len(drain(other)))
+
+        other.session.branch = Branch("main")
+        hub.moveSession(other.session)
+        hub.publishDepi("main", depi_update(3))
+        self.assertEqual(1, len(drain(other)))
+        self.assertEqual(2, hub.numSubscribers("depi", "main"))
+
+        hub.unsubscribe(main)
+        self.assertFalse(main.session.watchingDepi)
+        self.assertEqual(1, hub.numSubscribers("depi"))
+
+    def test_drop_oldest(self):
+        hub = NotificationHub(3, OVERFLOW_DROP_OLDEST)
+        subscriber = hub.subscribe(self.make_session("s1"), "depi")
+        for i in range(5):
+            hub.publishDepi("main", depi_update(i))
+
+        messages = drain(subscriber)
+        self.assertTrue(messages[0].resync)
+        self.assertEqual(["/r2", "/r3", "/r4"], [m.updates[0].resource.URL for m in messages[1:]])
+        self.assertEqual(2, subscriber.getStats()["dropped"])
+
+    def test_coalesce(self):
+        hub = NotificationHub(2, OVERFLOW_COALESCE)
+        subscriber = hub.subscribe(self.make_session("s1"), "depi")
+        first = depi_update(0)
+        hub.publishDepi("main", first)
+        for i in range(1, 5):
+            hub.publishDepi("main", depi_update(i))
+
+        messages = drain(subscriber)
+        self.assertEqual(2, len(messages))
+        self.assertEqual(["/r1", "/r2", "/r3", "/r4"], [u.resource.URL for u in messages[1].updates])
+        self.assertEqual(1, len(first.updates))
+
+    def test_disconnect(self):
+        hub = NotificationHub(2, OVERFLOW_DISCONNECT)
+        subscriber = hub.subscribe(self.make_session("s1"), "depi")
+        for i in range(3):
+            hub.publishDepi("main", depi_update(i))
+        hub.publishDepi("main", depi_update(4))
+
+        messages = list(subscriber)
+        self.assertEqual(1, len(messages))
+        self.assertFalse(messages[0].ok)
+
+    def test_deferred_publish(self):
+        hub = NotificationHub()
+        subscriber = hub.subscribe(self.make_session("s1"), "depi")
+
+        hub.deferPublishing()
+        hub.publishDepi("main", depi_update(1))
+        self.assertFalse(subscriber.available())
+
+        # a handler that published later has to wait for the earlier one to be delivered
+        later = threading.Thread(target=hub.publishDepi, args=("main", depi_update(2)))
+        later.start()
+        later.join(0.2)
+        self.assertFalse(subscriber.available())
+
+        hub.publishDeferred()
+        later.join()
+        self.assertEqual(["/r1", "/r2"], [m.updates[0].resource.URL for m in drain(subscriber)])
+
+    def test_hold(self):
+        hub = NotificationHub()
+        session = self.make_session("s1")
+        hub.hold(session, "blackboard")
+        self.assertFalse(session.watchingBlackboard)
+        hub.publishBlackboard(depi_pb2.BlackboardUpdate(ok=True, msg=""), "mark")
+
+        subscriber = hub.subscribe(session, "blackboard")
+        self.assertTrue(session.watchingBlackboard)
+        self.assertEqual(1, len(drain(subscriber)))
+
+    def test_collapse_updates(self):
+        updates = [link_update(depi_pb2.UpdateType.AddLink, 1),
+                   link_update(depi_pb2.UpdateType.AddLink, 2),
+                   link_update(depi_pb2.UpdateType.MarkLinkClean, 1),
+                   link_update(depi_pb2.UpdateType.RemoveLink, 1),
+                   link_update(depi_pb2.UpdateType.RemoveLink, 3),
+                   link_update(depi_pb2.UpdateType.AddLink, 3)]
+        collapsed = collapse_updates(updates)
+        self.assertEqual([updates[1], updates[3], updates[4], updates[5]], collapsed)
+
+    def test_window(self):
+        hub = NotificationHub()
+        subscriber = hub.subscribe(self.make_session("s1"), "depi", 0.2)
+        hub.publishDepi("main", depi_update(1))
+        hub.publishDepi("main", depi_pb2.DepiUpdate(ok=True, msg="", updates=[
+            link_update(depi_pb2.UpdateType.AddLink, 1)]))
+        hub.publishDepi("main", depi_pb2.DepiUpdate(ok=True, msg="", updates=[
+            link_update(depi_pb2.UpdateType.RemoveLink, 1)]))
+        self.assertFalse(subscriber.available())
+
+        message = subscriber.get()
+        self.assertEqual([depi_pb2.UpdateType.AddResource, depi_pb2.UpdateType.RemoveLink],
+                         [u.updateType for u in message.updates])
+        self.assertFalse(subscriber.available())
+
+    def test_max_batch(self):
+        hub = NotificationHub()
+        subscriber = hub.subscribe(self.make_session("s1"), "depi", 60.0, 2)
+        hub.publishDepi("main", depi_update(1))
+        self.assertFalse(subscriber.available())
+        hub.publishDepi("main", depi_update(2))
+        hub.publishDepi("main", depi_update(3))
+
+        self.assertEqual(["/r1", "/r2"], [u.resource.URL for u in subscriber.get().updates])
+        self.assertFalse(subscriber.available())
+
+    def test_resume(self):
+        hub = NotificationHub(replaySize=3)
+        session = self.make_session("s1")
+        subscriber = hub.subscribe(session, "depi")
+        for i in range(4):
+            hub.publishDepi("main", depi_update(i))
+        sequences = [u.sequence for u in drain(subscriber)]
+        self.assertEqual(list(range(sequences[0], sequences[0] + 4)), sequences)
+        hub.unsubscribe(subscriber)
+
+        hub.publishDepi("main", depi_update(4))
+        subscriber = hub.subscribe(session, "depi", resumeFrom=sequences[1])
+        hub.publishDepi("main", depi_update(5))
+        self.assertEqual(["/r2", "/r3", "/r4", "/r5"], [u.updates[0].resource.URL for u in drain(subscriber)])
+
+        # /r1 is no longer kept
+        subscriber = hub.subscribe(session, "depi", resumeFrom=sequences[0])
+        self.assertTrue(drain(subscriber)[0].resync)
+
+        # from before the server was started
+        subscriber = hub.subscribe(session, "depi", resumeFrom=sequences[0] - 100)
+        self.assertTrue(drain(subscriber)[0].resync)
+
+    def test_filtered_updates_are_not_replayed(self):
+        hub = NotificationHub()
+        watching = self.make_session("s1")
+        other = self.make_session("s2", userName="gabor")
+        watcher = hub.subscribe(watching, "depi")
+        subscriber = hub.subscribe(other, "depi")
+        hub.publishDepi("main", depi_update(1))
+        hub.publish("depi", "main", depi_update(2), lambda session: session is watching)
+        hub.publishDepi("main", depi_update(3))
+        self.assertEqual([0], [u.sequence for u in drain(watcher) if u.updates[0].resource.URL == "/r2"])
+
+        # the watcher that didn't ask for the filtered update sees no gap and doesn't get it on resume
+        sequences = [u.sequence for u in drain(subscriber)]
+        self.assertEqual([sequences[0], sequences[0] + 1], sequences)
+        hub.unsubscribe(subscriber)
+        subscriber = hub.subscribe(other, "depi", resumeFrom=sequences[0])
+        self.assertEqual(["/r3"], [u.updates[0].resource.URL for u in drain(subscriber)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import logging
+import unittest
+import sys
+from concurrent import futures
+
+sys.path.append("src")
+
+import grpc
+import depi_pb2
+import depi_pb2_grpc
+from depi_server.interceptors.rpc_trace import RpcTraceInterceptor, TRACE_LOGGER_NAME, format_message
+
+
+class EchoServicer(depi_pb2_grpc.DepiServicer):
+    def Login(self, request, context):
+        return depi_pb2.LoginResponse(ok=True, msg="x" * 500, sessionId="session1")
+
+    def GetResourcesAsStream(self, request, context):
+        for i in range(5):
+            yield depi_pb2.GetResourcesAsStreamResponse(ok=True, msg="",
+                                                        resource=depi_pb2.Resource(URL="/r{}".format(i)))
+
+
+class TestRpcTrace(unittest.TestCase):
+    def start_server(self, traceConfig):
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4),
+                                  interceptors=[RpcTraceInterceptor(traceConfig)])
+        depi_pb2_grpc.add_DepiServicer_to_server(EchoServicer(), self.server)
+        port = self.server.add_insecure_port("localhost:0")
+        self.server.start()
+        self.channel = grpc.insecure_channel("localhost:{}".format(port))
+        return depi_pb2_grpc.DepiStub(self.channel)
+
+    def tearDown(self):
+        if hasattr(self, "server"):
+            self.channel.close()
+            self.server.stop(None)
+        logging.getLogger(TRACE_LOGGER_NAME).setLevel(logging.NOTSET)
+
+    def test_jsonl_records(self):
+        logging.getLogger(TRACE_LOGGER_NAME).setLevel(logging.DEBUG)
+        stub = self.start_server({"format": "jsonl", "max_message_chars": 100, "max_stream_messages": 2})
+        with self.assertLogs(TRACE_LOGGER_NAME, level="DEBUG") as logs:
+            stub.Login(depi_pb2.LoginRequest(user="mark", password="secret", toolId="git"))
+            list(stub.GetResourcesAsStream(depi_pb2.GetResourcesRequest(sessionId="session1")))
+        records = [json.loads(line.split(":", 2)[2]) for line in logs.output]
+
+        login = [r for r in records if r["method"] == "Login"]
+        self.assertEqual(["request", "response", "end"], [r["event"] for r in login])
+        self.assertNotIn("secret", login[0]["message"])
+        self.assertTrue(login[1]["truncated"])
+        self.assertEqual(100, len(login[1]["message"]))
+
+        stream = [r for r in records if r["method"] == "GetResourcesAsStream"]
+        self.assertEqual(["request", "response", "response", "end"], [r["event"] for r in stream])
+        self.assertEqual("session1", stream[-1]["session"])
+        self.assertEqual(5, stream[-1]["responses"])
+
+    def test_disabled_level_and_sampling(self):
+        stub = self.start_server({"methods": {"Login": 0.0}})
+        with self.assertLogs(TRACE_LOGGER_NAME, level="INFO") as logs:
+            logging.getLogger(TRACE_LOGGER_NAME).info("marker")
+            list(stub.GetResourcesAsStream(depi_pb2.GetResourcesRequest(sessionId="session1")))
+        self.assertEqual(1, len(logs.output))
+
+        with self.assertLogs(TRACE_LOGGER_NAME, level="DEBUG") as logs:
+            logging.getLogger(TRACE_LOGGER_NAME).info("marker")
+            stub.Login(depi_pb2.LoginRequest(user="mark", password="secret", toolId="git"))
+        self.assertEqual(1, len(logs.output))
+
+    def test_format_message_truncates(self):
+        msg = depi_pb2.LoginResponse(ok=True, msg="y" * 50, sessionId="abc")
+        text, truncated = format_message(msg, 10)
+        self.assertEqual(10, len(text))
+        self.assertTrue(truncated)
+        text, truncated = format_message(msg, 1000)
+        self.assertFalse(truncated)
+        self.assertIn("abc", text)
@@ -0,0 +1,47 @@
+import copy
+import unittest
+import sys
+
+sys.path.append("src")
+
+from depi_server.bench import graph_gen, storage_bench, model_bench, compare
+from depi_server.depi_server import Config
+
+
+class TestStorageBench(unittest.TestCase):
+    def test_generators_are_deterministic(self):
+        for shape in graph_gen.GRAPH_SHAPES:
+            first = graph_gen.generate(shape, 200, seed=5)
+            second = graph_gen.generate(shape, 200, seed=5)
+            self.assertEqual(first.describe(), second.describe())
+            self.assertEqual([lk.toLink() for lk in first.links], [lk.toLink() for lk in second.links])
+            self.assertTrue(len(first.links) > 0)
+
+    def test_unknown_shape(self):
+        with self.assertRaises(ValueError):
+            graph_gen.generate("ring", 10)
+
+    def test_memjson_run_and_compare(self):
+        config = Config(copy.deepcopy(storage_bench.DEFAULT_CONFIG))
+        result = storage_bench.run_benchmarks(config, ["memjson"], ["chain", "dirs"], [50],
+                                              storage_bench.OPERATIONS, 1, 1)
+        self.assertEqual(2 * len(storage_bench.OPERATIONS), len(result["results"]))
+        for r in result["results"]:
+            if r["operation"] == "getDirtyLinks":
+                self.assertTrue(r["items"] > 0)
+
+        baseline = {compare.result_key(r): r for r in result["results"]}
+        current = copy.deepcopy(baseline)
+        key = list(current.keys())[0]
+        current[key]["median"] = baseline[key]["median"] * 2 + 1.0
+        rows, regressions = compare.compare_results(baseline, current, 0.1)
+        self.assertEqual(len(baseline), len(rows))
+        self.assertEqual([key], [r["key"] for r in regressions])
+
+    def test_model_run(self):
+        config = Config(copy.deepcopy(storage_bench.DEFAULT_CONFIG))
+        result = model_bench.run_benchmarks(config, ["dag"], [100], 1, 1)
+        self.assertEqual(model_bench.OPERATIONS, [r["operation"] for r in result["results"]])
+        load = result["results"][0]
+        self.assertEqual(len(graph_gen.generate("dag", 100, seed=1).links), load["items"])
+        self.assertTrue(0 < load["modelBytes"] < load["bytes"])